@@ -0,0 +1,71 @@
+# Ack counting check for JobStreamer against the virtual Protomat.
+# A first job leaves echo mode on, then a long jog is sent on its own and
+# the next job starts while the jog is still moving, so its "C\r" is still
+# owed. The job must only count acks for its own commands: when start_job
+# returns, the machine has to have executed every command of the job, and
+# the journal must not claim more than the machine did.
+#
+#   python -m benchmarks.barrier_bench [--speedup 2] [--jog 10000]
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from journal import read_journal
+from protomat import ProtomatSession
+from virtual_protomat import VirtualProtomat
+
+JOB = ["PR0,2500;"] * 3
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Echo barrier check against the virtual Protomat")
+    parser.add_argument("--speedup", type=float, default=2.0)
+    parser.add_argument("--jog", type=int, default=10000, help="length of the jog before the job (1/100 mm)")
+    args = parser.parse_args()
+    machine = VirtualProtomat(speedup=args.speedup)
+    path = machine.open()
+    threading.Thread(target=machine.run, daemon=True).start()
+    journal = os.path.join(tempfile.mkdtemp(), "job.journal")
+    log = []
+    session = ProtomatSession(on_log=log.append)
+    session.journal_path = journal
+    session.connect(path)
+    ok = True
+    try:
+        session.wait_position(timeout=2.0)
+        session.start_job(["PR100,0;"], wait=True)  # echo mode stays on after a job
+        session.send_command(f"PR{args.jog},0;")
+        time.sleep(0.05)  # the jog is moving, its ack is still owed
+        t0 = time.monotonic()
+        stats = session.start_job(JOB, wait=True)
+        returned = time.monotonic()
+        position = list(machine.position)
+        late = max(0.0, machine.busy_until - returned)
+        expected = [100 + args.jog, 2500 * len(JOB)]
+        ok = bool(stats) and position[:2] == expected and late == 0.0
+        print(f"job returned after {returned - t0:.2f} s at X={position[0]} Y={position[1]} "
+              f"(expected X={expected[0]} Y={expected[1]}), machine busy {late:.2f} s longer")
+        # Journal of an interrupted copy of the job: acks must not run ahead of the machine
+        session.send_command(f"PR{args.jog},0;")
+        time.sleep(0.05)
+        before = machine.stats["commands"]
+        session.start_job(["PR0,500;", "PR0,-500;"] * 20)
+        time.sleep(1.5)  # the jog and part of the job
+        session.stop_job()
+        time.sleep(0.1)
+        point = read_journal(journal)
+        done = machine.stats["commands"] - before - 3  # jog, !CT1; and !ON0; are not job commands
+        print(f"interrupted job: journal {point.offset if point else 0} commands, machine executed {done}")
+        ok = ok and point is not None and point.offset <= done
+    finally:
+        session.disconnect()
+        machine.stop()
+        machine.close()
+    print("OK" if ok else "MISMATCH")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
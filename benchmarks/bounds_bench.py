@@ -0,0 +1,74 @@
+# Correctness and speed harness for bounds.check_bounds.
+# Compares the vectorized head path with position_model.PositionModel
+# command by command on random flows (PR, PA, IN, CI, fractions, lower case,
+# commands without arguments), then times a pre-flight check of one large
+# flow that leaves the workspace near its end.
+#
+#   python -m benchmarks.bounds_bench [--commands 1000000] [--seed 1]
+import argparse
+import random
+import time
+
+from benchmarks.compiler_bench import random_flow
+from bounds import BoundsError, check_bounds, head_path
+from position_model import PositionModel
+
+
+def odd_commands(rng):
+    return rng.choice([f"pr {rng.randint(-500, 500)}.7, -{rng.randint(0, 50)}.2;", "PR100;", "PR;", "PR,;",
+                       f"ci{rng.randint(1, 300)};", "!TS500;"])
+
+
+def compare(flow, start):
+    x, y, r = head_path(flow, start)
+    model = PositionModel()
+    model.position = [start[0], start[1], 0]
+    for k, cmd in enumerate(flow):
+        model.apply(cmd)
+        if (model.position[0], model.position[1]) != (x[k], y[k]):
+            return f"command {k} ({cmd}): {x[k]:.0f},{y[k]:.0f} instead of {model.position[:2]}"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Workspace pre-flight check harness")
+    parser.add_argument("--flows", type=int, default=500)
+    parser.add_argument("--commands", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    failed = 0
+    for _ in range(args.flows):
+        flow = random_flow(rng, rng.randint(1, 200))
+        for _ in range(rng.randint(0, 5)):
+            flow.insert(rng.randrange(len(flow) + 1), odd_commands(rng))
+        error = compare(flow, (rng.randint(0, 20000), rng.randint(0, 20000)))
+        if error:
+            failed += 1
+            print(f"MISMATCH: {error}")
+    print(f"{args.flows} random flows checked against PositionModel: {'OK' if not failed else f'{failed} FAILED'}")
+
+    # A closed random walk that stays inside, with one stray move near the end
+    flow = []
+    for _ in range(args.commands // 2):
+        dx, dy = rng.randint(-500, 500), rng.randint(-500, 500)
+        flow += [f"PR{dx},{dy};", f"PR{-dx},{-dy};"]
+    bad = len(flow) - 10
+    flow[bad] = "PR-30000,0;"
+    flow[bad + 1] = "PR30000,0;"
+    t0 = time.perf_counter()
+    try:
+        check_bounds(flow, (45000, 22000), (20000, 10000))
+        found = None
+    except BoundsError as e:
+        found = e.index
+    dt = time.perf_counter() - t0
+    ok = found == bad
+    print(f"{len(flow)} commands checked in {dt:.2f} s ({len(flow) / dt / 1e6:.1f} M cmd/s), "
+          f"violation at {found}: {'OK' if ok else f'expected {bad}'}")
+    raise SystemExit(0 if ok and not failed else 1)
+
+
+if __name__ == "__main__":
+    main()
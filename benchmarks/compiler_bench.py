@@ -0,0 +1,74 @@
+# Round-trip and speed harness for compiler.compile_flow.
+# Generates random flows full of redundant state changes and split moves,
+# compiles them (compile_flow verifies position, head path and pen-down
+# geometry) and reports the byte savings. A pen-up dog-leg (around a clamp)
+# must survive compilation unless merge_travel is asked for.
+#
+#   python -m benchmarks.compiler_bench [--flows 2000] [--seed 1]
+import argparse
+import random
+import time
+
+from compiler import CompileError, compile_flow
+
+
+def random_flow(rng, n):
+    cmds = []
+    for _ in range(n):
+        r = rng.random()
+        if r < 0.55:
+            step = rng.choice([(1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (2, -1)])
+            k = rng.choice([0, 50, 100, 250])
+            cmds.append(f"PR{step[0] * k},{step[1] * k};")
+        elif r < 0.7:
+            cmds.append(rng.choice(["PU;", "PD;"]))
+        elif r < 0.8:
+            cmds.append(f"!TS{rng.choice([0, 500])};")
+        elif r < 0.85:
+            cmds.append(f"CI{rng.randint(100, 500)};")
+        elif r < 0.9:
+            cmds.append(f"PA{rng.randint(0, 20000)},{rng.randint(0, 20000)};")
+        elif r < 0.95:
+            cmds.append("!ON0;")
+        else:
+            cmds.append("IN;")
+    return cmds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flow compiler round-trip harness")
+    parser.add_argument("--flows", type=int, default=2000)
+    parser.add_argument("--length", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    flows = [random_flow(rng, rng.randint(1, args.length)) for _ in range(args.flows)]
+    before = after = commands = 0
+    failed = 0
+    t0 = time.perf_counter()
+    for flow in flows:
+        start = rng.choice([None, (rng.randint(0, 20000), rng.randint(0, 20000))])
+        try:
+            result = compile_flow(flow, start=start, absolute=start is not None)
+        except CompileError as e:
+            failed += 1
+            print(f"MISMATCH: {e}")
+            continue
+        before += result.bytes_before
+        after += result.bytes_after
+        commands += len(flow)
+    dt = time.perf_counter() - t0
+    dogleg = ["PU;", "PR5000,0;", "PR2000,0;", "PR0,3000;", "PD;", "PR100,0;", "PU;"]
+    kept = compile_flow(dogleg).commands
+    merged = compile_flow(dogleg, merge_travel=True).commands
+    if kept != ["PU;", "PR7000,0;", "PR0,3000;", "PD;", "PR100,0;", "PU;"] or "PR7000,3000;" not in merged:
+        failed += 1
+        print(f"MISMATCH: dog-leg compiled to {kept}, with merge_travel to {merged}")
+    print(f"{len(flows)} flows, {commands} commands in {dt:.2f} s ({commands / dt:.0f} cmd/s incl. check): "
+          f"{before} -> {after} bytes (-{100 * (before - after) / max(before, 1):.0f}%)  "
+          f"{'OK' if not failed else f'{failed} FAILED'}")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
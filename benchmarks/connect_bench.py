@@ -0,0 +1,54 @@
+# First-move check against the virtual Protomat.
+# The head is parked near the X limit before connecting, so a prediction
+# that starts at X=0 Y=0 would accept moves past the limit. Right after
+# connecting, a jog and a job towards the limit must both be rejected and
+# a jog back must land where expected.
+#
+#   python -m benchmarks.connect_bench [--park 44000 20000] [--jog 2000]
+import argparse
+import threading
+import time
+
+from protomat import JobRejected, ProtomatSession
+from virtual_protomat import VirtualProtomat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="First-move check against the virtual Protomat")
+    parser.add_argument("--park", type=int, nargs=2, metavar=("X", "Y"), default=(44000, 20000),
+                        help="head position before connecting (1/100 mm)")
+    parser.add_argument("--jog", type=int, default=2000, help="jog towards the X limit (1/100 mm)")
+    args = parser.parse_args()
+    machine = VirtualProtomat(speedup=10)
+    machine.position = [args.park[0], args.park[1], 0]
+    path = machine.open()
+    threading.Thread(target=machine.run, daemon=True).start()
+    log = []
+    session = ProtomatSession(on_log=log.append)
+    try:
+        session.connect(path)
+        session.move_relative_checked(args.jog, 0)  # at once, before any explicit query
+        time.sleep(0.5)
+        jog_rejected = machine.position[0] == args.park[0]
+        try:
+            session.start_job([f"PR{args.jog},0;"], wait=True)
+            job_rejected = False
+        except JobRejected:
+            job_rejected = True
+        session.move_relative_checked(-args.jog, 0)
+        time.sleep(0.5)
+        back = machine.position[:2] == [args.park[0] - args.jog, args.park[1]]
+    finally:
+        session.disconnect()
+        machine.stop()
+        machine.close()
+    print(f"jog past the limit {'rejected' if jog_rejected else 'SENT'}, "
+          f"job past the limit {'rejected' if job_rejected else 'SENT'}, "
+          f"jog back to X={machine.position[0]} Y={machine.position[1]}")
+    ok = jog_rejected and job_rejected and back
+    print("OK" if ok else "MISMATCH")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
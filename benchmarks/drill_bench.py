@@ -0,0 +1,90 @@
+# Import-and-plan harness for drill_import.py.
+# Writes an Excellon panel of --boards boards as CAM tools concatenate
+# them: every board selects its tools again, so the raw file changes tools
+# many times. Each board adds random holes for four tools and about 3%
+# repeated hits (exact, or up to 0.01 mm off) after the originals. Then it times reading,
+# travel ordering and command generation, and checks the result:
+#   - each tool appears in one contiguous group (one tool change per tool)
+#   - the duplicates are gone and every other hole is drilled once
+#   - the commands visit exactly those holes
+#
+#   python -m benchmarks.drill_bench [--boards 20] [--holes 1000] [--seed 1]
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from bounds import head_path
+from drill_import import read_drills
+from lmd import phase_commands
+from travel import optimize_phase
+
+TOOLS = {1: 0.6, 2: 0.8, 3: 1.0, 4: 3.0}  # mm
+
+
+def build(path, boards, holes, rng, board=(8000, 6000)):
+    # Returns the expected hits per tool: {tool: set of (x, y)} in machine units
+    expected = {t: set() for t in TOOLS}
+    lines = ["M48", "METRIC,TZ,000.000"] + [f"T{t}C{d:.3f}" for t, d in TOOLS.items()] + ["%"]
+    cols = 5
+    for b in range(boards):
+        origin = np.array([(b % cols) * (board[0] + 500), (b // cols) * (board[1] + 500)])
+        tools = rng.choice(list(TOOLS), holes, p=[0.5, 0.3, 0.15, 0.05])
+        # Holes at least 0.2 mm apart on a 0.05 mm grid, so only the planted repeats are duplicates
+        cells = rng.choice((board[0] // 20) * (board[1] // 20), holes, replace=False)
+        pts = origin + np.column_stack((cells % (board[0] // 20), cells // (board[0] // 20))) * 20 + 5
+        for t in TOOLS:
+            mine = pts[tools == t]
+            expected[t].update(map(tuple, mine.tolist()))
+            repeats = mine[rng.random(len(mine)) < 0.03]
+            repeats = repeats + rng.integers(-1, 2, repeats.shape)
+            rows = np.vstack((mine[rng.permutation(len(mine))], repeats[rng.permutation(len(repeats))]))
+            lines.append(f"T{t}")
+            lines.extend(f"X{x * 10:06d}Y{y * 10:06d}" for x, y in rows.tolist())
+    lines.append("M30")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drill import and planning harness")
+    parser.add_argument("--boards", type=int, default=20)
+    parser.add_argument("--holes", type=int, default=1000, help="holes per board")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+    fd, path = tempfile.mkstemp(suffix=".drl")
+    os.close(fd)
+    try:
+        expected = build(path, args.boards, args.holes, rng)
+        t0 = time.perf_counter()
+        job = read_drills(path)
+        t1 = time.perf_counter()
+        phase, report = optimize_phase(job.phase("Drilling/all tools"), time_limit=0.6)
+        t2 = time.perf_counter()
+        commands = phase_commands(phase, offset=(1000, 1000))
+        t3 = time.perf_counter()
+    finally:
+        os.remove(path)
+
+    groups = [t for k, t in enumerate(phase.drill_tools.tolist()) if k == 0 or t != phase.drill_tools[k - 1]]
+    ok = sorted(groups) == sorted(set(groups)) == sorted(TOOLS)
+    for t in TOOLS:
+        got = set(map(tuple, phase.drills[phase.drill_tools == t].tolist()))
+        ok = ok and got == expected[t] and len(got) == int((phase.drill_tools == t).sum())
+    x, y, _ = head_path(commands, (0, 0))
+    dips = np.flatnonzero(np.asarray(commands) == "PD;")  # head position at every pen dip
+    ok = ok and np.array_equal(np.column_stack((x[dips], y[dips])) - 1000, phase.drills)
+    print(job.summary())
+    print(f"read {1000 * (t1 - t0):.0f} ms, order {1000 * (t2 - t1):.0f} ms, commands {1000 * (t3 - t2):.0f} ms, "
+          f"total {t3 - t0:.2f} s")
+    print(f"{len(groups)} tool groups, {len(commands)} commands, pen-up {report.summary()}")
+    print("OK" if ok else "MISMATCH")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# Minimal fake Protomat on a pseudo-terminal for throughput benchmarks.
+# Unlike virtual_protomat.py there is no motion or line-rate model: every
+# command is answered after a fixed processing latency (plus optional
+# jitter), so the host side is what gets measured. Replies can be cut into
+# random fragments with a gap between them to exercise the receive framer.
+# Answers "C\r" per command in echo mode (!CT1;) and "P<x>,<y>,<z>C" to
+# !ON0;, tracking PR/PA/IN. All randomness comes from `seed`.
+import os
+import random
+import select
+import threading
+import time
+import tty
+from collections import deque
+
+from hpgl import parse_command
+
+
+class FakeDevice:
+    def __init__(self, latency=0.001, jitter=0.0, fragment=0, gap=0.0, seed=1):
+        self.latency = latency  # s per command
+        self.jitter = jitter  # s, uniform extra delay 0..jitter
+        self.fragment = fragment  # max reply fragment in bytes, 0 = whole replies
+        self.gap = gap  # s between fragments
+        self.rng = random.Random(seed)
+        self.position = [0, 0, 0]
+        self.echo = False
+        self.commands = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.master = self.slave = None
+        self._buffer = bytearray()
+        self._replies = deque()  # (due, bytes)
+        self._busy_until = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def open(self):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        return os.ttyname(self.slave)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                os.close(fd)
+        self.master = self.slave = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = 0.01
+            if self._replies:
+                wait = max(0.0, min(wait, self._replies[0][0] - time.monotonic()))
+            readable, _, _ = select.select([self.master], [], [], wait)
+            if readable:
+                try:
+                    data = os.read(self.master, 4096)
+                except (BlockingIOError, OSError):
+                    data = b""
+                self.bytes_in += len(data)
+                self._buffer += data
+                self._take_commands()
+            self._send_due()
+
+    def _take_commands(self):
+        while True:
+            end = self._buffer.find(b";")
+            if end < 0:
+                return
+            cmd = self._buffer[:end + 1].decode("ascii", errors="replace")
+            del self._buffer[:end + 1]
+            self.commands += 1
+            reply = self._execute(cmd)
+            start = max(time.monotonic(), self._busy_until)
+            self._busy_until = start + self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            if self.echo and not cmd.upper().startswith("!CT"):
+                reply += b"C\r"
+            if not reply:
+                continue
+            due = self._busy_until
+            if self.fragment:
+                while reply:
+                    n = self.rng.randint(1, self.fragment)
+                    self._replies.append((due, reply[:n]))
+                    reply = reply[n:]
+                    due += self.gap
+            else:
+                self._replies.append((due, reply))
+
+    def _execute(self, cmd):
+        try:
+            mnemonic, args = parse_command(cmd)
+        except ValueError:
+            return b"E1\r"
+        if mnemonic == "PR" and args:
+            self.position[0] += args[0]
+            self.position[1] += args[1] if len(args) > 1 else 0
+        elif mnemonic == "PA" and len(args) >= 2:
+            self.position[0], self.position[1] = args[0], args[1]
+        elif mnemonic == "IN":
+            self.position = [0, 0, 0]
+        elif mnemonic == "!CT" and args:
+            self.echo = args[0] == 1
+            return b"C\r" if self.echo else b""
+        elif mnemonic == "!ON":
+            return b"P%d,%d,%dC" % tuple(self.position)
+        return b""
+
+    def _send_due(self):
+        now = time.monotonic()
+        while self._replies and self._replies[0][0] <= now:
+            _, data = self._replies.popleft()
+            try:
+                os.write(self.master, data)
+            except (BlockingIOError, OSError):
+                self._replies.appendleft((now + 0.001, data))
+                return
+            self.bytes_out += len(data)
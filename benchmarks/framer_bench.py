@@ -0,0 +1,71 @@
+# Correctness and speed harness for framer.Framer.
+# Builds a random reply stream, feeds it in randomly sized fragments and
+# checks that exactly the original events come out.
+#
+#   python -m benchmarks.framer_bench [--frames 200000] [--seed 1]
+import argparse
+import random
+import time
+
+from framer import ACK, ECHO, ERROR, POSITION, Event, Framer
+
+
+def random_stream(n, rng):
+    events, parts = [], []
+    for _ in range(n):
+        r = rng.random()
+        if r < 0.7:
+            events.append(Event(ACK, None))
+            parts.append(b"C\r")
+        elif r < 0.9:
+            pos = (rng.randint(-50000, 50000), rng.randint(-50000, 50000), rng.randint(-1000, 1000))
+            events.append(Event(POSITION, pos))
+            parts.append(b"P%d,%d,%dC" % pos)
+        elif r < 0.95:
+            code = rng.randint(0, 15)
+            events.append(Event(ERROR, code))
+            parts.append(b"E%d\r" % code)
+        else:
+            text = "".join(rng.choice("ABDFGHIJKLMNOPQRSTUVWXYZ ") for _ in range(rng.randint(1, 20))).strip() or "X"
+            if text.startswith(("P", "E")):
+                text = "K" + text
+            events.append(Event(ECHO, text))
+            parts.append(text.encode() + b"\r")
+    return events, b"".join(parts)
+
+
+def fragments(data, rng, max_size):
+    i = 0
+    while i < len(data):
+        n = rng.randint(1, max_size)
+        yield data[i:i + n]
+        i += n
+
+
+def run(frames, seed, max_fragment):
+    rng = random.Random(seed)
+    expected, data = random_stream(frames, rng)
+    chunks = list(fragments(data, rng, max_fragment))
+    framer = Framer()
+    got = []
+    t0 = time.perf_counter()
+    for chunk in chunks:
+        got.extend(framer.feed(chunk))
+    dt = time.perf_counter() - t0
+    ok = got == expected and framer.pending == 0
+    print(f"fragments<= {max_fragment:4d}: {len(chunks):7d} chunks, {len(data) / dt / 1e6:6.2f} MB/s, "
+          f"{len(got) / dt:10.0f} frames/s  {'OK' if ok else 'MISMATCH'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Framer correctness and speed harness")
+    parser.add_argument("--frames", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    ok = all([run(args.frames, args.seed, size) for size in (1, 7, 64, 1024)])
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# Load-time harness for lmd.read_lmd.
+# Builds a large LMD file by repeating the phases of the shipped Tutor.LMD,
+# loads it and checks that every repetition decodes to the same geometry.
+#
+#   python -m benchmarks.lmd_bench [--copies 100]
+import argparse
+import os
+import tempfile
+import time
+
+from lmd import OP_PHASE, read_lmd
+
+TUTOR = os.path.join(os.path.dirname(__file__), "..", "resources", "information BoardMaster", "Data", "Tutor.LMD")
+
+
+def build(path, copies):
+    with open(TUTOR, "rb") as f:
+        data = f.read()
+    body = data.index(bytes([0x00, OP_PHASE]))  # first phase follows the size table
+    with open(path, "wb") as f:
+        f.write(data[:body])
+        f.write(data[body:] * copies)
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LMD reader load-time harness")
+    parser.add_argument("--copies", type=int, default=100)
+    args = parser.parse_args()
+    single = read_lmd(TUTOR)
+    fd, path = tempfile.mkstemp(suffix=".LMD")
+    os.close(fd)
+    try:
+        size = build(path, args.copies)
+        t0 = time.perf_counter()
+        job = read_lmd(path)
+        dt = time.perf_counter() - t0
+    finally:
+        os.remove(path)
+    n = len(single.phases)
+    ok = len(job.phases) == n * args.copies and all(
+        (a.points == b.points).all() and (a.drills == b.drills).all() and (a.circles == b.circles).all()
+        for i, a in enumerate(job.phases) for b in (single.phases[i % n],))
+    segments = sum(p.segments for p in job.phases)
+    print(f"{size / 1e6:.2f} MB, {len(job.phases)} phases, {segments} segments in {dt * 1000:.0f} ms "
+          f"({size / dt / 1e6:.1f} MB/s)  {'OK' if ok else 'MISMATCH'}")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Timing harness for job_preview.py.
+# Builds a panel of copies of the largest Tutor.LMD phase (about 500k
+# segments by default), indexes it, and then times what the preview window
+# does: fitting the whole job, zooming in step by step around a point, and
+# panning. A recording canvas stands in for Tk (no display needed) and
+# counts the items a view creates. Tk itself adds roughly 10-20 us per line.
+# The same views are drawn twice, the second time from the tile cache.
+#
+#   python -m benchmarks.preview_bench [--copies 150]
+import argparse
+import time
+
+from benchmarks.serial_bench import TUTOR
+from job_preview import JobPreview
+from lmd import phase_commands, read_lmd
+
+
+class RecordingCanvas:
+    # The part of the Tk canvas API JobPreview uses
+    def __init__(self, width=1200, height=800):
+        self.width, self.height = width, height
+        self.items = 0
+        self.points = 0
+
+    def __getitem__(self, key):
+        return {"width": self.width, "height": self.height}[key]
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+    def create_line(self, *coords, **kw):
+        self.items += 1
+        self.points += len(coords) // 2
+
+    def create_oval(self, *coords, **kw):
+        self.items += 1
+
+    def create_text(self, *args, **kw):
+        return 0
+
+    def after(self, ms, func):
+        return None  # redraws are driven by hand
+
+    def after_cancel(self, job):
+        pass
+
+    def bind(self, *args):
+        pass
+
+    def delete(self, *tags):
+        pass
+
+    def itemconfig(self, *args, **kw):
+        pass
+
+    def tag_raise(self, *args):
+        pass
+
+    def move(self, *args):
+        pass
+
+    def scale(self, *args):
+        pass
+
+
+def panel(copies):
+    job = read_lmd(TUTOR)
+    phase = max(job.phases, key=lambda p: p.segments)
+    cols = max(1, int(copies ** 0.5))
+    commands = []
+    pos = (0, 0)
+    for k in range(copies):
+        offset = (1000 + (k % cols) * 6000, 1000 + (k // cols) * 4200)
+        commands += phase_commands(phase, start=pos, offset=offset)
+        pos = (int(phase.points[-1][0]) + offset[0], int(phase.points[-1][1]) + offset[1]) if not len(phase.circles) \
+            else (int(phase.circles[-1][0]) + offset[0], int(phase.circles[-1][1]) + offset[1])
+    return commands
+
+
+def timed(preview, canvas, what, func, redraw=True):
+    canvas.items = canvas.points = 0
+    t0 = time.perf_counter()
+    func()
+    if redraw:  # the window redraws REDRAW_MS after the last event
+        preview._redraw()
+    dt = time.perf_counter() - t0
+    print(f"  {what:<24} {dt * 1000:7.1f} ms  {canvas.items:6} items {canvas.points:7} points  "
+          f"detail {2.0 ** preview.lod / 100:.3g} mm")
+    return dt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Job preview harness")
+    parser.add_argument("--copies", type=int, default=150, help="copies of the largest Tutor.LMD phase")
+    args = parser.parse_args()
+
+    commands = panel(args.copies)
+    canvas = RecordingCanvas()
+    preview = JobPreview(canvas)
+    t0 = time.perf_counter()
+    preview.load(commands)
+    print(f"{len(commands)} commands, {preview.index.segments} segments, {len(preview.index.pt_idx)} points: "
+          f"indexed and fitted in {time.perf_counter() - t0:.2f} s")
+    worst = 0.0
+    for rnd in ("first", "cached"):
+        print(f"{rnd} pass:")
+        worst = max(worst, timed(preview, canvas, "fit", preview.fit, redraw=False))
+        for step in range(8):
+            worst = max(worst, timed(preview, canvas, f"zoom x{2 ** (step + 1)}",
+                                     lambda: preview.zoom(2.0, 600, 400)))
+        for step in range(3):
+            worst = max(worst, timed(preview, canvas, "pan 300 px", lambda: preview.pan(300, 150)))
+    preview.fit()
+    canvas.items = 0
+    t0 = time.perf_counter()
+    for sent in range(0, len(commands), len(commands) // 50):
+        preview.set_progress(sent)
+        preview._draw_progress()
+    print(f"progress overlay: 50 frames in {(time.perf_counter() - t0) * 1000:.0f} ms, {canvas.items} items")
+    print(f"slowest view {worst * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Multi-machine harness for scheduler.py.
+# Starts --machines fake devices (benchmarks/fake_device.py) as a pool: the
+# first has a small workspace that only takes the smaller jobs, the second
+# has no drill. It queues every phase of Tutor.LMD --boards times, with
+# the phases' tool kinds, and kills one device after --kill-after seconds
+# to exercise requeueing. While the jobs run, a 20 ms loop
+# (serial_bench.HeadlessLoop) stands in for the GUI and polls
+# Scheduler.status() every 0.5 s. Its lag shows whether the GUI thread
+# keeps up. At the end it prints the aggregate and per-machine throughput.
+#
+#   python -m benchmarks.scheduler_bench [--machines 4] [--boards 3] [--latency 0.5] [--kill-after 1.5]
+import argparse
+import threading
+import time
+
+from benchmarks.fake_device import FakeDevice
+from benchmarks.serial_bench import TUTOR, HeadlessLoop
+from lmd import phase_commands, read_lmd
+from scheduler import DONE, Job, Machine, Scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-machine scheduler harness")
+    parser.add_argument("--machines", type=int, default=4)
+    parser.add_argument("--boards", type=int, default=3, help="copies of every Tutor.LMD phase")
+    parser.add_argument("--latency", type=float, default=0.5, help="device ms per command")
+    parser.add_argument("--kill-after", type=float, default=1.5, help="s until the last device dies (0 = never)")
+    parser.add_argument("--window", type=int, default=8)
+    args = parser.parse_args()
+
+    devices = [FakeDevice(args.latency / 1000, seed=k + 1) for k in range(args.machines)]
+    machines = []
+    for k, device in enumerate(devices):
+        workspace = (6000, 5000) if k == 0 else (45000, 22000)
+        tools = {"mill", "marking"} if k == 1 else None
+        machines.append(Machine(f"M{k + 1}", device.open(), workspace=workspace, tools=tools))
+        device.start()
+    log = []
+    scheduler = Scheduler(machines, window=args.window, retry_delay=1.0, on_log=log.append)
+
+    lmd = read_lmd(TUTOR)
+    jobs = [Job(f"board{b + 1}:{phase.title}", phase_commands(phase, offset=(1000, 1000)),
+                {tool.kind for tool in phase.tools})
+            for b in range(args.boards) for phase in lmd.phases]
+    for job in jobs:
+        scheduler.submit(job)
+
+    loop = HeadlessLoop()
+    done = threading.Event()
+    polls = []
+
+    def poll():
+        polls.append(scheduler.status())
+        if not done.is_set():
+            threading.Timer(0.5, loop.call, (poll,)).start()
+
+    def supervise():
+        if args.kill_after:
+            time.sleep(args.kill_after)
+            devices[-1].close()
+            log.append(f"killed {machines[-1].name}\n")
+        scheduler.wait()
+        done.set()
+
+    scheduler.start()
+    loop.call(poll)
+    threading.Thread(target=supervise, daemon=True).start()
+    loop.run(done)
+    scheduler.stop()
+    for device in devices[:-1] if args.kill_after else devices:
+        device.close()
+
+    status = scheduler.status()
+    print("".join(line for line in log if "requeued" in line or "killed" in line or "giving up" in line), end="")
+    print(scheduler.summary())
+    for m in status["machines"]:
+        print(f"  {m['name']}: {m['jobs_done']} jobs, {m['commands']} commands, {m['failures']} failures, "
+              f"busy {m['busy']:.0%}")
+    lags = loop.lags or [0.0]
+    print(f"GUI loop: {len(polls)} status polls, lag mean {1000 * sum(lags) / len(lags):.2f} ms, "
+          f"max {1000 * max(lags):.1f} ms")
+    ok = all(job.state == DONE for job in jobs)
+    print(f"{sum(job.state == DONE for job in jobs)}/{len(jobs)} jobs done: {'OK' if ok else 'FAILED'}")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# Serial throughput suite: the real host stack against a fake device.
+# Each workload runs in a fresh interpreter (so peak memory is its own)
+# with ProtomatSession connected to benchmarks/fake_device.py over a pty.
+# A stand-in for the Tk main loop ticks every 20 ms, runs the session's
+# dispatched callbacks and terminal output, and records how late each tick
+# was (--tk uses a real, hidden Tk window with TerminalLog instead).
+#
+# Workloads:
+#   rectangle  the readme's rectangle flow, repeated, streamed as one job
+#   jogs       a storm of checked relative jogs issued on the GUI loop
+#   board      every phase of Tutor.LMD drawn as one job
+#
+#   python -m benchmarks.serial_bench [--repeat 3] [--latency 0.5] [--fragment 4]
+#                                     [--save out.json] [--compare baseline.json]
+#
+# Reported per workload (median of the repeats): commands/s, job time,
+# GUI loop lag (mean and max) and peak RSS. Fixed seeds and parameters keep
+# runs comparable; --save stores them with the results, --compare prints the
+# change against a saved run. Needs Linux (pty) and numpy.
+import argparse
+import json
+import os
+import platform
+import queue
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+from benchmarks.fake_device import FakeDevice
+from hpgl import split_commands
+from protomat import ProtomatSession
+
+TUTOR = os.path.join(os.path.dirname(__file__), "..", "resources", "information BoardMaster", "Data", "Tutor.LMD")
+RECTANGLE = "!TS500;PD;PR5000,0;PR0,5000;PR-5000,0;PR0,-5000;PU;!TS0;"
+METRICS = (("commands_per_s", "cmd/s"), ("job_s", "job s"), ("lag_mean_ms", "lag ms"), ("lag_max_ms", "max lag ms"),
+           ("peak_rss_mb", "RSS MB"))
+
+
+class HeadlessLoop:
+    # Tk main loop stand-in: callbacks and log lines are handled once per tick
+    def __init__(self, period=0.02, max_lines=5000):
+        self.period = period
+        self.calls = queue.Queue()
+        self.lines = deque()
+        self.text = deque(maxlen=max_lines)  # what the terminal widget would hold
+        self.lags = []
+
+    def call(self, func, *args):
+        self.calls.put((func, args))
+
+    def log(self, text):
+        self.lines.append(text)
+
+    def tick(self):
+        while True:
+            try:
+                func, args = self.calls.get_nowait()
+            except queue.Empty:
+                break
+            func(*args)
+        if self.lines:
+            batch = []
+            while self.lines:
+                batch.append(self.lines.popleft())
+            self.text.extend("".join(batch).splitlines())
+
+    def run(self, done):
+        due = time.perf_counter()
+        while not done.is_set():
+            due += self.period
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.perf_counter()
+            self.lags.append(now - due)
+            self.tick()
+            due = max(due, now)  # a late tick does not cause a burst of catch-up ticks
+        self.tick()
+
+
+class TkLoop(HeadlessLoop):
+    # The same with a real Tk event loop and the controller's TerminalLog
+    def __init__(self, period=0.02):
+        import tkinter as tk
+        from terminal_log import TerminalLog
+        super().__init__(period)
+        self.root = tk.Tk()
+        self.root.withdraw()
+        self.terminal = TerminalLog(tk.Text(self.root), max_lines=5000)
+        self.terminal.start()
+
+    def log(self, text):
+        self.terminal.write(text)
+
+    def run(self, done):
+        state = {"due": time.perf_counter() + self.period}
+
+        def tick():
+            now = time.perf_counter()
+            self.lags.append(now - state["due"])
+            self.tick()
+            if done.is_set():
+                self.root.quit()
+                return
+            state["due"] = max(state["due"], now) + self.period
+            self.root.after(max(0, int((state["due"] - time.perf_counter()) * 1000)), tick)
+
+        self.root.after(int(self.period * 1000), tick)
+        self.root.mainloop()
+        self.root.destroy()
+
+
+# --- workloads (run on a worker thread; the loop owns the session state) ----
+
+def rectangle(session, loop, args):
+    commands = split_commands(RECTANGLE) * args.rectangles
+    t0 = time.perf_counter()
+    stats = session.start_job(commands, window=args.window, wait=True)
+    if not stats:
+        raise RuntimeError("rectangle job failed")
+    return {"commands": len(commands), "job_s": time.perf_counter() - t0}
+
+
+def jogs(session, loop, args):
+    issued = threading.Event()
+    t0 = time.perf_counter()
+    for k in range(args.jogs):
+        step = 100 if k % 2 == 0 else -100
+        loop.call(session.move_relative_checked, step, step)
+    loop.call(issued.set)
+    issued.wait()
+    session.serial_io.query_position().result(60)  # answered once every jog has been processed
+    return {"commands": args.jogs, "job_s": time.perf_counter() - t0}
+
+
+def board(session, loop, args):
+    from bounds import head_path
+    from lmd import phase_commands, read_lmd
+    job = read_lmd(TUTOR)
+    commands = []
+    pos = (0, 0)
+    for phase in job.phases:
+        part = phase_commands(phase, start=pos, offset=(1000, 1000))
+        x, y, _ = head_path(part, pos)
+        pos = (int(x[-1]), int(y[-1]))
+        commands += part
+    t0 = time.perf_counter()
+    stats = session.start_job(commands, window=args.window, wait=True)
+    if not stats:
+        raise RuntimeError("board job failed")
+    return {"commands": len(commands), "job_s": time.perf_counter() - t0}
+
+
+WORKLOADS = {"rectangle": rectangle, "jogs": jogs, "board": board}
+
+
+def run_one(name, args):
+    device = FakeDevice(args.latency / 1000, args.jitter / 1000, args.fragment, args.gap / 1000, args.seed)
+    path = device.open()
+    device.start()
+    loop = TkLoop() if args.tk else HeadlessLoop()
+    session = ProtomatSession(on_log=loop.log, dispatch=loop.call)
+    session.connect(path)
+    session.wait_position(timeout=2.0)
+    result = {}
+    done = threading.Event()
+
+    def work():
+        try:
+            result.update(WORKLOADS[name](session, loop, args))
+        except Exception as e:
+            result["error"] = repr(e)
+        finally:
+            done.set()
+
+    threading.Thread(target=work, daemon=True).start()
+    loop.run(done)
+    session.disconnect()
+    device.close()
+    lags = loop.lags or [0.0]
+    result.update({
+        "commands_per_s": result.get("commands", 0) / result["job_s"] if result.get("job_s") else 0.0,
+        "lag_mean_ms": 1000 * statistics.fmean(lags),
+        "lag_max_ms": 1000 * max(lags),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "device_commands": device.commands,
+    })
+    return result
+
+
+def child_args(args, name):
+    out = ["--run", name, "--latency", str(args.latency), "--jitter", str(args.jitter),
+           "--fragment", str(args.fragment), "--gap", str(args.gap), "--seed", str(args.seed),
+           "--window", str(args.window), "--rectangles", str(args.rectangles), "--jogs", str(args.jogs)]
+    return out + (["--tk"] if args.tk else [])
+
+
+def params(args):
+    return {k: getattr(args, k) for k in ("latency", "jitter", "fragment", "gap", "seed", "window", "rectangles",
+                                          "jogs", "repeat", "tk")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial throughput suite against a fake device")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help="comma separated subset")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per workload; the median is reported")
+    parser.add_argument("--latency", type=float, default=0.5, help="device ms per command")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra device ms, uniform 0..jitter")
+    parser.add_argument("--fragment", type=int, default=0, help="split replies into fragments of 1..N bytes")
+    parser.add_argument("--gap", type=float, default=0.0, help="ms between reply fragments")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--window", type=int, default=8)
+    parser.add_argument("--rectangles", type=int, default=250, help="rectangle flows per job (8 commands each)")
+    parser.add_argument("--jogs", type=int, default=2000)
+    parser.add_argument("--tk", action="store_true", help="measure a real Tk loop (needs a display)")
+    parser.add_argument("--save", metavar="FILE", help="write parameters and results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="print the change against a saved run")
+    parser.add_argument("--run", help=argparse.SUPPRESS)  # child process: one workload, JSON on stdout
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_one(args.run, args)))
+        return
+
+    results = {}
+    failed = False
+    for name in args.workloads.split(","):
+        runs = []
+        for _ in range(args.repeat):
+            proc = subprocess.run([sys.executable, "-m", "benchmarks.serial_bench"] + child_args(args, name),
+                                  capture_output=True, text=True)
+            try:
+                run = json.loads(proc.stdout.strip().splitlines()[-1])
+            except (ValueError, IndexError):
+                run = {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "no output"}
+            runs.append(run)
+        errors = [r["error"] for r in runs if "error" in r]
+        if errors:
+            failed = True
+            print(f"{name}: FAILED ({errors[0]})")
+            continue
+        results[name] = {key: statistics.median(r[key] for r in runs) for key, _ in METRICS}
+        results[name]["commands"] = runs[0]["commands"]
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print(f"{'workload':<10} {'commands':>8} " + " ".join(f"{label:>12}" for _, label in METRICS))
+    for name, r in results.items():
+        print(f"{name:<10} {r['commands']:>8} " + " ".join(f"{r[key]:>12.2f}" for key, _ in METRICS))
+        if name in baseline:
+            cells = []
+            for key, _ in METRICS:
+                old = baseline[name].get(key)
+                change = 100 * (r[key] - old) / old if old else 0.0
+                cells.append(f"{change:>+11.1f}%")
+            print(f"{'  vs base':<10} {'':>8} " + " ".join(cells))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"params": params(args), "python": sys.version.split()[0], "platform": platform.platform(),
+                       "results": results}, f, indent=2)
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
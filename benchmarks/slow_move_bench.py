@@ -0,0 +1,48 @@
+# Ack timeout check for JobStreamer against the virtual Protomat.
+# Streams the GUI's default flow, four 50 mm sides at !TS500 (about 10 s
+# each), in real time. Each side takes longer than the streamer's ack
+# timeout, and the window holds all of them at once, so the job only
+# finishes if the timeout allows for the motion of the command in progress.
+#
+#   python -m benchmarks.slow_move_bench [--speedup 1]
+import argparse
+import threading
+import time
+
+from hpgl import split_commands
+from protomat import ProtomatSession
+from virtual_protomat import VirtualProtomat
+
+FLOW = "!TS500;PD;PR5000,0;PR0,5000;PR-5000,0;PR0,-5000;PU;!TS0;"  # controller.py default
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Slow move check against the virtual Protomat")
+    parser.add_argument("--speedup", type=float, default=1.0)
+    args = parser.parse_args()
+    machine = VirtualProtomat(speedup=args.speedup)
+    path = machine.open()
+    threading.Thread(target=machine.run, daemon=True).start()
+    log = []
+    session = ProtomatSession(on_log=log.append)
+    session.log_traffic = False
+    session.connect(path)
+    try:
+        session.wait_position(timeout=2.0)
+        t0 = time.monotonic()
+        stats = session.start_job(split_commands(FLOW), wait=True)
+        returned = time.monotonic()
+        late = max(0.0, machine.busy_until - returned)
+    finally:
+        session.disconnect()
+        machine.stop()
+        machine.close()
+    print("".join(line for line in log if line.startswith(("Job", "No acknowledge"))), end="")
+    print(f"job returned after {returned - t0:.1f} s, machine busy {late:.1f} s longer")
+    ok = stats is not None and late == 0.0
+    print("OK" if ok else "MISMATCH")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
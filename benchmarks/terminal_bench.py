@@ -0,0 +1,82 @@
+# Spill-order and throughput check for terminal_log.TerminalLog.
+# Runs the batching log against a stand-in for the Tk Text widget (no
+# display needed): numbered lines are written in batches, some of them
+# larger than the scrollback, with a spill file set. Every line must end up
+# exactly once, in order, in the spill file followed by the widget.
+#
+#   python -m benchmarks.terminal_bench [--lines 200000] [--max-lines 5000]
+import argparse
+import glob
+import os
+import random
+import tempfile
+import time
+
+from terminal_log import TerminalLog
+
+
+class FakeText:
+    # The few Text methods TerminalLog uses; indices "1.0", "<n>.0", "end", "end-1c"
+    def __init__(self):
+        self.lines = []  # each ends with "\n"
+
+    def _line(self, index):
+        if index in ("end", "end-1c"):
+            return len(self.lines)
+        return int(index.split(".")[0]) - 1
+
+    def get(self, start, end):
+        return "".join(self.lines[self._line(start):self._line(end)])
+
+    def delete(self, start, end):
+        del self.lines[self._line(start):self._line(end)]
+
+    def insert(self, index, text):
+        self.lines.extend(text.splitlines(keepends=True))
+
+    def config(self, **kwargs):
+        pass
+
+    def see(self, index):
+        pass
+
+    def after(self, ms, func):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TerminalLog spill-order check")
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--max-lines", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, "terminal.log")
+    widget = FakeText()
+    log = TerminalLog(widget, max_lines=args.max_lines)
+    log.set_spill_file(path, max_bytes=1 << 40)
+    t0 = time.perf_counter()
+    n = 0
+    while n < args.lines:
+        # Mostly small batches, now and then one larger than the scrollback
+        size = rng.choice((1, 10, 200, 2 * args.max_lines + 7))
+        for k in range(n, min(n + size, args.lines)):
+            log.write(f"line {k}\n")
+        n = min(n + size, args.lines)
+        log.flush()
+    dt = time.perf_counter() - t0
+    log.set_spill_file(None)
+    spilled = []
+    for name in sorted(glob.glob(path + "*"), reverse=True):
+        with open(name, encoding="utf-8") as f:
+            spilled += f.read().splitlines()
+    seen = spilled + [line.rstrip("\n") for line in widget.lines]
+    ok = seen == [f"line {k}" for k in range(args.lines)] and len(widget.lines) <= args.max_lines
+    print(f"{args.lines} lines in {dt * 1000:.0f} ms, {len(spilled)} spilled, {len(widget.lines)} on screen")
+    print("OK" if ok else "MISMATCH")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Speed and quality harness for travel.optimize_phase.
+# Scatters short random polylines over the workspace in random order,
+# optimizes the pen-up order and checks that the geometry is unchanged.
+#
+#   python -m benchmarks.travel_bench [--paths 50000] [--seed 1]
+import argparse
+import time
+
+import numpy as np
+
+from lmd import Phase
+from travel import optimize_phase
+
+
+def random_phase(n, rng, workspace=(45000, 22000)):
+    phase = Phase("Bench", "Random", [])
+    lengths = rng.integers(2, 8, n)
+    anchors = np.repeat(rng.uniform((0, 0), workspace, (n, 2)), lengths, axis=0)
+    phase.points = np.rint(anchors + rng.normal(0, 150, anchors.shape)).astype(np.int32)
+    phase.starts = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    phase.path_tools = rng.integers(1, 3, n).astype(np.int32)
+    return phase
+
+
+def segments(phase):
+    # Undirected segment multiset as a sorted array
+    pts = phase.points.astype(np.int64)
+    keep = np.ones(len(pts) - 1, bool)
+    keep[phase.starts[1:-1] - 1] = False
+    a, b = pts[:-1][keep], pts[1:][keep]
+    swap = (a[:, 0] > b[:, 0]) | ((a[:, 0] == b[:, 0]) & (a[:, 1] > b[:, 1]))
+    a[swap], b[swap] = b[swap], a[swap].copy()
+    seg = np.hstack((a, b))
+    return seg[np.lexsort(seg.T[::-1])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pen-up travel optimizer harness")
+    parser.add_argument("--paths", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--time-limit", type=float, default=2.0)
+    args = parser.parse_args()
+    phase = random_phase(args.paths, np.random.default_rng(args.seed))
+    t0 = time.perf_counter()
+    result, report = optimize_phase(phase, time_limit=args.time_limit)
+    dt = time.perf_counter() - t0
+    ok = (np.array_equal(segments(phase), segments(result))
+          and np.array_equal(np.sort(phase.path_tools), np.sort(result.path_tools)))
+    print(f"{args.paths} paths in {dt:.2f} s: {report.summary()}  {'OK' if ok else 'MISMATCH'}")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
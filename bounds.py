@@ -0,0 +1,122 @@
+# Pre-flight workspace check for whole flows.
+# The flow is joined into one byte buffer and parsed with NumPy: command and
+# argument boundaries come from the ";" and "," positions, numbers are summed
+# digit by digit with per-token weights (fractions are cut off like
+# hpgl.parse_command does). The head position after every command is a
+# prefix sum over the PR deltas, restarted at every PA and IN; CI is checked
+# with the bounding box of its circle. The workspace is a rectangle, so a
+# straight move stays inside if its end points do.
+# A million commands are checked in well under a second.
+import numpy as np
+
+from hpgl import split_commands
+
+_SEMI, _COMMA, _DOT, _MINUS = b";,.-"
+_POW10 = 10.0 ** np.arange(31)
+
+
+class BoundsError(Exception):
+    def __init__(self, index, command, x, y, radius=0):
+        self.index = index  # position of the command in the flow
+        self.command = command
+        self.x = x  # head position after the command (circle center for CI)
+        self.y = y
+        self.radius = radius
+        what = f"draws a circle of radius {radius} around" if radius else "moves the head to"
+        super().__init__(f"Command {index} ({command.strip()}) {what} X={x} Y={y}, outside the workspace")
+
+
+def _mnemonic(buf, starts, text):
+    return (buf[starts] == ord(text[0])) & (buf[np.minimum(starts + 1, len(buf) - 1)] == ord(text[1]))
+
+
+def _numbers(buf):
+    # Integer value of every ","/";"-separated token, whether it has digits,
+    # and the token of every byte
+    sep = (buf == _SEMI) | (buf == _COMMA)
+    tok = np.cumsum(sep, dtype=np.int32) - sep  # token of each byte; a separator closes its token
+    ntok = int(tok[-1]) + 1 + bool(sep[-1])
+    digit = (buf >= 48) & (buf <= 57)
+    idx = np.flatnonzero(digit)
+    tok_d = tok[idx]
+    dot = buf == _DOT
+    if dot.any():
+        dots = np.cumsum(dot, dtype=np.int32)
+        before = np.concatenate(([0], dots))[np.concatenate(([0], np.flatnonzero(sep) + 1))]  # per token
+        idx = idx[dots[idx] == before[tok_d]]  # digits before any "." of the token
+        tok_d = tok[idx]
+    # Whole digits behind each one in its token: rank from the end of its run
+    rank = np.arange(len(idx), dtype=np.int32)
+    end = np.concatenate((np.flatnonzero(np.diff(tok_d)), [len(idx) - 1])).astype(np.int32)
+    after = end[np.cumsum(np.concatenate(([0], np.diff(tok_d) != 0)), dtype=np.int32)] - rank
+    weight = (buf[idx] - 48) * _POW10[np.minimum(after, len(_POW10) - 1)]
+    value = np.bincount(tok_d, weights=weight, minlength=ntok)
+    minus = np.flatnonzero(buf == _MINUS)
+    negative = np.zeros(ntok, bool)
+    negative[tok[minus]] = True
+    has = np.zeros(ntok, bool)
+    has[tok_d] = True
+    return np.where(negative, -value, value), has, tok
+
+
+def _flow(commands):
+    # One command per entry, and the joined upper-case bytes with the ";" positions
+    if isinstance(commands, str):
+        commands = split_commands(commands)
+    buf = np.frombuffer("".join(commands).upper().encode("ascii", errors="replace"), np.uint8)
+    ends = np.flatnonzero(buf == _SEMI)
+    if len(ends) != len(commands):
+        commands = split_commands("".join(commands))  # an entry held several commands
+        return _flow(commands)
+    return commands, buf, ends
+
+
+def head_path(commands, start=(0, 0)):
+    # (x, y, radius) after every command: float arrays of the head position and
+    # the CI radius (0 for other commands). commands: flow text or command list,
+    # entries holding several commands count as several.
+    _, buf, ends = _flow(commands)
+    return _path(buf, ends, start)
+
+
+def _path(buf, ends, start):
+    n = len(ends)
+    if n == 0:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    value, has, tok = _numbers(buf)
+    first = tok[starts]  # first token of each command
+    commas = np.diff(first, append=len(value) - 1) - 1  # the flow ends with ";"
+    a0 = value[first]
+    a1 = np.where(commas >= 1, value[np.minimum(first + 1, len(value) - 1)], 0.0)
+    args = has[first]
+
+    pr = _mnemonic(buf, starts, "PR") & args
+    pa = _mnemonic(buf, starts, "PA") & args & (commas >= 1)
+    home = _mnemonic(buf, starts, "IN")
+    ci = _mnemonic(buf, starts, "CI") & args
+
+    last = np.maximum.accumulate(np.where(pa | home, np.arange(n), -1))  # last PA/IN so far
+    path = []
+    for arg, origin in ((a0, start[0]), (a1, start[1])):
+        cum = np.cumsum(np.where(pr, arg, 0.0))
+        base = np.where(pa, arg, 0.0)  # IN homes to 0
+        path.append(np.where(last >= 0, base[last] + cum - cum[np.maximum(last, 0)], origin + cum))
+    radius = np.where(ci, np.abs(a0), 0.0)
+    return path[0], path[1], radius
+
+
+def check_bounds(commands, workspace, start=(0, 0)):
+    # Raise BoundsError for the first command that takes the head outside
+    # 0..workspace[0] x 0..workspace[1]; start: head position before the flow
+    commands, buf, ends = _flow(commands)
+    x, y, r = _path(buf, ends, start)
+    if not len(x):
+        return
+    w, h = workspace
+    moved = (np.diff(x, prepend=start[0]) != 0) | (np.diff(y, prepend=start[1]) != 0) | (r > 0)
+    bad = moved & ((x - r < 0) | (y - r < 0) | (x + r > w) | (y + r > h))
+    hit = np.flatnonzero(bad)
+    if len(hit):
+        k = int(hit[0])
+        raise BoundsError(k, commands[k], int(x[k]), int(y[k]), int(r[k]))
@@ -0,0 +1,258 @@
+# Flow compiler: turns a typed flow into the fewest bytes that draw the same thing.
+#   - consecutive PR moves are merged when they go on in the same direction,
+#     so the head takes the same path (merge_travel=True also merges any
+#     pen-up moves into one diagonal, for flows whose air moves are free)
+#   - zero-length moves are dropped
+#   - PU;/PD; that do not change the pen state and !TS that do not change
+#     the speed (or are overridden before the next move) are dropped
+#   - with a known start position each move is sent as PR (relative) or PA
+#     (absolute), whichever is shorter
+# Everything else (IN, CI, !CT, !ON, ...) is kept in place and ends merging.
+# simulate() replays a command list; compile_flow(check=True) uses it to
+# verify that the result ends at the same position with the same pen-down
+# geometry and, unless merge_travel is set, along the same head path.
+from hpgl import parse_command, split_commands
+
+
+class CompileError(Exception):
+    pass
+
+
+class CompileResult:
+    def __init__(self, source, commands):
+        self.source = source  # input commands
+        self.commands = commands  # compiled commands
+
+    @property
+    def bytes_before(self):
+        return sum(len(c) for c in self.source)
+
+    @property
+    def bytes_after(self):
+        return sum(len(c) for c in self.commands)
+
+    def summary(self):
+        saved = self.bytes_before - self.bytes_after
+        pct = 100 * saved / self.bytes_before if self.bytes_before else 0.0
+        return (f"{len(self.source)} -> {len(self.commands)} commands, "
+                f"{self.bytes_before} -> {self.bytes_after} bytes (-{pct:.0f}%)")
+
+
+def _parse(cmd):
+    try:
+        mnemonic, args = parse_command(cmd)
+    except ValueError:
+        return None, []
+    return mnemonic, args
+
+
+def _same_direction(a, b):
+    return a[0] * b[1] == a[1] * b[0] and a[0] * b[0] + a[1] * b[1] > 0
+
+
+class _Emitter:
+    def __init__(self, start, absolute, merge_travel=False):
+        self.out = []
+        self.merge_travel = merge_travel
+        self.pos = list(start) if start is not None else None  # absolute position if known
+        self.absolute = absolute and start is not None
+        self.pen = None  # pen state on the machine, None = unknown
+        self.speed = None  # speed sent last, None = unknown
+        self.want_speed = None
+        self.move = None  # pending (dx, dy), not yet sent
+
+    def add_move(self, dx, dy):
+        if not dx and not dy:
+            return
+        if self.move is not None:
+            if self.pen is False and self.merge_travel:
+                # Pen up: only the end point counts
+                self.move = (self.move[0] + dx, self.move[1] + dy)
+                return
+            if _same_direction(self.move, (dx, dy)):
+                self.move = (self.move[0] + dx, self.move[1] + dy)
+                return
+            self.flush()
+        self.move = (dx, dy)
+
+    def flush(self):
+        if self.move is None:
+            return
+        dx, dy = self.move
+        self.move = None
+        if not dx and not dy:
+            return  # pen-up moves that cancelled out
+        if self.want_speed is not None and self.want_speed != self.speed:
+            self.out.append(f"!TS{self.want_speed};")
+            self.speed = self.want_speed
+        text = f"PR{dx},{dy};"
+        if self.pos is not None:
+            self.pos = [self.pos[0] + dx, self.pos[1] + dy]
+            if self.absolute:
+                absolute = f"PA{self.pos[0]},{self.pos[1]};"
+                if len(absolute) < len(text):
+                    text = absolute
+        self.out.append(text)
+
+    def set_pen(self, down):
+        if self.pen == down:
+            return
+        self.flush()
+        self.out.append("PD;" if down else "PU;")
+        self.pen = down
+
+    def set_speed(self, speed):
+        if speed == self.want_speed:
+            return
+        self.flush()
+        self.want_speed = speed
+
+    def barrier(self, cmd):
+        # A command the compiler does not reason about: send pending state first
+        self.flush()
+        self.sync_speed()
+        self.out.append(cmd)
+
+    def sync_speed(self):
+        if self.want_speed is not None and self.want_speed != self.speed:
+            self.out.append(f"!TS{self.want_speed};")
+            self.speed = self.want_speed
+
+
+def compile_flow(commands, start=None, absolute=False, check=True, merge_travel=False):
+    # commands: flow text or list of commands. start: (x, y) position before the
+    # flow; needed for absolute (PA) encoding. Returns a CompileResult.
+    if isinstance(commands, str):
+        commands = split_commands(commands)
+    em = _Emitter(start, absolute, merge_travel)
+    for cmd in commands:
+        mnemonic, args = _parse(cmd)
+        if mnemonic == "PR" and args:
+            em.add_move(args[0], args[1] if len(args) > 1 else 0)
+        elif mnemonic in ("PU", "PD") and not args:
+            em.set_pen(mnemonic == "PD")
+        elif mnemonic == "!TS" and len(args) == 1:
+            em.set_speed(args[0])
+        elif mnemonic == "PA" and len(args) >= 2 and em.pos is not None:
+            em.add_move(args[0] - em.pos[0] - (em.move[0] if em.move else 0),
+                        args[1] - em.pos[1] - (em.move[1] if em.move else 0))
+        elif mnemonic == "IN":
+            em.barrier("IN;")
+            em.pen = None  # state after initialisation is the machine's
+            em.speed = em.want_speed = None
+            em.pos = None
+        else:
+            normalized = cmd.strip()
+            em.barrier(normalized if mnemonic is None else mnemonic + ",".join(map(str, args)) + ";")
+            if mnemonic == "PA":
+                em.pos = list(args[:2]) if len(args) >= 2 else None
+    em.flush()
+    em.sync_speed()
+    result = CompileResult(list(commands), em.out)
+    if check:
+        verify(commands, result.commands, start, path=not merge_travel)
+    return result
+
+
+def simulate(commands, start=(0, 0)):
+    # Replay commands on a model of the machine. Returns the final position and
+    # the pen-down geometry as a list of events: ("stroke", [points]) with
+    # collinear points removed, ("circle", center, radius) and ("dot", point).
+    x, y = start[:2] if start is not None else (0, 0)
+    pen = False
+    events = []
+    stroke = None
+
+    def end_stroke():
+        if stroke is None:
+            return
+        events.append(("stroke", stroke) if len(stroke) > 1 else ("dot", stroke[0]))
+
+    for cmd in commands:
+        mnemonic, args = _parse(cmd)
+        if mnemonic in ("PR", "PA") and args:
+            if mnemonic == "PR":
+                nx, ny = x + args[0], y + (args[1] if len(args) > 1 else 0)
+            elif len(args) >= 2:
+                nx, ny = args[0], args[1]
+            else:
+                continue
+            if (nx, ny) != (x, y) and pen:
+                if len(stroke) > 1 and _same_direction(
+                        (stroke[-1][0] - stroke[-2][0], stroke[-1][1] - stroke[-2][1]), (nx - x, ny - y)):
+                    stroke[-1] = (nx, ny)
+                else:
+                    stroke.append((nx, ny))
+            x, y = nx, ny
+        elif mnemonic == "PD" and not args:
+            if not pen:
+                pen = True
+                stroke = [(x, y)]
+        elif mnemonic == "PU" and not args:
+            if pen:
+                end_stroke()
+                stroke = None
+            pen = False
+        elif mnemonic == "CI" and args:
+            events.append(("circle", (x, y), args[0]))
+        elif mnemonic == "IN":
+            end_stroke()
+            stroke = None
+            pen = False
+    if pen:
+        end_stroke()
+    return (x, y), events
+
+
+def head_path(commands, start=(0, 0)):
+    # Corners of the path the head travels, pen up or down: zero-length moves
+    # are dropped and moves that go on in the same direction are joined. IN
+    # appears as None (the machine's own way home).
+    x, y = start[:2] if start is not None else (0, 0)
+    path = [(x, y)]
+    for cmd in commands:
+        mnemonic, args = _parse(cmd)
+        if mnemonic == "IN":
+            x, y = 0, 0
+            path += [None, (x, y)]
+            continue
+        if mnemonic == "PR" and args:
+            nx, ny = x + args[0], y + (args[1] if len(args) > 1 else 0)
+        elif mnemonic == "PA" and len(args) >= 2:
+            nx, ny = args[0], args[1]
+        else:
+            continue
+        if (nx, ny) == (x, y):
+            continue
+        if len(path) > 1 and path[-2] is not None and _same_direction(
+                (x - path[-2][0], y - path[-2][1]), (nx - x, ny - y)):
+            path[-1] = (nx, ny)
+        else:
+            path.append((nx, ny))
+        x, y = nx, ny
+    return path
+
+
+def verify(source, compiled, start=None, path=False):
+    # Raise CompileError unless both command lists end at the same position
+    # and draw the same pen-down geometry; with path=True the head also has
+    # to travel the same path.
+    origin = start if start is not None else (0, 0)
+    want_pos, want = simulate(source, origin)
+    got_pos, got = simulate(compiled, origin)
+    if want_pos != got_pos:
+        raise CompileError(f"Compiled flow ends at {got_pos}, expected {want_pos}")
+    if path:
+        want_path, got_path = head_path(source, origin), head_path(compiled, origin)
+        if want_path != got_path:
+            k = next((k for k, (a, b) in enumerate(zip(want_path, got_path)) if a != b),
+                     min(len(want_path), len(got_path)))
+            raise CompileError(f"Head path differs at corner {k}: "
+                               f"{got_path[k] if k < len(got_path) else 'end'} instead of "
+                               f"{want_path[k] if k < len(want_path) else 'end'}")
+    if want != got:
+        for k, (a, b) in enumerate(zip(want, got)):
+            if a != b:
+                raise CompileError(f"Pen-down geometry differs at element {k}: {b} instead of {a}")
+        raise CompileError(f"Compiled flow draws {len(got)} elements, expected {len(want)}")
+    return True
@@ -1,9 +1,12 @@
 import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox
-import serial
-import serial.tools.list_ports
+from tkinter import ttk, scrolledtext, messagebox, filedialog
 import threading
-import re
+import queue
+
+from hpgl import split_commands
+from protomat import DEFAULT_JOURNAL, JobRejected, NotConnectedError, ProtomatSession, list_ports
+from terminal_log import TerminalLog
+from workspace_plot import WorkspacePlot
 
 class PlotterController(tk.Tk):
     PROMPT = "> "
@@ -12,20 +15,22 @@ class PlotterController(tk.Tk):
         super().__init__()
         self.title("LPKF Protomat 91s/VS Controller")
         self.geometry("1200x800")
-        self.serial_port = None
-        self.serial_thread = None
-        self.stop_thread = False
+        self.gui_queue = queue.Queue()  # Callbacks aus Worker-Threads für den Tk-Thread
+        # Maschinen-Sitzung ohne GUI; ihre Callbacks laufen über call_in_gui im Tk-Thread
+        self.session = ProtomatSession(on_log=self.log_terminal, on_change=self.update_plot,
+                                       dispatch=self.call_in_gui,
+                                       schedule=lambda delay, func: self.after(int(delay * 1000), func))
+        self.session.journal_path = DEFAULT_JOURNAL  # Jobs werden protokolliert und sind fortsetzbar
+        self.lmd_job = None  # geladene LMD- oder Bohrdatei
+        self.preview = None  # JobPreview im Vorschaufenster, falls offen
+        self.preview_base = None  # session.sent beim Start des Jobs in der Vorschau
         self.emulation_mode = tk.BooleanVar(value=False)
-        self.current_position = [0, 0, 0]  # [x, y, z] in µm für Emulation oder letzten bekannten Wert
-        self.pen_down = False
-        self.motor_enabled = False
-        self.workspace_x = 45000  # 450mm in µm, Default
-        self.workspace_y = 22000  # 220mm in µm, Default
 
         self.set_dark_mode()
         self.create_widgets()
         self.refresh_ports()
         self.update_plot()
+        self.poll_gui_queue()
 
     def set_dark_mode(self):
         # Set dark colors for the main window and widgets
@@ -90,6 +95,18 @@ class PlotterController(tk.Tk):
         self.terminal = tk.Text(terminal_frame, height=15, wrap="word", undo=False, autoseparators=False,
                                 bg="#181818", fg="#e0e0e0", insertbackground="#e0e0e0", state="disabled")
         self.terminal.pack(fill="both", expand=True, padx=5, pady=(5,0))
+        self.terminal_log = TerminalLog(self.terminal, max_lines=5000)
+        self.terminal_log.start()
+
+        log_frame = ttk.Frame(terminal_frame)
+        log_frame.pack(fill="x", padx=5, pady=(2,0))
+        self.pause_scroll_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(log_frame, text="Pause autoscroll", variable=self.pause_scroll_var,
+                        command=self.on_pause_scroll_toggle).pack(side="left", padx=(0,10))
+        self.spill_log_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(log_frame, text="Save old lines to terminal.log", variable=self.spill_log_var,
+                        command=self.on_spill_log_toggle).pack(side="left", padx=(0,10))
+        ttk.Button(log_frame, text="Clear", command=lambda: self.terminal_log.clear()).pack(side="left")
 
         # XY-Move Frame unter Terminal
         move_frame = ttk.LabelFrame(terminal_frame, text="Relative Movement (PRx,y;)")
@@ -132,11 +149,11 @@ class PlotterController(tk.Tk):
 
         def move_abs_x():
             x_um = self.abs_x_var.get() * 100
-            y_um = self.current_position[1]
+            y_um = self.session.position[1]
             self.move_absolute_checked(x_um, y_um)
 
         def move_abs_y():
-            x_um = self.current_position[0]
+            x_um = self.session.position[0]
             y_um = self.abs_y_var.get() * 100
             self.move_absolute_checked(x_um, y_um)
 
@@ -164,9 +181,8 @@ class PlotterController(tk.Tk):
         ws_y_entry.grid(row=0, column=3, padx=2, pady=2)
 
         def set_workspace():
-            self.workspace_x = self.ws_x_var.get() * 100
-            self.workspace_y = self.ws_y_var.get() * 100
-            self.update_plot()
+            self.session.set_workspace(self.ws_x_var.get() * 100, self.ws_y_var.get() * 100)
+            self.plot.set_workspace(self.session.workspace_x, self.session.workspace_y)
         ttk.Button(ws_frame, text="Set", command=set_workspace).grid(row=0, column=4, padx=5, pady=2)
 
         # Visualisierung
@@ -174,6 +190,8 @@ class PlotterController(tk.Tk):
         vis_frame.grid(row=0, column=4, rowspan=5, padx=20, pady=2, sticky="ns")
         self.canvas = tk.Canvas(vis_frame, width=200, height=150, bg="#181818", highlightthickness=1, highlightbackground="#444")
         self.canvas.grid(row=0, column=0, padx=5, pady=5)
+        self.plot = WorkspacePlot(self.canvas, self.session.workspace_x, self.session.workspace_y)
+        ttk.Button(vis_frame, text="Clear Trail", command=lambda: self.plot.clear_trail()).grid(row=1, column=0, padx=5, pady=(0,5))
 
         # Legende
         legend_frame = ttk.Frame(vis_frame)
@@ -206,7 +224,7 @@ class PlotterController(tk.Tk):
         ttk.Button(cmd_frame, text="Enable Motor (!EM1;)", command=lambda: self.send_command("!EM1;")).grid(row=0, column=3, padx=5, pady=2)
         ttk.Button(cmd_frame, text="Disable Motor (!EM0;)", command=lambda: self.send_command("!EM0;")).grid(row=0, column=4, padx=5, pady=2)
         ttk.Button(cmd_frame, text="Query Position (!ON0;)", command=lambda: self.send_command("!ON0;")).grid(row=0, column=5, padx=5, pady=2)
-        # ttk.Button(cmd_frame, text="Query Position (!ON0;)", command=lambda: self.query_and_update_position()).grid(row=0, column=5, padx=5, pady=2)
+        # ttk.Button(cmd_frame, text="Query Position (!ON0;)", command=lambda: self.session.sync_position()).grid(row=0, column=5, padx=5, pady=2)
 
         # Command Flow Frame
         flow_frame = ttk.LabelFrame(self, text="Command Flow Example")
@@ -215,10 +233,53 @@ class PlotterController(tk.Tk):
         self.flow_text = tk.Text(flow_frame, height=4, width=80, bg="#222222", fg="#e0e0e0", insertbackground="#e0e0e0")
         self.flow_text.insert("1.0", "!TS500;PD;PR5000,0;PR0,5000;PR-5000,0;PR0,-5000;PU;!TS0;")
         self.flow_text.pack(side="left", fill="x", expand=True, padx=5, pady=5)
+        ttk.Label(flow_frame, text="Window:").pack(side="left", padx=(5,0), pady=5)
+        self.window_var = tk.IntVar(value=8)
+        ttk.Spinbox(flow_frame, from_=1, to=64, increment=1, textvariable=self.window_var, width=4).pack(side="left", padx=5, pady=5)
+        self.compile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(flow_frame, text="Compile", variable=self.compile_var).pack(side="left", padx=5, pady=5)
+        self.absolute_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(flow_frame, text="PA moves", variable=self.absolute_var).pack(side="left", padx=5, pady=5)
+        ttk.Button(flow_frame, text="Estimate", command=self.estimate_flow).pack(side="left", padx=5, pady=5)
+        ttk.Button(flow_frame, text="Preview", command=self.preview_flow).pack(side="left", padx=5, pady=5)
         ttk.Button(flow_frame, text="Execute Flow", command=self.execute_flow).pack(side="left", padx=5, pady=5)
+        ttk.Button(flow_frame, text="Stop Job", command=self.stop_job).pack(side="left", padx=5, pady=5)
+
+        # LMD Job Frame
+        lmd_frame = ttk.LabelFrame(self, text="LMD Job (CircuitCAM) / Drill File")
+        lmd_frame.pack(fill="x", padx=10, pady=5)
+        ttk.Button(lmd_frame, text="Load LMD...", command=self.load_lmd).pack(side="left", padx=5, pady=5)
+        ttk.Button(lmd_frame, text="Import Drill...", command=self.import_drill).pack(side="left", padx=5, pady=5)
+        ttk.Label(lmd_frame, text="Phase:").pack(side="left", padx=(5,0), pady=5)
+        self.phase_var = tk.StringVar()
+        self.phase_combo = ttk.Combobox(lmd_frame, textvariable=self.phase_var, state="readonly", width=32)
+        self.phase_combo.pack(side="left", padx=5, pady=5)
+        self.phase_combo.bind("<<ComboboxSelected>>", self.on_phase_selected)
+        self.optimize_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(lmd_frame, text="Optimize travel", variable=self.optimize_var).pack(side="left", padx=5, pady=5)
+        ttk.Label(lmd_frame, text="Origin [mm]:").pack(side="left", padx=(5,0), pady=5)
+        self.origin_x_var = tk.DoubleVar(value=0)
+        ttk.Entry(lmd_frame, textvariable=self.origin_x_var, width=5).pack(side="left", padx=2, pady=5)
+        self.origin_y_var = tk.DoubleVar(value=0)
+        ttk.Entry(lmd_frame, textvariable=self.origin_y_var, width=5).pack(side="left", padx=2, pady=5)
+        ttk.Button(lmd_frame, text="Preview Phase", command=lambda: self.stream_phase(preview=True)).pack(side="left", padx=5, pady=5)
+        ttk.Button(lmd_frame, text="Stream Phase", command=self.stream_phase).pack(side="left", padx=5, pady=5)
+        self.phase_info_var = tk.StringVar(value="No file loaded")
+        ttk.Label(lmd_frame, textvariable=self.phase_info_var).pack(side="left", padx=5, pady=5)
+
+        # Link Statistics Frame
+        stats_frame = ttk.LabelFrame(self, text="Link Statistics")
+        stats_frame.pack(fill="x", padx=10, pady=5)
+        self.record_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(stats_frame, text="Record", variable=self.record_var,
+                        command=self.on_record_toggle).pack(side="left", padx=5, pady=5)
+        ttk.Button(stats_frame, text="Export...", command=self.export_stats).pack(side="left", padx=5, pady=5)
+        self.stats_var = tk.StringVar(value="Off")
+        ttk.Label(stats_frame, textvariable=self.stats_var, font=("Courier", 9)).pack(side="left", padx=5, pady=5)
+        self.stats_sample = None  # (time, bytes_out, bytes_in) der letzten Anzeige
 
     def refresh_ports(self):
-        ports = [port.device for port in serial.tools.list_ports.comports()]
+        ports = list_ports()
         self.port_combo["values"] = ports
         if ports:
             self.port_combo.current(0)
@@ -227,7 +288,7 @@ class PlotterController(tk.Tk):
         if self.emulation_mode.get():
             self.log_terminal("Emulation mode active. No serial connection needed.\n")
             return
-        if self.serial_port and self.serial_port.is_open:
+        if self.session.connected:
             self.disconnect_serial()
         else:
             self.connect_serial()
@@ -237,244 +298,298 @@ class PlotterController(tk.Tk):
             self.log_terminal("Emulation mode active. No serial connection needed.\n")
             return
         try:
-            port = self.port_var.get()
-            baud = int(self.baud_var.get())
-            databits = int(self.databits_var.get())
-            parity = {"None": serial.PARITY_NONE, "Even": serial.PARITY_EVEN, "Odd": serial.PARITY_ODD}[self.parity_var.get()]
-            stopbits = float(self.stopbits_var.get())
-            flow = self.flow_var.get()
-            self.serial_port = serial.Serial(
-                port=port,
-                baudrate=baud,
-                bytesize=databits,
-                parity=parity,
-                stopbits=stopbits,
-                timeout=0.1,
-                rtscts=(flow == "RTS/CTS"),
-                dsrdtr=False,
-                xonxoff=False
-            )
+            self.session.connect(self.port_var.get(), int(self.baud_var.get()), int(self.databits_var.get()),
+                                 self.parity_var.get(), float(self.stopbits_var.get()),
+                                 rtscts=(self.flow_var.get() == "RTS/CTS"))
             self.connect_btn.config(text="Disconnect")
-            self.log_terminal(f"Connected to {port}\n")
-            self.stop_thread = False
-            self.serial_thread = threading.Thread(target=self.read_serial, daemon=True)
-            self.serial_thread.start()
         except Exception as e:
             messagebox.showerror("Connection Error", str(e))
+            return
+        self.offer_resume()
+
+    def offer_resume(self):
+        # Unterbrochenen Job nach dem Verbinden fortsetzen
+        point = self.session.pending_resume()
+        if point is None:
+            return
+        answer = messagebox.askyesnocancel(
+            "Resume Job",
+            f"An interrupted job was found:\n{point.summary()}.\n\n"
+            "Yes: continue after the last acknowledged command\n"
+            "No: discard the job\n"
+            "Cancel: decide later (asked again on the next connect)")
+        if answer is None:
+            return
+        if not answer:
+            self.session.discard_journal()
+            self.log_terminal("Interrupted job discarded.\n")
+            return
+        rehome = messagebox.askyesno(
+            "Resume Job",
+            "Home the machine (IN;) before travelling back?\n\n"
+            "Choose No if the machine kept its position; it is checked with !ON0;.")
+        self.machine(self.session.resume_job, point, rehome=rehome, window=self.window_var.get())
 
     def disconnect_serial(self):
-        self.stop_thread = True
-        if self.serial_port:
-            self.serial_port.close()
-            self.serial_port = None
+        self.session.disconnect()
         self.connect_btn.config(text="Connect")
-        self.log_terminal("Disconnected\n")
 
     def on_emulation_toggle(self):
         if self.emulation_mode.get():
             self.disconnect_serial()
+            self.session.emulation = True
             self.connect_btn.config(state="disabled")
             self.log_terminal("Emulation mode enabled.\n")
         else:
+            self.session.emulation = False
             self.connect_btn.config(state="normal")
             self.log_terminal("Emulation mode disabled.\n")
 
-    def read_serial(self):
-        # Robust reader that accumulates fragments and extracts full coordinate triplets.
-        pat_p = re.compile(r'P\s*(-?\d+),\s*(-?\d+),\s*(-?\d+)')
-        pat_coords = re.compile(r'(?<!\d)(-?\d+),\s*(-?\d+),\s*(-?\d+)(?!\d)')
-        while not self.stop_thread and self.serial_port and self.serial_port.is_open:
+    def call_in_gui(self, func, *args):
+        # Thread-sicher: func wird im Tk-Thread über poll_gui_queue ausgeführt
+        self.gui_queue.put((func, args))
+
+    def poll_gui_queue(self):
+        while True:
             try:
-                data = self.serial_port.readline()
-                if data:
-                    self.log_terminal(f"Received: {data.decode(errors='replace')}")
-                    if data.startswith(b"P"):
-                        try:
-                            coords = data[1:].split(b"C")[0].split(b",")
-                            self.current_position = [int(coords[0]), int(coords[1]), int(coords[2])]
-                            print(f"Updated position: X={self.current_position[0]} Y={self.current_position[1]} Z={self.current_position[2]}")
-                            self.update_plot()
-                        except Exception:
-                            pass
-            except Exception:
-                pass
-
-    def send_command(self, cmd, update_position=False):
-        if self.emulation_mode.get():
-            self.log_terminal(f"Sent: {cmd}\n")
-            # Emulation: Status-Tracking für Pen/Motor
-            if cmd.strip().upper() == "PU;":
-                self.pen_down = False
-                self.update_plot()
-            elif cmd.strip().upper() == "PD;":
-                self.pen_down = True
-                self.update_plot()
-            elif cmd.strip().upper() == "!EM1;":
-                self.motor_enabled = True
-                self.update_plot()
-            elif cmd.strip().upper() == "!EM0;":
-                self.motor_enabled = False
-                self.update_plot()
-            # Emulation: Position berechnen, wenn PR-Befehl
-            if cmd.startswith("PR"):
-                try:
-                    parts = cmd[2:].split(";")[0].split(",")
-                    dx = int(parts[0])
-                    dy = int(parts[1]) if len(parts) > 1 else 0
-                    new_x = self.current_position[0] + dx
-                    new_y = self.current_position[1] + dy
-                    if new_x < 0 or new_y < 0 or new_x > self.workspace_x or new_y > self.workspace_y:
-                        self.log_terminal("Emulation: Movement would go outside workspace! Command not executed.\n")
-                    else:
-                        self.current_position[0] = new_x
-                        self.current_position[1] = new_y
-                        self.log_terminal(f"Emulation: New position X={new_x} Y={new_y}\n")
-                        self.update_plot()
-                except Exception:
-                    pass
-            self.log_terminal("Received: Emulation, no communication\n")
-            return
-        if not self.serial_port or not self.serial_port.is_open:
-            messagebox.showwarning("Not Connected", "Please connect to a serial port first or enable Emulation Mode.")
-            return
+                func, args = self.gui_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                self.log_terminal(f"GUI callback failed: {e}\n")
+        self.after(20, self.poll_gui_queue)
+
+    def machine(self, method, *args, **kwargs):
+        # Ruft die Sitzung auf und zeigt Fehler als Dialog
         try:
-            self.serial_port.write(cmd.encode())
-            self.log_terminal(f"Sent: {cmd}\n")
-            # Status-Tracking für Pen/Motor
-            if cmd.strip().upper() == "PU;":
-                self.pen_down = False
-                self.update_plot()
-            elif cmd.strip().upper() == "PD;":
-                self.pen_down = True
-                self.update_plot()
-            elif cmd.strip().upper() == "!EM1;":
-                self.motor_enabled = True
-                self.update_plot()
-            elif cmd.strip().upper() == "!EM0;":
-                self.motor_enabled = False
-                self.update_plot()
-            if update_position:
-                pass
-                self.after(200, self.query_and_update_position)
+            return method(*args, **kwargs)
+        except NotConnectedError as e:
+            messagebox.showwarning("Not Connected", str(e))
+        except JobRejected as e:
+            messagebox.showerror("Job Rejected", str(e))
         except Exception as e:
             messagebox.showerror("Send Error", str(e))
+        return None
 
-    def query_and_update_position(self):
-        if self.emulation_mode.get():
-            return
-        if not self.serial_port or not self.serial_port.is_open:
-            return
-        try:
-            self.serial_port.reset_input_buffer()
-            self.serial_port.write(b"!ON0;\n")
-            data = self.serial_port.readline().decode(errors="replace")
-            if data.startswith("P"):
-                try:
-                    coords = data[1:].split("C")[0].split(",")
-                    self.current_position = [int(coords[0]), int(coords[1]), int(coords[2])]
-                    print(f"Updated position: X={self.current_position[0]} Y={self.current_position[1]} Z={self.current_position[2]}")
-                    self.update_plot()
-                except Exception:
-                    pass
-        except Exception:
-            pass
+    def send_command(self, cmd):
+        self.machine(self.session.send_command, cmd)
 
     def move_relative_checked(self, dx, dy):
-        if self.emulation_mode.get():
-            new_x = self.current_position[0] + dx
-            new_y = self.current_position[1] + dy
-            if new_x < 0 or new_y < 0 or new_x > self.workspace_x or new_y > self.workspace_y:
-                self.log_terminal("Emulation: Movement would go outside workspace! Command not executed.\n")
-                return
-            self.send_command(f"PR{dx},{dy};", update_position=True)
-            self.current_position[0] = new_x
-            self.current_position[1] = new_y
-            self.update_plot()
-            return
-        self.query_and_update_position()
-        new_x = self.current_position[0] + dx
-        new_y = self.current_position[1] + dy
-        if new_x < 0 or new_y < 0 or new_x > self.workspace_x or new_y > self.workspace_y:
-            self.log_terminal("Movement would go outside workspace! Command not executed.\n")
-            return
-        self.send_command(f"PR{dx},{dy};", update_position=True)
-        self.current_position[0] = new_x
-        self.current_position[1] = new_y
-        self.update_plot()
+        self.machine(self.session.move_relative_checked, dx, dy)
 
     def move_absolute_checked(self, x_um, y_um):
-        # Prüfe Workspace
-        if x_um < 0 or y_um < 0 or x_um > self.workspace_x or y_um > self.workspace_y:
-            self.log_terminal("Target position outside workspace! Command not executed.\n")
-            return
-        dx = x_um - self.current_position[0]
-        dy = y_um - self.current_position[1]
-        if self.emulation_mode.get():
-            self.send_command(f"PR{dx},{dy};", update_position=True)
-            self.current_position[0] = x_um
-            self.current_position[1] = y_um
-            self.update_plot()
-            return
-        self.query_and_update_position()
-        dx = x_um - self.current_position[0]
-        dy = y_um - self.current_position[1]
-        if self.current_position[0] + dx < 0 or self.current_position[1] + dy < 0 or self.current_position[0] + dx > self.workspace_x or self.current_position[1] + dy > self.workspace_y:
-            self.log_terminal("Target position outside workspace! Command not executed.\n")
-            return
-        self.send_command(f"PR{dx},{dy};", update_position=True)
-        self.current_position[0] += dx
-        self.current_position[1] += dy
-        self.update_plot()
+        self.machine(self.session.move_absolute_checked, x_um, y_um)
 
     def on_input_send(self, event=None):
         cmd = self.input_var.get().strip()
         if cmd:
             if not cmd.endswith(";"):
                 cmd += ";"
-            self.send_command(cmd)
+            if self.compile_var.get():
+                commands = self.compile_commands(split_commands(cmd))
+                cmd = "".join(commands) if commands else None
+            if cmd:
+                self.send_command(cmd)
         self.input_var.set("")
         self.input_entry.focus_set()
 
     def log_terminal(self, text):
-        self.terminal.config(state="normal")
-        if not text.endswith("\n"):
-            text += "\n"
-        self.terminal.insert("end", text)
-        self.terminal.see("end")
-        self.terminal.config(state="disabled")
+        # Thread-sicher; die Ausgabe erfolgt gesammelt im Tk-Thread
+        self.terminal_log.write(text)
+
+    def on_pause_scroll_toggle(self):
+        self.terminal_log.autoscroll = not self.pause_scroll_var.get()
+
+    def on_spill_log_toggle(self):
+        self.terminal_log.set_spill_file("terminal.log" if self.spill_log_var.get() else None)
 
     def execute_flow(self):
         flow = self.flow_text.get("1.0", "end").strip()
-        # Sende den gesamten Flow als einen Befehl
-        if flow:
-            # Stelle sicher, dass der letzte Befehl mit ; endet
-            if not flow.endswith(";"):
-                flow += ";"
-            self.send_command(flow)
+        commands = split_commands(flow)
+        if self.compile_var.get():
+            commands = self.compile_commands(commands)
+        if commands:
+            self.session.log_estimate(commands, self.baud_var.get())
+        self.start_job(commands)
+
+    def estimate_flow(self):
+        flow = self.flow_text.get("1.0", "end").strip()
+        commands = split_commands(flow)
+        if self.compile_var.get():
+            commands = self.compile_commands(commands)
+        if commands:
+            self.session.log_estimate(commands, self.baud_var.get())
+
+    def preview_flow(self):
+        commands = split_commands(self.flow_text.get("1.0", "end").strip())
+        if self.compile_var.get():
+            commands = self.compile_commands(commands)
+        if commands:
+            self.show_preview(commands, list(self.session.position))
+
+    def show_preview(self, commands, start):
+        # Vorschaufenster öffnen bzw. nach vorne holen und den Job laden
+        if self.preview is None:
+            window = tk.Toplevel(self)
+            window.title("Job Preview")
+            window.geometry("900x650")
+            canvas = tk.Canvas(window, bg="#181818", highlightthickness=0)
+            canvas.pack(fill="both", expand=True)
+            ttk.Label(window, text="Drag: pan   Wheel: zoom   Double-click: fit").pack(side="left", padx=5, pady=2)
+            from job_preview import JobPreview  # braucht numpy
+            self.preview = JobPreview(canvas)
+            ttk.Button(window, text="Fit", command=self.preview.fit).pack(side="right", padx=5, pady=2)
+            window.protocol("WM_DELETE_WINDOW", lambda: self.close_preview(window))
+            window.update_idletasks()  # Canvasgröße für das erste Einpassen
+        else:
+            self.preview.canvas.winfo_toplevel().lift()
+        self.preview_base = None
+        self.preview.load(commands, start)
+
+    def close_preview(self, window):
+        self.preview = None
+        self.preview_base = None
+        window.destroy()
+
+    def compile_commands(self, commands):
+        return self.session.compile_commands(commands, absolute=self.absolute_var.get())
+
+    def start_job(self, commands):
+        start = list(self.session.position)
+        sent = self.session.sent
+        self.machine(self.session.start_job, commands, window=self.window_var.get())
+        if self.preview is not None and self.session.streamer is not None:
+            # Laufender Job in der Vorschau, Fortschritt über update_plot
+            self.preview.load(commands, start)
+            self.preview_base = sent
+
+    def load_lmd(self):
+        path = filedialog.askopenfilename(title="Load LMD file",
+                                          filetypes=[("LPKF LMD", "*.lmd *.LMD"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            from lmd import read_lmd  # braucht numpy, nur beim Laden importieren
+            job = read_lmd(path)
+        except Exception as e:
+            messagebox.showerror("LMD Error", str(e))
+            return
+        self.show_job(job, path)
+
+    def import_drill(self):
+        path = filedialog.askopenfilename(title="Import drill file",
+                                          filetypes=[("Excellon", "*.drl *.DRL *.drd *.xln *.exc *.txt"),
+                                                     ("HPGL (40 units/mm)", "*.plt *.hpgl *.hpg"),
+                                                     ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            from drill_import import read_drills
+            job = read_drills(path)
+        except Exception as e:
+            messagebox.showerror("Drill Import Error", str(e))
+            return
+        self.log_terminal(f"{job.summary()}\n")
+        self.show_job(job, path)
+
+    def show_job(self, job, path):
+        # Phasen ins Auswahlfeld; Bohrdateien: je Werkzeug eine Phase, zuletzt alle Werkzeuge
+        self.lmd_job = job
+        titles = [phase.title for phase in self.lmd_job.phases]
+        self.phase_combo["values"] = titles
+        self.log_terminal(f"Loaded {path}: {len(titles)} phases\n")
+        for phase in self.lmd_job.phases:
+            self.log_terminal(f"  {phase.summary()}\n")
+        if titles:
+            self.phase_combo.current(0)
+            self.on_phase_selected()
+
+    def on_phase_selected(self, event=None):
+        phase = self.lmd_job.phases[self.phase_combo.current()]
+        tools = ", ".join(tool.name for tool in phase.tools)
+        info = (f"{phase.polylines} paths, {phase.segments} segments, "
+                f"{len(phase.circles)} circles, {len(phase.drills)} drills ({tools})")
+        # Schätzung aus den Phasen-Arrays, ohne Befehle zu erzeugen (Reihenfolge wie in der Datei)
+        offset = (round(self.origin_x_var.get() * 100), round(self.origin_y_var.get() * 100))
+        estimate = self.session.estimate_phase(phase, offset=offset, baudrate=self.baud_var.get())
+        if estimate:
+            info += f", est. {estimate.total / 60:.1f} min unoptimized"
+        self.phase_info_var.set(info)
+
+    def stream_phase(self, preview=False):
+        if not self.lmd_job or self.phase_combo.current() < 0:
+            messagebox.showwarning("No Job", "Please load an LMD or drill file first.")
+            return
+        phase = self.lmd_job.phases[self.phase_combo.current()]
+        # Platinen-Nullpunkt aus "Origin" (mm), Start an der aktuellen Kopfposition
+        offset = (round(self.origin_x_var.get() * 100), round(self.origin_y_var.get() * 100))
+        start = list(self.session.position)
+        self.log_terminal(f"Phase {phase.title}\n")
+        threading.Thread(target=self.prepare_phase, args=(phase, start, self.optimize_var.get(), self.compile_var.get(),
+                                                          self.absolute_var.get(), self.baud_var.get(), preview, offset),
+                         daemon=True).start()
+
+    def prepare_phase(self, phase, start, optimize, compile_=False, absolute=False, baudrate=9600, preview=False,
+                      offset=(0, 0)):
+        # Läuft im Worker-Thread, damit die Optimierung die GUI nicht blockiert
+        commands = self.session.phase_commands(phase, start, optimize, compile_, absolute, offset)
+        if commands:
+            self.session.log_estimate(commands, baudrate)
+        if preview:
+            if commands:
+                self.call_in_gui(self.show_preview, commands, start)
+            return
+        self.call_in_gui(self.start_job, commands)
+
+    def stop_job(self):
+        self.session.stop_job()
+
+    def on_record_toggle(self):
+        self.session.set_recording(self.record_var.get())
+        self.stats_sample = None
+        if self.record_var.get():
+            self.refresh_stats()
+
+    def refresh_stats(self):
+        # Läuft alle 500 ms, solange aufgezeichnet wird
+        stats = self.session.stats
+        if not self.record_var.get() or stats is None:
+            return
+        sample = (stats.elapsed, stats.bytes_out, stats.bytes_in)
+        now = ""
+        if self.stats_sample and sample[0] > self.stats_sample[0]:
+            dt = sample[0] - self.stats_sample[0]
+            out, inn = (sample[1] - self.stats_sample[1]) / dt, (sample[2] - self.stats_sample[2]) / dt
+            if out >= 0 and inn >= 0:  # sonst neue Aufzeichnung (Job-Start)
+                now = f"now: out {out:.0f} B/s, in {inn:.0f} B/s\n"
+        self.stats_sample = sample
+        self.stats_var.set(now + stats.summary() + "".join("\n" + line for line in stats.latency_lines()))
+        self.after(500, self.refresh_stats)
+
+    def export_stats(self):
+        if self.session.stats is None:
+            messagebox.showwarning("No Statistics", "Enable \"Record\" and run a job first.")
+            return
+        path = filedialog.asksaveasfilename(title="Export link statistics", defaultextension=".csv",
+                                            filetypes=[("CSV (per command)", "*.csv"), ("JSON (summary)", "*.json")])
+        if not path:
+            return
+        try:
+            self.session.stats.export(path)
+        except OSError as e:
+            messagebox.showerror("Export Error", str(e))
+            return
+        self.log_terminal(f"Link statistics saved to {path}\n")
 
     def update_plot(self):
-        # Zeichnet das Rechteck und die aktuelle Position
-        self.canvas.delete("all")
-        w = int(self.canvas["width"])
-        h = int(self.canvas["height"])
-        max_x = self.workspace_x
-        max_y = self.workspace_y
-        # Rechteck Workspace
-        self.canvas.create_rectangle(10, 10, w-10, h-10, outline="#e0e0e0")
-        # Marker für aktuelle Position
-        if max_x > 0 and max_y > 0:
-            px = 10 + (w-20) * self.current_position[0] / max_x
-            py = 10 + (h-20) * (1 - self.current_position[1] / max_y)
-            # Farbe je nach Status
-            color = "#44ff44"  # Grün = Pen Up
-            if self.motor_enabled:
-                color = "#ff4444"  # Rot = Motor an
-            elif self.pen_down:
-                color = "#ffaa00"  # Orange = Pen Down
-            self.canvas.create_oval(px-5, py-5, px+5, py+5, fill=color, outline=color)
+        # Billig: merkt sich nur den Zustand, gezeichnet wird höchstens einmal pro Frame
+        self.plot.update(self.session.position, self.session.pen_down, self.session.motor_enabled)
+        if self.preview is not None and self.preview_base is not None:
+            self.preview.set_progress(self.session.sent - self.preview_base, self.session.position)
 
     def on_closing(self):
-        self.stop_thread = True
         self.disconnect_serial()  # Automatisch trennen beim Schließen
         self.destroy()
 
@@ -0,0 +1,275 @@
+# Drill file import: Excellon (.drl, .xln, ...) and plain HPGL (.plt, .hpgl).
+# Hits are converted to machine units (1/100 mm) and returned as an LmdJob,
+# so everything that works on LMD phases (travel optimizer, preview, Stream
+# Phase, send --phase) works on drill files too:
+#   Drilling/T1            one phase per tool (smallest first), streamed
+#                          between tool changes
+#   Drilling/all tools     last, only when asked for: every hit grouped by
+#                          tool, with no stop for the tool changes
+# Within a tool, hits closer than `tolerance` to an earlier hit are dropped.
+# A spatial hash with cells of that size keeps this linear: each hit is
+# only compared with the hits already kept in its own and the 8 neighbouring
+# cells.
+#
+# Excellon: header between M48 and % (or M95) with INCH/METRIC[,LZ|TZ][,000.000]
+# and T<n>C<diameter> tool definitions; in the body T<n> selects a tool and
+# X/Y lines are hits (modal, G90/G91, R<n> repeats). Numbers without a
+# decimal point use the format given in the header or in a ;FILE_FORMAT=i:d
+# comment (default 2.4 inch, 3.3 metric). Routed slots (G85, G00/G01 mode)
+# are counted as ignored.
+# HPGL (only when asked for, other HPGL files are flows in machine units):
+# SP<n> selects tool n, a pen dip (PD then PU without moving) is a hit,
+# pen-down strokes are counted as ignored. Plotter units default to 40 per mm.
+import os
+import re
+
+import numpy as np
+
+from lmd import LmdJob, Phase, Tool
+
+UNITS_PER_MM = 100  # machine units per mm
+EXCELLON_SUFFIXES = (".drl", ".drd", ".xln", ".exc")
+HPGL_SUFFIXES = (".plt", ".hpgl", ".hpg", ".hgl")
+
+_COORD = re.compile(r"([XY])([+-]?[\d.]+)")
+_TOOL = re.compile(r"T(\d+)")
+_DIAMETER = re.compile(r"C([\d.]+)")
+_REPEAT = re.compile(r"R(\d+)")
+_FILE_FORMAT = re.compile(r"FILE_FORMAT\s*=\s*(\d+)\s*:\s*(\d+)")
+_HPGL = re.compile(r"([A-Z]{2})([^A-Z;]*)")
+
+
+class DrillError(Exception):
+    pass
+
+
+class DrillJob(LmdJob):
+    def __init__(self, path, version, tools, hits, hit_tools, ignored=0, tolerance=2):
+        name = os.path.basename(path)
+        super().__init__(version, {"File": name}, [])
+        self.ignored = ignored  # routed slots / pen strokes that are not hits
+        self.read = len(hits)
+        self.removed = 0  # near-duplicate hits
+        # Tool order: smallest diameter first, then by number; tools without hits are dropped
+        used = set(np.unique(hit_tools).tolist())
+        self.tools = sorted((tools.get(n) or Tool(n, "drill", 0.0, f"T{n}") for n in used),
+                            key=lambda t: (t.diameter, t.number))
+        drills, drill_tools = [], []
+        for tool in self.tools:
+            pts = _unique_hits(hits[hit_tools == tool.number], tolerance)
+            self.removed += int((hit_tools == tool.number).sum()) - len(pts)
+            drills.append(pts)
+            drill_tools.append(np.full(len(pts), tool.number, np.int32))
+            phase = Phase("Drilling", f"T{tool.number}", [tool])
+            phase.drills, phase.drill_tools = pts, drill_tools[-1]
+            self.phases.append(phase)
+        every = Phase("Drilling", "all tools", self.tools)
+        if drills:
+            every.drills = np.concatenate(drills)
+            every.drill_tools = np.concatenate(drill_tools)
+        self.phases.append(every)
+
+    @property
+    def hits(self):
+        return len(self.phases[-1].drills)
+
+    def summary(self):
+        text = (f"{self.header['File']} ({self.version}): {self.hits} hits, {len(self.tools)} tools, "
+                f"{self.removed} duplicates removed")
+        return text + (f", {self.ignored} slots/strokes ignored" if self.ignored else "")
+
+
+def read_drills(path, tolerance=2, hpgl_units=40):
+    # tolerance: hits of one tool closer than this (machine units) are merged
+    # hpgl_units: HPGL plotter units per mm
+    with open(path, encoding="latin-1") as f:
+        text = f.read()
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix in HPGL_SUFFIXES or (suffix not in EXCELLON_SUFFIXES and _looks_like_hpgl(text)):
+        return DrillJob(path, "HPGL", *parse_hpgl(text, hpgl_units), tolerance=tolerance)
+    return DrillJob(path, "Excellon", *parse_excellon(text), tolerance=tolerance)
+
+
+def _looks_like_hpgl(text):
+    head = text.lstrip()[:64].upper()
+    return not head.startswith(("M48", "%", ";")) and head[:2] in ("IN", "SP", "PU", "PA", "PD", "DF")
+
+
+def parse_excellon(text):
+    # -> ({number: Tool}, hits (n, 2) int32 in machine units, tool number per hit, ignored)
+    tools = {}
+    xs, ys, ts = [], [], []
+    scale = 2540.0  # machine units per file unit (inch)
+    integer, decimals, zeros = 2, 4, "TZ"
+    fixed_format = False  # set by ,000.000 or FILE_FORMAT; otherwise follows the units
+    header = False
+    absolute = True
+    routing = False
+    tool = 0
+    x = y = 0.0
+    ignored = 0
+
+    def number(value):
+        if "." in value:
+            return float(value)
+        sign = -1 if value.startswith("-") else 1
+        digits = value.lstrip("+-")
+        if zeros == "LZ":  # leading zeros kept, trailing zeros suppressed
+            digits = digits.ljust(integer + decimals, "0")
+        return sign * int(digits) / 10 ** decimals
+
+    for lineno, raw in enumerate(text.splitlines(), 1):
+        line = raw.strip().upper()
+        if not line:
+            continue
+        if line.startswith(";"):
+            m = _FILE_FORMAT.search(line)
+            if m:
+                integer, decimals = int(m.group(1)), int(m.group(2))
+                fixed_format = True
+            continue
+        if line == "M48":
+            header = True
+            continue
+        if line in ("%", "M95"):
+            header = False
+            continue
+        if line in ("M30", "M00"):
+            break
+        if line.startswith(("INCH", "METRIC", "M71", "M72")):
+            inch = line.startswith(("INCH", "M72"))
+            scale = 2540.0 if inch else 100.0
+            parts = line.split(",")
+            for part in parts[1:]:
+                if part in ("LZ", "TZ"):
+                    zeros = part
+                elif "." in part:
+                    integer, decimals = len(part.split(".")[0]), len(part.split(".")[1])
+                    fixed_format = True
+            if not fixed_format:
+                integer, decimals = (2, 4) if inch else (3, 3)
+            continue
+        if line.startswith(("ICI,ON", "G91")):
+            absolute = False
+            continue
+        if line.startswith(("ICI,OFF", "G90")):
+            absolute = True
+            continue
+        if "G85" in line:  # X..Y..G85X..Y.. slot
+            ignored += 1
+            continue
+        if line.startswith(("G00", "G01", "G02", "G03", "M15", "M16", "M17")):
+            routing = line.startswith(("G00", "G01", "G02", "G03", "M15"))
+            if routing and _COORD.search(line):
+                ignored += 1
+            continue
+        if line.startswith("G05"):
+            routing = False
+            line = line[3:]
+            if not line:
+                continue
+        if line.startswith("T"):
+            m = _TOOL.match(line)
+            if not m:
+                continue
+            n = int(m.group(1))
+            d = _DIAMETER.search(line)
+            if d:
+                diameter = round(float(d.group(1)) * scale / UNITS_PER_MM, 4)
+                tools[n] = Tool(n, "drill", diameter, f"T{n} {diameter:.2f} mm")
+            if not header:
+                tool = n
+            continue
+        if header or not (line.startswith(("X", "Y", "R")) or line[:1] == "G" and _COORD.search(line)):
+            continue  # other header lines, M codes, canned cycles
+        coords = _COORD.findall(line)
+        try:
+            values = {axis: number(value) * scale for axis, value in coords}
+        except ValueError:
+            raise DrillError(f"line {lineno}: bad coordinate {raw.strip()!r}")
+        repeat = _REPEAT.match(line)
+        if routing:
+            ignored += 1
+            continue
+        if repeat:
+            # R<n>X<dx>Y<dy>: n more hits, each offset from the previous one
+            dx, dy = values.get("X", 0.0), values.get("Y", 0.0)
+            for _ in range(int(repeat.group(1))):
+                x, y = x + dx, y + dy
+                xs.append(x), ys.append(y), ts.append(tool)
+            continue
+        if absolute:
+            x, y = values.get("X", x), values.get("Y", y)
+        else:
+            x, y = x + values.get("X", 0.0), y + values.get("Y", 0.0)
+        xs.append(x), ys.append(y), ts.append(tool)
+    return tools, _units(xs, ys), np.asarray(ts, np.int32), ignored
+
+
+def parse_hpgl(text, units_per_mm=40):
+    # -> ({number: Tool}, hits (n, 2) int32 in machine units, tool number per hit, ignored)
+    xs, ys, ts = [], [], []
+    x = y = 0.0
+    absolute = True
+    pen = False
+    dip = None  # position of the last pen down, until the pen moves or lifts
+    tool = 0
+    ignored = 0
+    for mnemonic, rest in _HPGL.findall(text.upper()):
+        try:
+            args = [float(a) for a in rest.replace(" ", ",").split(",") if a.strip()]
+        except ValueError:
+            raise DrillError(f"{mnemonic}{rest.strip()}: bad parameters")
+        if mnemonic == "IN":
+            x = y = 0.0
+            absolute, pen, dip, tool = True, False, None, 0
+            continue
+        if mnemonic == "SP":
+            tool = int(args[0]) if args else 0
+            continue
+        if mnemonic not in ("PU", "PD", "PA", "PR"):
+            continue
+        if mnemonic in ("PA", "PR"):
+            absolute = mnemonic == "PA"
+        elif mnemonic == "PU":
+            if dip is not None:
+                xs.append(dip[0]), ys.append(dip[1]), ts.append(tool)
+            pen, dip = False, None
+        elif not pen:
+            pen, dip = True, (x, y)
+        for k in range(0, len(args) - 1, 2):
+            nx, ny = (args[k], args[k + 1]) if absolute else (x + args[k], y + args[k + 1])
+            if pen and dip is not None and (nx, ny) != (x, y):
+                ignored += 1  # a stroke, not a dip
+                dip = None
+            x, y = nx, ny
+    if dip is not None:
+        xs.append(dip[0]), ys.append(dip[1]), ts.append(tool)
+    scale = UNITS_PER_MM / units_per_mm
+    return {}, _units([v * scale for v in xs], [v * scale for v in ys]), np.asarray(ts, np.int32), ignored
+
+
+def _units(xs, ys):
+    return np.rint(np.column_stack((xs, ys)) if xs else np.empty((0, 2))).astype(np.int32)
+
+
+def _unique_hits(pts, tolerance):
+    # First hit of every cluster closer than tolerance, in file order
+    if not len(pts):
+        return pts
+    _, first = np.unique(pts, axis=0, return_index=True)
+    pts = pts[np.sort(first)]  # exact duplicates
+    if tolerance <= 0:
+        return pts
+    cells = (pts // tolerance).astype(np.int64).tolist()
+    limit = tolerance * tolerance
+    grid = {}
+    keep = []
+    for i, (px, py) in enumerate(pts.tolist()):
+        cx, cy = cells[i]
+        if not any((qx - px) ** 2 + (qy - py) ** 2 < limit
+                   for gx in (cx - 1, cx, cx + 1) for gy in (cy - 1, cy, cy + 1)
+                   for qx, qy in grid.get((gx, gy), ())):
+            grid.setdefault((cx, cy), []).append((px, py))
+            keep.append(i)
+    return pts[keep]
@@ -0,0 +1,189 @@
+# Dry-run time estimate for a flow or a loaded LMD phase.
+# Every command gets a motion time from the kinematics.py model (trapezoidal
+# profile per axis, speed from !TS) and a transfer time from its length and
+# the baudrate. The machine starts a command once it has been received and
+# the previous one is done, so
+#   finish[k] = max(finish[k - 1], arrival[k]) + duration[k]
+# which is evaluated for all commands at once as a running maximum.
+# Ack round trips and the streamer window are not modelled.
+import math
+
+import numpy as np
+
+import kinematics
+from hpgl import parse_command, split_commands
+
+TRAVEL = 0
+CUT = 1
+PEN = 2
+OTHER = 3
+
+
+class Estimate:
+    def __init__(self, cutting, travel, pen, other, transfer, total, commands, nbytes):
+        self.cutting = cutting  # s of pen-down moves and circles
+        self.travel = travel  # s of pen-up moves
+        self.pen = pen  # s of PU/PD actuation
+        self.other = other  # s of everything else (IN, ...)
+        self.transfer = transfer  # s the job occupies the serial line
+        self.total = total  # predicted wall-clock time
+        self.commands = commands
+        self.bytes = nbytes
+
+    @property
+    def motion(self):
+        return self.cutting + self.travel + self.pen + self.other
+
+    @property
+    def link_wait(self):
+        # Time the machine sits idle waiting for bytes
+        return max(self.total - self.motion, 0.0)
+
+    def summary(self):
+        return (f"{_fmt(self.total)} total: cutting {_fmt(self.cutting)}, travel {_fmt(self.travel)}, "
+                f"pen {_fmt(self.pen)}, serial {_fmt(self.transfer)} for {self.bytes} bytes "
+                f"({_fmt(self.link_wait)} waiting on the link)")
+
+
+def _fmt(seconds):
+    if seconds >= 3600:
+        return f"{int(seconds // 3600)}h{int(seconds % 3600 // 60):02d}m"
+    if seconds >= 60:
+        return f"{int(seconds // 60)}m{int(seconds % 60):02d}s"
+    return f"{seconds:.1f}s"
+
+
+def axis_times(distance, speed, accel=kinematics.ACCEL):
+    # Vectorized kinematics.axis_time
+    d = np.abs(np.asarray(distance, np.float64))
+    v = np.asarray(speed, np.float64)
+    ramp = v * v / accel
+    return np.where(d <= ramp, 2 * np.sqrt(d / accel), d / v + v / accel)
+
+
+def _digits(values):
+    # Characters of each integer when printed with %d
+    a = np.abs(values)
+    n = np.floor(np.log10(np.maximum(a, 1))).astype(np.int64) + 1
+    return n + (values < 0)
+
+
+def _evaluate(kind, dx, dy, speed, fixed, nbytes, baudrate):
+    moving = (kind == TRAVEL) | (kind == CUT)
+    duration = fixed + np.where(moving, np.maximum(axis_times(dx, speed), axis_times(dy, speed)), 0.0)
+    byte_time = kinematics.byte_time(baudrate)
+    arrival = np.cumsum(nbytes) * byte_time
+    done = np.cumsum(duration)
+    total = float((np.maximum.accumulate(arrival - (done - duration)) + done)[-1]) if len(kind) else 0.0
+    parts = [float(duration[kind == k].sum()) for k in (CUT, TRAVEL, PEN, OTHER)]
+    return Estimate(*parts, float(nbytes.sum()) * byte_time, total, len(kind), int(nbytes.sum()))
+
+
+def estimate_commands(commands, baudrate=9600, speed=0, pen_down=False, start=(0, 0)):
+    # commands: flow text or list of commands; speed: !TS value in effect before the flow;
+    # start: head position before the flow (for PA moves and IN)
+    if isinstance(commands, str):
+        commands = split_commands(commands)
+    n = len(commands)
+    kind = np.full(n, OTHER, np.int8)
+    dx = np.zeros(n)
+    dy = np.zeros(n)
+    ts = np.zeros(n)
+    fixed = np.zeros(n)
+    x, y = start[:2]
+    for k, cmd in enumerate(commands):
+        try:
+            mnemonic, args = parse_command(cmd)
+        except ValueError:
+            continue
+        if mnemonic in ("PR", "PA") and args:
+            if mnemonic == "PR":
+                mx, my = args[0], args[1] if len(args) > 1 else 0
+            elif len(args) >= 2:
+                mx, my = args[0] - x, args[1] - y
+            else:
+                continue
+            x += mx
+            y += my
+            kind[k] = CUT if pen_down else TRAVEL
+            dx[k], dy[k] = mx, my
+        elif mnemonic == "CI" and args:
+            kind[k] = CUT
+            dx[k] = 2 * math.pi * abs(args[0])
+        elif mnemonic in ("PU", "PD"):
+            kind[k] = PEN
+            down = mnemonic == "PD"
+            if down != pen_down:
+                fixed[k] = kinematics.PEN_TIME
+            pen_down = down
+        elif mnemonic == "!TS" and args:
+            speed = args[0]
+        elif mnemonic == "IN":
+            fixed[k] = kinematics.move_time(x, y, kinematics.RAPID_SPEED) + kinematics.HOME_TIME
+            x = y = 0
+            pen_down = False
+            speed = 0
+        ts[k] = kinematics.speed_for(speed)
+    nbytes = np.fromiter((len(c) for c in commands), np.int64, n)
+    return _evaluate(kind, dx, dy, ts, fixed, nbytes, baudrate)
+
+
+def estimate_phase(phase, start=(0, 0), offset=(0, 0), baudrate=9600, speed=0):
+    # Same result as estimate_commands(lmd.phase_commands(phase, start, offset)),
+    # computed from the phase arrays without building the command strings.
+    v = kinematics.speed_for(speed)
+    pos = np.asarray(start[:2], np.int64)
+    shift = np.asarray(offset[:2], np.int64)
+    parts = [(np.array([PEN]), np.zeros(1), np.zeros(1), np.zeros(1), np.array([3]))]  # leading PU;
+
+    if len(phase.points):
+        pts = phase.points.astype(np.int64) + shift
+        d = np.diff(np.vstack((pos, pts)), axis=0)
+        npoly = phase.polylines
+        first = phase.starts[:-1]
+        poly = np.repeat(np.arange(npoly), np.diff(phase.starts))
+        is_first = np.zeros(len(pts), bool)
+        is_first[first] = True
+        # Point k sits in slot k + 2 * poly (travel PR at the start, then PD, cuts, PU)
+        slot = np.arange(len(pts)) + 2 * poly + np.where(is_first, 0, 1)
+        total = len(pts) + 2 * npoly
+        kind = np.full(total, PEN, np.int8)
+        dx = np.zeros(total)
+        dy = np.zeros(total)
+        fixed = np.full(total, kinematics.PEN_TIME)
+        nbytes = np.full(total, 3, np.int64)
+        kind[slot] = np.where(is_first, TRAVEL, CUT)
+        dx[slot] = d[:, 0]
+        dy[slot] = d[:, 1]
+        fixed[slot] = 0.0
+        zero = ~is_first & (d[:, 0] == 0) & (d[:, 1] == 0)  # not sent by phase_commands
+        nbytes[slot] = np.where(zero, 0, 4 + _digits(d[:, 0]) + _digits(d[:, 1]))
+        parts.append((kind, dx, dy, fixed, nbytes))
+        pos = pts[-1]
+
+    for centers in (phase.circles, phase.drills):
+        if not len(centers):
+            continue
+        pts = centers[:, :2].astype(np.int64) + shift
+        d = np.diff(np.vstack((pos, pts)), axis=0)
+        circle = centers.shape[1] > 2
+        per = 4 if circle else 3  # PR, PD, [CI], PU
+        m = len(pts)
+        kind = np.tile(np.array([TRAVEL, PEN, CUT, PEN] if circle else [TRAVEL, PEN, PEN], np.int8), m)
+        dx = np.zeros(m * per)
+        dy = np.zeros(m * per)
+        fixed = np.tile(np.array([0, 1, 0, 1] if circle else [0, 1, 1], np.float64) * kinematics.PEN_TIME, m)
+        nbytes = np.tile(np.array([0, 3, 0, 3] if circle else [0, 3, 3], np.int64), m)
+        dx[0::per] = d[:, 0]
+        dy[0::per] = d[:, 1]
+        nbytes[0::per] = 4 + _digits(d[:, 0]) + _digits(d[:, 1])
+        if circle:
+            dx[2::per] = 2 * math.pi * centers[:, 2]
+            nbytes[2::per] = 3 + _digits(centers[:, 2].astype(np.int64))
+        parts.append((kind, dx, dy, fixed, nbytes))
+        pos = pts[-1]
+
+    kind, dx, dy, fixed, nbytes = (np.concatenate(p) for p in zip(*parts))
+    keep = nbytes > 0
+    return _evaluate(kind[keep], dx[keep], dy[keep], np.full(int(keep.sum()), v), fixed[keep], nbytes[keep],
+                     baudrate)
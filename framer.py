@@ -0,0 +1,102 @@
+# Incremental receive framer for Protomat replies.
+# Bytes are read straight into a fixed bytearray (no per-byte copies) and
+# split into frames on "C" and "\r":
+#   "C\r"            -> ACK       (echo mode acknowledge, empty frame before "C")
+#   "P19100,9000,0C" -> POSITION  (value: tuple of ints, one per queried axis)
+#   "E<n>\r"         -> ERROR     (value: error code)
+#   anything else    -> ECHO      (value: decoded text)
+import re
+from collections import namedtuple
+
+ACK = "ack"
+POSITION = "position"
+ERROR = "error"
+ECHO = "echo"
+
+Event = namedtuple("Event", "kind value")
+
+ACK_EVENT = Event(ACK, None)
+
+_POSITION = re.compile(rb'P\s*(-?\d+)(?:\s*,\s*(-?\d+))?(?:\s*,\s*(-?\d+))?\s*')
+_ERROR = re.compile(rb'E\s*(\d+)\s*')
+
+
+class FrameOverflow(Exception):
+    pass
+
+
+class Framer:
+    def __init__(self, capacity=4096):
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._start = 0  # first byte of the frame being assembled
+        self._end = 0  # end of valid data
+        self.overflows = 0
+
+    @property
+    def pending(self):
+        return self._end - self._start
+
+    def writable(self, n):
+        # Free region for n bytes, e.g. port.readinto(framer.writable(n)).
+        # Compacts the buffer if the tail is too short; never reallocates.
+        capacity = len(self._buf)
+        if n > capacity - self._end:
+            pending = self._end - self._start
+            self._buf[0:pending] = self._view[self._start:self._end]
+            self._start, self._end = 0, pending
+            if n > capacity - pending:
+                # A frame larger than the buffer is garbage; drop it
+                self.overflows += 1
+                self._start = self._end = 0
+                n = min(n, capacity)
+        return self._view[self._end:self._end + n]
+
+    def commit(self, n):
+        # Mark n bytes written into writable() as valid and return the new events
+        scan = self._end
+        self._end += n
+        return self._split(scan)
+
+    def feed(self, data):
+        events = []
+        data = memoryview(data)
+        capacity = len(self._buf)
+        while len(data):
+            chunk = data[:capacity]
+            self.writable(len(chunk))[:] = chunk
+            events.extend(self.commit(len(chunk)))
+            data = data[len(chunk):]
+        return events
+
+    def _split(self, scan):
+        events = []
+        buf = self._buf
+        end = self._end
+        while scan < end:
+            c = buf.find(b"C", scan, end)
+            r = buf.find(b"\r", scan, end)
+            if c < 0 and r < 0:
+                break
+            stop = c if r < 0 or (0 <= c < r) else r
+            event = self._decode(self._view[self._start:stop], buf[stop] == 0x43)
+            if event is not None:
+                events.append(event)
+            self._start = scan = stop + 1
+        if self._start == self._end:
+            self._start = self._end = 0
+        return events
+
+    def _decode(self, frame, by_c):
+        if not len(frame):
+            return ACK_EVENT if by_c else None
+        body = bytes(frame).strip()
+        if not body:
+            return ACK_EVENT if by_c else None
+        m = _POSITION.fullmatch(body)
+        if m:
+            return Event(POSITION, tuple(int(g) for g in m.groups() if g is not None))
+        m = _ERROR.fullmatch(body)
+        if m:
+            return Event(ERROR, int(m.group(1)))
+        return Event(ECHO, body.decode("ascii", errors="replace"))
@@ -0,0 +1,24 @@
+# HPGL helpers shared by the controller and the job tools.
+# Commands are plain ASCII terminated by ";" e.g. "!TS500;PD;PR5000,0;PU;"
+
+
+def split_commands(text):
+    # Split a flow or file into single commands, each terminated with ";".
+    # Newlines count as separators too, so one-command-per-line files work.
+    commands = []
+    for line in text.replace("\r", "\n").split("\n"):
+        for part in line.split(";"):
+            part = part.strip()
+            if part:
+                commands.append(part + ";")
+    return commands
+
+
+def parse_command(cmd):
+    # "PR5000,0;" -> ("PR", [5000, 0]), "!TS500;" -> ("!TS", [500]), "PU;" -> ("PU", [])
+    body = cmd.strip().rstrip(";").strip().upper()
+    n = 3 if body.startswith("!") else 2
+    mnemonic = body[:n]
+    rest = body[n:].strip()
+    args = [int(float(a)) for a in rest.split(",") if a.strip()] if rest else []
+    return mnemonic, args
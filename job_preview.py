@@ -0,0 +1,431 @@
+# Whole-job preview with a quadtree level of detail.
+# PreviewIndex turns a command list into segments (pen-down cuts and pen-up
+# travel, positions from bounds.head_path) and points (CI circles, pen dips
+# of drill hits). They are sorted along a Z-order curve of their midpoints,
+# so every quadtree tile on every level is one contiguous range. A view
+# draws the tiles that cover it on the level where a tile is about TILE_PX
+# pixels wide. Each tile's segments are joined into polylines and
+# simplified to the view's resolution: vertices are snapped to a
+# power-of-two grid of at most one pixel and repeated vertices are dropped.
+# When a view would still have more than MAX_ITEMS polylines, only the
+# largest are drawn (cuts before travel) until the view is zoomed in.
+# Simplified tiles are cached per resolution, so panning and zooming back
+# only draw. Segments longer than a tile are looked up by length instead.
+# JobPreview shows a view on a Tk canvas, like WorkspacePlot: panning and
+# zooming first move and scale the existing items, and the LOD redraw
+# follows once the mouse rests. As a job runs, the sent commands are drawn
+# over the preview in another colour.
+import math
+
+import numpy as np
+
+from bounds import head_path
+from hpgl import split_commands
+
+DEPTH = 16  # quadtree levels; Z-order codes have 2 * DEPTH bits
+TILE_PX = 256  # tile size in pixels on the level a view is drawn from
+LEAF_SEGMENTS = 512  # the deepest level used holds about this many per tile
+MAX_ITEMS = 6000  # canvas lines per view; smaller polylines are left out above this
+MAX_TILES = 4096  # simplified tiles kept in the cache
+MAX_POINTS = 3000  # circles and dips smaller than 2 px are left out above this
+REDRAW_MS = 120  # LOD redraw this long after the last pan/zoom event
+FRAME_MS = 100  # progress overlay at most 10 times per second
+
+CUT, TRAVEL = 1, 0
+COLOR_CUT = "#aa7700"
+COLOR_TRAVEL = "#2f4f6f"
+COLOR_DONE_CUT = "#ffaa00"
+COLOR_DONE_TRAVEL = "#5f8f5f"
+COLOR_HEAD = "#ff4444"
+
+
+def _spread(v):
+    # Bits of v (< 2**16) moved to the even bit positions
+    v = v.astype(np.uint64)
+    for shift, mask in ((8, 0x00FF00FF), (4, 0x0F0F0F0F), (2, 0x33333333), (1, 0x55555555)):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def _zorder(i, j):
+    return _spread(i) | (_spread(j) << np.uint64(1))
+
+
+class Tile:
+    # Simplified polylines of one tile: vertices on a grid of `tol` units,
+    # chain k is x[offsets[k]:offsets[k + 1]]; idx: command of each vertex
+    def __init__(self, x, y, idx, offsets, kinds):
+        self.x = x
+        self.y = y
+        self.idx = idx
+        self.offsets = offsets
+        self.kinds = kinds
+
+    def extents(self):
+        # Larger side of each chain's bounding box
+        if not len(self.kinds):
+            return np.zeros(0)
+        starts = self.offsets[:-1]
+        return np.maximum(np.maximum.reduceat(self.x, starts) - np.minimum.reduceat(self.x, starts),
+                          np.maximum.reduceat(self.y, starts) - np.minimum.reduceat(self.y, starts))
+
+    def subset(self, chains):
+        # Tile with the given chains (ascending)
+        counts = np.diff(self.offsets)
+        mask = np.zeros(len(self.kinds), bool)
+        mask[chains] = True
+        vertices = np.repeat(mask, counts)
+        return Tile(self.x[vertices], self.y[vertices], self.idx[vertices],
+                    np.concatenate(([0], np.cumsum(counts[chains]))), self.kinds[chains])
+
+
+class PreviewIndex:
+    def __init__(self, commands, start=(0, 0)):
+        if isinstance(commands, str):
+            commands = split_commands(commands)
+        self.commands = len(commands)
+        x, y, r = head_path(commands, start)
+        px = np.concatenate(([float(start[0])], x))
+        py = np.concatenate(([float(start[1])], y))
+        codes = {"PU": 0, "PD": 1}
+        pen = np.array([codes.get(cmd.lstrip()[:2].upper(), -1) for cmd in commands], np.int8)
+        # Pen state while command k runs: the last PU/PD before it
+        set_at = np.where(pen >= 0, np.arange(len(pen)), -1)
+        last = np.maximum.accumulate(np.concatenate(([-1], set_at[:-1]))) if len(pen) else set_at
+        down = np.where(last >= 0, pen[np.maximum(last, 0)], 0) == 1
+
+        moved = np.flatnonzero((px[1:] != px[:-1]) | (py[1:] != py[:-1]))
+        self.seg_idx = moved  # command that draws each segment
+        self.x0, self.y0 = px[moved], py[moved]
+        self.x1, self.y1 = px[moved + 1], py[moved + 1]
+        self.kind = np.where(down[moved], CUT, TRAVEL).astype(np.int8)
+        self.length = np.maximum(np.abs(self.x1 - self.x0), np.abs(self.y1 - self.y0))
+
+        # Circles, and dips: PD directly followed by PU without a move
+        dip = np.zeros(len(pen), bool)
+        dip[:-1] = (pen[:-1] == 1) & (pen[1:] == 0)
+        pts = np.flatnonzero((r > 0) | dip)
+        self.pt_idx = pts
+        self.pt_x, self.pt_y, self.pt_r = x[pts], y[pts], r[pts]
+
+        xs = np.concatenate((self.x0, self.x1, self.pt_x - self.pt_r, self.pt_x + self.pt_r, [start[0]]))
+        ys = np.concatenate((self.y0, self.y1, self.pt_y - self.pt_r, self.pt_y + self.pt_r, [start[1]]))
+        self.bbox = (float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max()))
+        self.size = max(self.bbox[2] - self.bbox[0], self.bbox[3] - self.bbox[1], 1.0)
+        self.levels = int(np.clip(math.ceil(math.log(max(len(moved), 1) / LEAF_SEGMENTS, 4)), 0, DEPTH))
+
+        seg_codes = self._codes((self.x0 + self.x1) / 2, (self.y0 + self.y1) / 2)
+        self.seg_order = np.argsort(seg_codes, kind="stable")
+        self.seg_codes = seg_codes[self.seg_order]
+        pt_codes = self._codes(self.pt_x, self.pt_y)
+        self.pt_order = np.argsort(pt_codes, kind="stable")
+        self.pt_codes = pt_codes[self.pt_order]
+        self.by_length = np.argsort(-self.length, kind="stable")
+        self._longest = -self.length[self.by_length]  # ascending, for searchsorted
+        self._tiles = {}  # (lod, level, tile) -> Tile
+
+    @property
+    def segments(self):
+        return len(self.seg_idx)
+
+    def _cells(self, x, y, level):
+        n = 1 << level
+        cell = self.size / n
+        i = np.clip(((x - self.bbox[0]) // cell).astype(np.int64), 0, n - 1)
+        j = np.clip(((y - self.bbox[1]) // cell).astype(np.int64), 0, n - 1)
+        return i, j
+
+    def _codes(self, x, y):
+        i, j = self._cells(np.asarray(x, float), np.asarray(y, float), DEPTH)
+        return _zorder(i, j)
+
+    def _range(self, codes, level, tile):
+        shift = np.uint64(2 * (DEPTH - level))
+        lo = np.uint64(tile) << shift
+        hi = (np.uint64(tile) + np.uint64(1)) << shift
+        return np.searchsorted(codes, lo), np.searchsorted(codes, hi)
+
+    # --- queries ---------------------------------------------------------
+
+    def view_level(self, units_per_px):
+        # Level whose tiles are about TILE_PX pixels wide in this view
+        level = round(math.log2(max(self.size / (TILE_PX * units_per_px), 1.0)))
+        return min(level, self.levels)
+
+    def tiles(self, view, level):
+        # Z-order numbers of the tiles on level that intersect view (x0, y0, x1, y1), with a one tile margin
+        n = 1 << level
+        cell = self.size / n
+        i0, i1 = (int(np.clip((v - self.bbox[0]) // cell, 0, n - 1)) for v in (view[0] - cell, view[2] + cell))
+        j0, j1 = (int(np.clip((v - self.bbox[1]) // cell, 0, n - 1)) for v in (view[1] - cell, view[3] + cell))
+        i, j = np.meshgrid(np.arange(i0, i1 + 1), np.arange(j0, j1 + 1))
+        return _zorder(i.ravel(), j.ravel()).tolist()
+
+    def tile(self, level, tile, lod):
+        # Simplified polylines of the segments in tile that are not longer than it
+        key = (lod, level, tile)
+        cached = self._tiles.get(key)
+        if cached is None:
+            lo, hi = self._range(self.seg_codes, level, tile)
+            sel = self.seg_order[lo:hi]
+            sel = np.sort(sel[self.length[sel] <= self.size / (1 << level)])
+            if len(self._tiles) >= MAX_TILES:
+                self._tiles.clear()
+            cached = self._tiles[key] = self._chains(sel, 2.0 ** lod)
+        return cached
+
+    def long_segments(self, level, view, lod):
+        # Segments longer than a tile on level that cross view (bounding box test)
+        n = np.searchsorted(self._longest, -self.size / (1 << level))
+        sel = self.by_length[:n]
+        x0, y0, x1, y1 = self.x0[sel], self.y0[sel], self.x1[sel], self.y1[sel]
+        hit = ((np.minimum(x0, x1) <= view[2]) & (np.maximum(x0, x1) >= view[0])
+               & (np.minimum(y0, y1) <= view[3]) & (np.maximum(y0, y1) >= view[1]))
+        return self._chains(np.sort(sel[hit]), 2.0 ** lod)
+
+    def points(self, level, tile):
+        lo, hi = self._range(self.pt_codes, level, tile)
+        return self.pt_order[lo:hi]
+
+    def _chains(self, sel, tol):
+        # Segments sel (ascending) joined into polylines where they follow
+        # each other in the flow, vertices snapped to tol
+        n = len(sel)
+        if not n:
+            return _empty()
+        kind = self.kind[sel]
+        first = np.ones(n, bool)
+        first[1:] = (np.diff(self.seg_idx[sel]) != 1) | (kind[1:] != kind[:-1])
+        end_at = np.arange(n) + np.cumsum(first)  # slot of each segment's end vertex
+        start_at = end_at[first] - 1
+        m = n + len(start_at)
+        vx, vy = np.empty(m), np.empty(m)
+        vidx = np.empty(m, np.int64)
+        head = np.zeros(m, bool)
+        vx[end_at], vy[end_at], vidx[end_at] = self.x1[sel], self.y1[sel], self.seg_idx[sel]
+        vx[start_at], vy[start_at], vidx[start_at] = self.x0[sel[first]], self.y0[sel[first]], self.seg_idx[sel[first]]
+        head[start_at] = True
+        qx, qy = np.floor(vx / tol), np.floor(vy / tol)
+        keep = head.copy()
+        keep[1:] |= (qx[1:] != qx[:-1]) | (qy[1:] != qy[:-1])
+        chain = np.cumsum(head) - 1
+        chain, qx, qy, vidx = chain[keep], qx[keep], qy[keep], vidx[keep]
+        counts = np.bincount(chain, minlength=len(start_at))
+        visible = counts >= 2  # a chain inside one grid cell is below one pixel
+        keep = visible[chain]
+        offsets = np.concatenate(([0], np.cumsum(counts[visible])))
+        return Tile((qx[keep] + 0.5) * tol, (qy[keep] + 0.5) * tol, vidx[keep], offsets, kind[first][visible])
+
+
+class JobPreview:
+    def __init__(self, canvas, max_items=MAX_ITEMS):
+        self.canvas = canvas
+        self.max_items = max_items
+        self.index = None
+        self.origin = (0.0, 0.0)  # world point at the canvas' top left corner
+        self.scale = 1.0  # units per pixel
+        self.progress = 0  # commands sent
+        self.head = None  # head position (x, y)
+        self.items = 0
+        self.hidden = 0  # polylines left out of the current view
+        self.lod = 0
+        self._drawn_progress = 0
+        self._chains = None  # visible polylines: x, y, idx, offsets, kinds, first, last
+        self._redraw_job = None
+        self._frame_job = None
+        self._drag = None
+        self._auto_fit = True  # fit again when the canvas is resized, until the user zooms or pans
+        self._info = canvas.create_text(8, 8, anchor="nw", fill="#e0e0e0", text="", tags="info")
+        canvas.bind("<ButtonPress-1>", self._on_press)
+        canvas.bind("<B1-Motion>", self._on_drag)
+        canvas.bind("<MouseWheel>", lambda e: self.zoom(1.25 if e.delta > 0 else 0.8, e.x, e.y))
+        canvas.bind("<Button-4>", lambda e: self.zoom(1.25, e.x, e.y))
+        canvas.bind("<Button-5>", lambda e: self.zoom(0.8, e.x, e.y))
+        canvas.bind("<Double-Button-1>", lambda e: self.fit())
+        canvas.bind("<Configure>", lambda e: self.fit() if self._auto_fit else self._schedule_redraw())
+
+    def load(self, commands, start=(0, 0)):
+        self.index = PreviewIndex(commands, start)
+        self.progress = self._drawn_progress = 0
+        self.head = tuple(start[:2])
+        self._auto_fit = True
+        self.fit()
+
+    def fit(self):
+        if self.index is None:
+            return
+        x0, y0, x1, y1 = self.index.bbox
+        w, h = self._size()
+        self.scale = max((x1 - x0) / max(w - 20, 1), (y1 - y0) / max(h - 20, 1), 1e-3)
+        self.origin = ((x0 + x1) / 2 - self.scale * w / 2, (y0 + y1) / 2 + self.scale * h / 2)
+        self._redraw()
+
+    def zoom(self, factor, px, py):
+        # Zoom by factor around canvas point (px, py)
+        if self.index is None:
+            return
+        self._auto_fit = False
+        wx, wy = self._to_world(px, py)
+        self.scale /= factor
+        self.origin = (wx - px * self.scale, wy + py * self.scale)
+        self.canvas.scale("view", px, py, factor, factor)
+        self._schedule_redraw()
+
+    def pan(self, dx, dy):
+        self._auto_fit = False
+        self.origin = (self.origin[0] - dx * self.scale, self.origin[1] + dy * self.scale)
+        self.canvas.move("view", dx, dy)
+        self._schedule_redraw()
+
+    def set_progress(self, sent, position=None):
+        # sent: commands of the previewed job sent so far
+        self.progress = sent
+        if position is not None:
+            self.head = (position[0], position[1])
+        if self._frame_job is None:
+            self._frame_job = self.canvas.after(FRAME_MS, self._draw_progress)
+
+    # --- drawing ---------------------------------------------------------
+
+    def _size(self):
+        return max(self.canvas.winfo_width(), 2), max(self.canvas.winfo_height(), 2)
+
+    def _to_world(self, px, py):
+        return self.origin[0] + px * self.scale, self.origin[1] - py * self.scale
+
+    def _to_canvas(self, x, y):
+        return (x - self.origin[0]) / self.scale, (self.origin[1] - y) / self.scale
+
+    def _on_press(self, event):
+        self._drag = (event.x, event.y)
+
+    def _on_drag(self, event):
+        if self._drag:
+            self.pan(event.x - self._drag[0], event.y - self._drag[1])
+            self._drag = (event.x, event.y)
+
+    def _schedule_redraw(self):
+        if self._redraw_job is not None:
+            self.canvas.after_cancel(self._redraw_job)
+        self._redraw_job = self.canvas.after(REDRAW_MS, self._redraw)
+
+    def visible(self):
+        # (chains, points) of the current view: polylines as one concatenated
+        # Tile, points as indices; the largest MAX_ITEMS polylines if there are more
+        index = self.index
+        w, h = self._size()
+        x0, y1 = self._to_world(0, 0)
+        x1, y0 = self._to_world(w, h)
+        view = (x0, y0, x1, y1)
+        level = index.view_level(self.scale)
+        numbers = index.tiles(view, level)
+        lod = self.lod = math.floor(math.log2(max(self.scale, 1e-9)))
+        tile = _join([index.tile(level, t, lod) for t in numbers] + [index.long_segments(level, view, lod)])
+        self.hidden = max(len(tile.kinds) - self.max_items, 0)
+        if self.hidden:
+            weight = tile.extents() * np.where(tile.kinds == CUT, 2.0, 1.0)
+            tile = tile.subset(np.sort(np.argpartition(-weight, self.max_items)[:self.max_items]))
+        points = np.concatenate([index.points(level, t) for t in numbers]) if numbers else np.zeros(0, np.int64)
+        px, py, pr = index.pt_x[points], index.pt_y[points], index.pt_r[points]
+        inside = (px + pr >= x0) & (px - pr <= x1) & (py + pr >= y0) & (py - pr <= y1)
+        points = points[inside]
+        if len(points) > MAX_POINTS:
+            points = points[index.pt_r[points] >= 2 * self.scale]
+        return tile, points
+
+    def _redraw(self):
+        self._redraw_job = None
+        canvas = self.canvas
+        canvas.delete("view")
+        if self.index is None:
+            return
+        tile, points = self.visible()
+        first = tile.idx[tile.offsets[:-1]]
+        last = tile.idx[tile.offsets[1:] - 1]
+        self._chains = (tile, first, last)
+        cx, cy = self._to_canvas(tile.x, tile.y)
+        flat = np.empty(2 * len(cx))
+        flat[0::2], flat[1::2] = cx, cy
+        flat = flat.tolist()
+        offsets = tile.offsets.tolist()
+        p = self.progress
+        self.items = 0
+        for k, kind in enumerate(tile.kinds.tolist()):
+            a, b = offsets[k], offsets[k + 1]
+            if last[k] < p:
+                self._line(flat[2 * a:2 * b], kind, True)
+            elif first[k] >= p:
+                self._line(flat[2 * a:2 * b], kind, False)
+            else:
+                split = a + int(np.searchsorted(tile.idx[a:b], p))  # first vertex not sent yet
+                self._line(flat[2 * (split - 1):2 * b], kind, False)
+                self._line(flat[2 * a:2 * split], kind, True)
+        index = self.index
+        for k in points.tolist():
+            x, y = self._to_canvas(index.pt_x[k], index.pt_y[k])
+            rad = max(index.pt_r[k] / self.scale, 1.5)
+            color = COLOR_DONE_CUT if index.pt_idx[k] < p else COLOR_CUT
+            canvas.create_oval(x - rad, y - rad, x + rad, y + rad, outline=color, tags="view")
+        self._drawn_progress = p
+        self._draw_head()
+        hidden = f" ({self.hidden} small ones left out)" if self.hidden else ""
+        canvas.itemconfig(self._info, text=f"{index.segments} segments, {self.items} lines{hidden}, "
+                                           f"{len(points)} points, detail {2.0 ** self.lod / 100:.3g} mm")
+        canvas.tag_raise("info")
+
+    def _line(self, flat, kind, done):
+        if len(flat) < 4:
+            return
+        if done:
+            color = COLOR_DONE_CUT if kind == CUT else COLOR_DONE_TRAVEL
+        else:
+            color = COLOR_CUT if kind == CUT else COLOR_TRAVEL
+        self.canvas.create_line(*flat, fill=color, tags="view")
+        self.items += 1
+
+    def _draw_progress(self):
+        # Overlays what was sent since the last frame; a full redraw once
+        # the overlay has added too many lines
+        self._frame_job = None
+        if self._chains is None or self._redraw_job is not None:
+            return
+        if self.progress < self._drawn_progress or self.items > 2 * self.max_items:
+            self._redraw()
+            return
+        tile, first, last = self._chains
+        p0, p1 = self._drawn_progress, self.progress
+        for k in np.flatnonzero((last >= p0) & (first < p1)).tolist():
+            a, b = int(tile.offsets[k]), int(tile.offsets[k + 1])
+            lo = a + max(int(np.searchsorted(tile.idx[a:b], p0)) - 1, 0)
+            hi = a + int(np.searchsorted(tile.idx[a:b], p1))
+            cx, cy = self._to_canvas(tile.x[lo:hi], tile.y[lo:hi])
+            flat = np.empty(2 * len(cx))
+            flat[0::2], flat[1::2] = cx, cy
+            self._line(flat.tolist(), int(tile.kinds[k]), True)
+        self._drawn_progress = p1
+        self._draw_head()
+
+    def _draw_head(self):
+        self.canvas.delete("head")
+        if self.head is None:
+            return
+        x, y = self._to_canvas(*self.head)
+        self.canvas.create_oval(x - 4, y - 4, x + 4, y + 4, fill=COLOR_HEAD, outline=COLOR_HEAD, tags=("view", "head"))
+
+
+def _empty():
+    return Tile(np.zeros(0), np.zeros(0), np.zeros(0, np.int64), np.zeros(1, np.int64), np.zeros(0, np.int8))
+
+
+def _join(parts):
+    parts = [p for p in parts if len(p.kinds)]
+    if not parts:
+        return _empty()
+    offsets = [parts[0].offsets]
+    base = parts[0].offsets[-1]
+    for p in parts[1:]:
+        offsets.append(p.offsets[1:] + base)
+        base += p.offsets[-1]
+    return Tile(np.concatenate([p.x for p in parts]), np.concatenate([p.y for p in parts]),
+                np.concatenate([p.idx for p in parts]), np.concatenate(offsets),
+                np.concatenate([p.kinds for p in parts]))
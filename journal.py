@@ -0,0 +1,258 @@
+# Crash-safe journal of the running job.
+# Before a job is streamed its flow is stored next to the journal
+# (<name>.flow, written to a temporary file and renamed) and the journal is
+# started with a JOB record. Every command acknowledged by the machine then
+# gets an ACK record with its offset in the flow and the head position and
+# pen state after it. Records are appended by a writer thread, so the serial
+# I/O thread only bumps a counter; fsync runs once per `batch` acks or
+# `interval` seconds, whichever comes first. At most that much progress is
+# lost in a crash, and resuming redoes it.
+#
+#   JOB <sha1 of the flow> <commands> <x> <y>
+#   RESUME <offset> <x> <y>
+#   ACK <offset> <x> <y> <pen>
+#   END
+#
+# Every line ends with the CRC32 of the record; reading stops at the first
+# torn or damaged line. A journal without END describes a job that can be
+# resumed: head up, travel back to the position of the last ACK, restore the
+# settings sent before it (e.g. !TS), lower the pen if it was down, and
+# stream the rest of the flow.
+import hashlib
+import os
+import threading
+import zlib
+
+from hpgl import parse_command, split_commands
+from position_model import PositionModel
+
+_MOTION = ("PU", "PD", "PR", "PA", "CI", "IN")
+_QUERIES = ("!ON", "!CT")  # not replayed on resume
+
+
+class JournalError(Exception):
+    pass
+
+
+def flow_hash(commands):
+    return hashlib.sha1("".join(commands).encode("ascii", errors="replace")).hexdigest()
+
+
+def flow_path(path):
+    return os.path.splitext(path)[0] + ".flow"
+
+
+def _line(record):
+    return f"{record} {zlib.crc32(record.encode()):08x}\n"
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return  # e.g. Windows, where directories cannot be opened
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ResumePoint:
+    def __init__(self, job_hash, commands, offset, position, pen_down):
+        self.job_hash = job_hash
+        self.commands = commands  # the whole flow
+        self.offset = offset  # commands confirmed by the machine
+        self.position = position  # (x, y) after them
+        self.pen_down = pen_down
+
+    @property
+    def total(self):
+        return len(self.commands)
+
+    def settings(self):
+        # Last command of every setting mnemonic sent before the offset, in order
+        last = {}
+        for cmd in self.commands[:self.offset]:
+            if cmd.lstrip()[:2].upper() in _MOTION:
+                continue
+            try:
+                mnemonic, _ = parse_command(cmd)
+            except ValueError:
+                continue
+            if mnemonic not in _MOTION and mnemonic not in _QUERIES:
+                last.pop(mnemonic, None)
+                last[mnemonic] = cmd
+        return list(last.values())
+
+    def flow(self, here):
+        # Commands that continue the job from the head position `here`:
+        # (preamble, rest); the preamble is not part of the journaled flow
+        dx = self.position[0] - here[0]
+        dy = self.position[1] - here[1]
+        preamble = ["PU;"] + self.settings() + ([f"PR{dx},{dy};"] if dx or dy else [])
+        if self.pen_down:
+            preamble.append("PD;")
+        return preamble, self.commands[self.offset:]
+
+    def summary(self):
+        return (f"{self.offset} of {self.total} commands done, stopped at X={self.position[0]} "
+                f"Y={self.position[1]} (pen {'down' if self.pen_down else 'up'})")
+
+
+def read_journal(path):
+    # ResumePoint of an unfinished job, or None if there is nothing to resume
+    try:
+        with open(path, encoding="ascii", errors="replace") as f:
+            lines = f.read().split("\n")
+    except FileNotFoundError:
+        return None
+    header = None
+    offset, position, pen = 0, None, False
+    for line in lines:
+        record, _, crc = line.rpartition(" ")
+        if not record or crc != f"{zlib.crc32(record.encode()):08x}":
+            break  # torn write at the end of the journal
+        fields = record.split()
+        kind, values = fields[0], fields[1:]
+        if kind == "END":
+            return None
+        try:
+            if kind == "JOB":
+                header = values[0], int(values[1])
+                offset, position, pen = 0, (int(values[2]), int(values[3])), False
+            elif kind == "RESUME":
+                offset, position = int(values[0]), (int(values[1]), int(values[2]))
+            elif kind == "ACK":
+                offset, position, pen = int(values[0]), (int(values[1]), int(values[2])), values[3] == "1"
+        except (IndexError, ValueError):
+            break
+    if header is None or offset == 0:
+        return None
+    job_hash, total = header
+    try:
+        with open(flow_path(path), encoding="ascii") as f:
+            commands = split_commands(f.read())
+    except OSError as e:
+        raise JournalError(f"Flow of the journaled job is missing: {e}") from e
+    if len(commands) != total or flow_hash(commands) != job_hash:
+        raise JournalError("Flow file does not match the journal")
+    if offset >= total:
+        return None
+    return ResumePoint(job_hash, commands, offset, position, pen)
+
+
+def remove_journal(path):
+    for name in (path, flow_path(path)):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+class JobJournal:
+    def __init__(self, path, batch=64, interval=0.5):
+        self.path = path
+        self.batch = batch  # acks between fsyncs at most
+        self.interval = interval  # s between fsyncs at most
+        self.synced = 0  # fsyncs so far
+        self._file = None
+        self._commands = None
+        self._model = PositionModel()
+        self._pen = False
+        self._offset = 0  # commands written to the journal
+        self._base = 0  # offset of the first streamed command
+        self._skip = 0  # leading streamed commands that are not part of the flow
+        self._acked = 0  # from the streamer, may run ahead of _offset
+        self._closing = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def begin(self, commands, start):
+        # New job from head position start (x, y); replaces the previous journal
+        commands = split_commands(commands) if isinstance(commands, str) else list(commands)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        flow = flow_path(self.path)
+        with open(flow + ".tmp", "w", encoding="ascii", errors="replace") as f:
+            f.write("".join(commands))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(flow + ".tmp", flow)
+        self._file = open(self.path, "w", encoding="ascii")
+        self._start(commands, 0, 0, start, False, f"JOB {flow_hash(commands)} {len(commands)} {start[0]} {start[1]}")
+        _fsync_dir(self.path)
+
+    def resume(self, point, skip):
+        # Continue the journal of point; the stream starts with `skip` preamble commands
+        self._file = open(self.path, "a", encoding="ascii")
+        self._start(point.commands, point.offset, skip, point.position, point.pen_down,
+                    f"RESUME {point.offset} {point.position[0]} {point.position[1]}")
+
+    def _start(self, commands, offset, skip, position, pen, record):
+        self._commands = commands
+        self._offset = self._base = offset
+        self._skip = skip
+        self._model.position = [position[0], position[1], 0]
+        self._pen = pen
+        self._file.write(_line(record))
+        self._sync()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def ack(self, acked):
+        # Streamer callback on the I/O thread: acked commands of the stream so far
+        with self._cond:
+            self._acked = acked
+            if acked - self._skip + self._base - self._offset >= self.batch:
+                self._cond.notify()
+
+    def close(self, finished):
+        # Writes the outstanding acks, and END if the job finished
+        if self._thread is None:
+            return
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join()
+        self._thread = None
+        if finished:
+            self._file.write(_line("END"))
+            self._sync()
+        self._file.close()
+
+    @property
+    def offset(self):
+        return self._offset
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closing or self._target() - self._offset >= self.batch,
+                                    self.interval)
+                target = self._target()
+                closing = self._closing
+            if target > self._offset:
+                self._write(target)
+            if closing:
+                return
+
+    def _target(self):
+        return min(self._base + max(0, self._acked - self._skip), len(self._commands))
+
+    def _write(self, target):
+        lines = []
+        model = self._model
+        for k in range(self._offset, target):
+            cmd = self._commands[k]
+            model.apply(cmd)
+            key = cmd.lstrip()[:2].upper()
+            if key in ("PU", "PD"):
+                self._pen = key == "PD"
+            lines.append(_line(f"ACK {k + 1} {model.position[0]} {model.position[1]} {int(self._pen)}"))
+        self._file.write("".join(lines))
+        self._sync()
+        self._offset = target
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.synced += 1
@@ -0,0 +1,79 @@
+# Motion timing model for the Protomat.
+# Each axis follows a trapezoidal velocity profile (accelerate, cruise,
+# decelerate); a PR move ends when the slower axis arrives. The numbers are
+# assumptions for the 91s/VS, not measured values - adjust them here.
+# Distances are machine units (1/100 mm), times seconds.
+import math
+
+from hpgl import parse_command
+
+RAPID_SPEED = 5000  # units/s (50 mm/s) with !TS0 or no !TS
+ACCEL = 50000  # units/s^2 per axis
+TS_UNIT = 1  # units/s per !TS step: !TS500 -> 5 mm/s
+PEN_TIME = 0.1  # s per PU/PD actuation
+HOME_TIME = 0.5  # s extra for IN (switch search)
+
+
+def speed_for(ts):
+    # Axis speed for a !TS setting (0 = rapid)
+    return ts * TS_UNIT if ts and ts > 0 else RAPID_SPEED
+
+
+def axis_time(distance, speed, accel=ACCEL):
+    # Time for one axis to travel distance with a trapezoidal profile
+    d = abs(distance)
+    if d == 0:
+        return 0.0
+    ramp = speed * speed / accel  # distance to reach full speed and stop again
+    if d <= ramp:
+        return 2 * math.sqrt(d / accel)  # triangular profile
+    return d / speed + speed / accel
+
+
+def move_time(dx, dy, speed, accel=ACCEL):
+    return max(axis_time(dx, speed, accel), axis_time(dy, speed, accel))
+
+
+def circle_time(radius, speed, accel=ACCEL):
+    # CI: path speed limited like a single axis over the circumference
+    return axis_time(2 * math.pi * abs(radius), speed, accel)
+
+
+def command_times(commands, start=(0, 0), speed=0):
+    # Motion time of each command (moves, circles, pen, IN), from start and
+    # the !TS value in effect before the first one
+    x, y = start[:2]
+    pen_down = None
+    times = []
+    for cmd in commands:
+        t = 0.0
+        try:
+            mnemonic, args = parse_command(cmd)
+        except ValueError:
+            mnemonic, args = "", []
+        if mnemonic in ("PR", "PA") and args:
+            if mnemonic == "PR":
+                dx, dy = args[0], args[1] if len(args) > 1 else 0
+            else:
+                dx, dy = (args[0] - x, args[1] - y) if len(args) >= 2 else (0, 0)
+            x, y = x + dx, y + dy
+            t = move_time(dx, dy, speed_for(speed))
+        elif mnemonic == "CI" and args:
+            t = circle_time(args[0], speed_for(speed))
+        elif mnemonic in ("PU", "PD"):
+            down = mnemonic == "PD"
+            t = PEN_TIME if down != pen_down else 0.0
+            pen_down = down
+        elif mnemonic == "!TS" and args:
+            speed = args[0]
+        elif mnemonic == "IN":
+            t = move_time(x, y, RAPID_SPEED) + HOME_TIME
+            x = y = 0
+            pen_down, speed = False, 0
+        times.append(t)
+    return times
+
+
+def byte_time(baudrate, bits=10):
+    # Seconds per byte on the serial line (8N1 = 10 bits)
+    return bits / baudrate
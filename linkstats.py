@@ -0,0 +1,213 @@
+# Link instrumentation for the serial I/O thread.
+# SerialIO calls into a LinkStats object (when one is attached) with the
+# enqueue and write time of every write, every chunk read, every "C\r" ack
+# and every position reply. Acks arrive in order, so they are matched to the
+# oldest written command still waiting for one (a write holding several
+# commands waits for as many acks). Without echo mode commands get no ack and
+# only the queue wait is known; !CT is never waited for, since whether it
+# acks itself depends on the previous echo state.
+# All methods except the snapshot/export ones run on the I/O thread.
+# With no LinkStats attached SerialIO only pays an "is not None" check.
+import bisect
+import csv
+import json
+import time
+from collections import deque
+
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)  # upper bounds in s
+MAX_WAITING = 10000
+_LABELS = [f"<{b * 1000:g}ms" for b in BUCKETS] + [f">={BUCKETS[-1] * 1000:g}ms"]
+
+
+def command_type(data):
+    # "PR100,0;" -> "PR", "!ON0;" -> "!ON0", "!TS500;" -> "!TS"
+    text = data[:4].decode("ascii", errors="replace").upper()
+    if text.startswith("!ON"):
+        return text.rstrip(";")
+    return text[:3] if text.startswith("!") else text[:2]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_right(BUCKETS, value)] += 1
+        self.n += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.total / self.n if self.n else 0.0
+
+    def percentile(self, p):
+        # Upper bound of the bucket holding the p-th percentile
+        rank = p / 100 * self.n
+        seen = 0
+        for k, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return BUCKETS[k] if k < len(BUCKETS) else self.max
+        return 0.0
+
+    def as_dict(self):
+        return {"n": self.n, "mean_s": self.mean, "max_s": self.max, "p50_s": self.percentile(50),
+                "p95_s": self.percentile(95), "buckets": dict(zip(_LABELS, self.counts))}
+
+
+class LinkStats:
+    def __init__(self, max_records=200000):
+        self.max_records = max_records  # per-command rows kept for CSV export
+        self.reset()
+
+    def reset(self):
+        self.start = time.perf_counter()
+        self.records = []  # [type, bytes, enqueued, written, acked] in s since start
+        self.waiting = deque()  # [record, acks still expected] in write order
+        self.queries = deque()  # records of !ON0 queries waiting for their reply
+        self.latency = {}  # command type -> Histogram of enqueue -> ack/reply
+        self.queue_wait = Histogram()  # enqueue -> write
+        self.commands = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.acks = 0
+        self.unmatched_acks = 0
+        self.queue_depth = 0  # writes queued behind the current one
+        self.max_queue_depth = 0
+        self.max_in_flight = 0
+        self.cts_stall = 0.0  # s with CTS deasserted
+        self.cts_supported = None  # unknown until the first poll
+        self._cts_since = None
+
+    # --- called by SerialIO ----------------------------------------------
+
+    def on_write(self, data, queued, written, depth, is_query=False):
+        now = written - self.start
+        kind = command_type(data)
+        record = [kind, len(data), (queued - self.start) if queued else now, now, None]
+        if len(self.records) < self.max_records:
+            self.records.append(record)
+        self.commands += 1
+        self.bytes_out += len(data)
+        self.queue_wait.add(now - record[2])
+        self.queue_depth = depth
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        if kind != "!CT":
+            self.waiting.append([record, max(data.count(b";"), 1)])
+            if len(self.waiting) > MAX_WAITING:
+                self.waiting.popleft()  # no echo mode: nothing will ever be acked
+        self.max_in_flight = max(self.max_in_flight, len(self.waiting))
+        if is_query:
+            self.queries.append(record)
+
+    def on_read(self, n):
+        self.bytes_in += n
+
+    def on_ack(self, count):
+        now = time.perf_counter() - self.start
+        self.acks += count
+        while count and self.waiting:
+            entry = self.waiting[0]
+            take = min(count, entry[1])
+            entry[1] -= take
+            count -= take
+            if entry[1] == 0:
+                self.waiting.popleft()
+                record = entry[0]
+                if record[4] is None:  # queries are timed by their reply
+                    record[4] = now
+                    self._hist(record[0]).add(now - record[2])
+        self.unmatched_acks += count
+
+    def on_reply(self):
+        # Position reply for the oldest pending query; in echo mode its "C\r"
+        # follows and removes it from the ack queue
+        if not self.queries:
+            return
+        record = self.queries.popleft()
+        record[4] = time.perf_counter() - self.start
+        self._hist(record[0]).add(record[4] - record[2])
+
+    def poll_cts(self, port):
+        # Accumulates the time CTS is deasserted; ports without modem lines
+        # (e.g. a pty) are detected on the first poll and skipped
+        if self.cts_supported is False:
+            return
+        try:
+            cts = port.cts
+        except Exception:
+            self.cts_supported = False
+            return
+        self.cts_supported = True
+        now = time.perf_counter()
+        if not cts and self._cts_since is None:
+            self._cts_since = now
+        elif cts and self._cts_since is not None:
+            self.cts_stall += now - self._cts_since
+            self._cts_since = None
+
+    def _hist(self, kind):
+        hist = self.latency.get(kind)
+        if hist is None:
+            hist = self.latency[kind] = Histogram()
+        return hist
+
+    # --- reading (any thread) --------------------------------------------
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def stall_time(self):
+        if self._cts_since is not None:
+            return self.cts_stall + time.perf_counter() - self._cts_since
+        return self.cts_stall
+
+    def summary(self):
+        elapsed = max(self.elapsed, 1e-9)
+        stall = f"{self.stall_time():.2f} s" if self.cts_supported else "n/a"
+        return (f"{self.commands} commands, out {self.bytes_out / elapsed:.0f} B/s, in {self.bytes_in / elapsed:.0f} B/s, "
+                f"in flight {len(self.waiting)} (max {self.max_in_flight}), queue max {self.max_queue_depth}, "
+                f"CTS stall {stall}")
+
+    def latency_lines(self):
+        return [f"{kind:<5} n={h.n:<6} mean {h.mean * 1000:7.1f} ms  p95 <{h.percentile(95) * 1000:g} ms  "
+                f"max {h.max * 1000:7.1f} ms" for kind, h in sorted(self.latency.items())]
+
+    def as_dict(self):
+        elapsed = self.elapsed
+        return {
+            "elapsed_s": elapsed,
+            "commands": self.commands,
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "bytes_out_per_s": self.bytes_out / elapsed if elapsed else 0.0,
+            "bytes_in_per_s": self.bytes_in / elapsed if elapsed else 0.0,
+            "acks": self.acks,
+            "unmatched_acks": self.unmatched_acks,
+            "in_flight": len(self.waiting),
+            "max_in_flight": self.max_in_flight,
+            "max_queue_depth": self.max_queue_depth,
+            "cts_stall_s": self.stall_time() if self.cts_supported else None,
+            "queue_wait": self.queue_wait.as_dict(),
+            "latency": {kind: h.as_dict() for kind, h in sorted(self.latency.items())},
+        }
+
+    def export(self, path):
+        # .json: summary and histograms, anything else: one CSV row per command
+        if path.lower().endswith(".json"):
+            with open(path, "w") as f:
+                json.dump(self.as_dict(), f, indent=2)
+            return
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["index", "type", "bytes", "enqueued_s", "written_s", "acked_s", "latency_s"])
+            for k, (kind, n, queued, written, acked) in enumerate(list(self.records)):
+                writer.writerow([k, kind, n, f"{queued:.6f}", f"{written:.6f}",
+                                 "" if acked is None else f"{acked:.6f}",
+                                 "" if acked is None else f"{acked - queued:.6f}"])
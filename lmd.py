@@ -0,0 +1,308 @@
+# Reader for LPKF LMD job files (CircuitCAM output, "LMD Version 3.1").
+# Layout, as found in the files shipped under resources/:
+#   text header, lines ending "\n\r", terminated by 0x1A
+#   0x0B <op> <u32 size>         payload size of each data record type
+#   0x82                         phase start, followed by
+#   0x81 <fields> 0x00           phase name and layer ("MillingTop", "InsulateTop")
+#   0x80 <fields> 0x00           one per tool: number, kind, diameter [m], name
+#   data records until 0x00:     <op> <payload>, little endian float32 in metres
+#     0x0C x y                   move to (starts a polyline)
+#     0x0D x y                   line to
+#     0x11 x y cx cy r           arc to x,y around cx,cy; r < 0 clockwise
+#     0x0E x y r                 circle
+#     0x0F x y                   drill hit
+#     0x10 n                     select tool n (u32)
+# Fields are tagged: 0x01 u8, 0x03 i32, 0x05 float32, 0x07 zero terminated text.
+# The file is memory-mapped; one pass finds the record offsets and NumPy
+# decodes all coordinates of a kind at once.
+import math
+import mmap
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+UNITS_PER_M = 100000  # machine units (1/100 mm, the controller's "µm") per metre
+
+OP_SIZE = 0x0B
+OP_MOVE = 0x0C
+OP_LINE = 0x0D
+OP_CIRCLE = 0x0E
+OP_DRILL = 0x0F
+OP_TOOL = 0x10
+OP_ARC = 0x11
+OP_TOOLDEF = 0x80
+OP_PHASEDEF = 0x81
+OP_PHASE = 0x82
+OP_END = 0x00
+EOF_MARK = 0x1A
+
+TOOL_KINDS = {0: "mill", 1: "drill", 2: "marking"}
+
+Tool = namedtuple("Tool", "number kind diameter name")  # diameter in mm
+
+
+class LmdError(Exception):
+    pass
+
+
+class Phase:
+    # Geometry in machine units (int32). Polyline i is points[starts[i]:starts[i + 1]].
+    def __init__(self, name, layer, tools):
+        self.name = name
+        self.layer = layer
+        self.tools = tools
+        self.points = np.empty((0, 2), np.int32)
+        self.starts = np.zeros(1, np.int64)
+        self.path_tools = np.empty(0, np.int32)
+        self.circles = np.empty((0, 3), np.int32)  # x, y, radius
+        self.circle_tools = np.empty(0, np.int32)
+        self.drills = np.empty((0, 2), np.int32)
+        self.drill_tools = np.empty(0, np.int32)
+
+    @property
+    def title(self):
+        return f"{self.name}/{self.layer}"
+
+    @property
+    def polylines(self):
+        return len(self.starts) - 1
+
+    @property
+    def segments(self):
+        return len(self.points) - self.polylines
+
+    def polyline(self, i):
+        return self.points[self.starts[i]:self.starts[i + 1]]
+
+    def summary(self):
+        return (f"{self.title}: {self.polylines} paths, {self.segments} segments, "
+                f"{len(self.circles)} circles, {len(self.drills)} drills, {len(self.tools)} tools")
+
+
+class LmdJob:
+    def __init__(self, version, header, phases):
+        self.version = version
+        self.header = header  # "Generated by", "User", ... from the text header
+        self.phases = phases
+
+    def phase(self, title):
+        for phase in self.phases:
+            if title in (phase.title, phase.name):
+                return phase
+        raise KeyError(title)
+
+
+def read_lmd(path, tolerance=1):
+    # tolerance: max. chord error in machine units when arcs are split into lines
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise LmdError(f"{path}: empty file")
+    try:
+        return _parse(mm, tolerance / UNITS_PER_M)
+    finally:
+        mm.close()
+
+
+def _parse(mm, tol):
+    head_end = mm.find(bytes([EOF_MARK]))
+    if head_end < 0 or not mm[:4] == b"LPKF":
+        raise LmdError("Not an LMD file")
+    lines = [line.strip() for line in mm[:head_end].decode("latin-1").split("\n")]
+    version = lines[0]
+    header = {}
+    for line in lines[1:]:
+        key, sep, value = line.partition(":")
+        if sep:
+            header[key.strip()] = value.strip()
+
+    # Record length (opcode + payload) per opcode, or 0 for structural bytes
+    step = [0] * 256
+    i = head_end + 1
+    while i < len(mm) and mm[i] == OP_SIZE:
+        step[mm[i + 1]] = 1 + int.from_bytes(mm[i + 2:i + 6], "little")
+        i += 6
+
+    ops = array("B")
+    offs = array("q")
+    phases = []  # (name, layer, tools, first record index)
+    end = len(mm)
+    while i < end:
+        op = mm[i]
+        n = step[op]
+        if n:
+            ops.append(op)
+            offs.append(i + 1)
+            i += n
+        elif op == OP_END:
+            i += 1
+        elif op == OP_PHASE:
+            phases.append(["", "", [], len(ops)])
+            i += 1
+        elif op == OP_PHASEDEF or op == OP_TOOLDEF:
+            if not phases:
+                raise LmdError(f"Definition outside a phase at offset {i}")
+            fields, i = _fields(mm, i + 1)
+            if op == OP_PHASEDEF:
+                phases[-1][0:2] = (fields + ["", ""])[:2]
+            else:
+                number, kind, diameter, name = (fields + [0, 0, 0.0, ""])[:4]
+                phases[-1][2].append(Tool(number, TOOL_KINDS.get(kind, str(kind)), round(diameter * 1000, 4), name))
+        else:
+            raise LmdError(f"Unknown record 0x{op:02X} at offset {i}")
+    if i > end:
+        raise LmdError("Truncated record at end of file")
+
+    buf = np.frombuffer(mm, np.uint8)
+    try:
+        ops = np.frombuffer(ops, np.uint8)
+        offs = np.frombuffer(offs, np.int64)
+        bounds = [p[3] for p in phases] + [len(ops)]
+        result = []
+        for k, (name, layer, tools, _) in enumerate(phases):
+            phase = Phase(name, layer, tools)
+            _decode(phase, buf, ops[bounds[k]:bounds[k + 1]], offs[bounds[k]:bounds[k + 1]], tol)
+            result.append(phase)
+    finally:
+        del buf  # release the export so the mmap can be closed
+    return LmdJob(version, header, result)
+
+
+def _fields(mm, i):
+    fields = []
+    while True:
+        tag = mm[i]
+        i += 1
+        if tag == 0x00:
+            return fields, i
+        if tag == 0x01:
+            fields.append(mm[i])
+            i += 1
+        elif tag == 0x03:
+            fields.append(int.from_bytes(mm[i:i + 4], "little", signed=True))
+            i += 4
+        elif tag == 0x05:
+            fields.append(float(np.frombuffer(mm[i:i + 4], "<f4")[0]))
+            i += 4
+        elif tag == 0x07:
+            stop = mm.find(b"\0", i)
+            if stop < 0:
+                raise LmdError(f"Unterminated text at offset {i}")
+            fields.append(mm[i:stop].decode("latin-1"))
+            i = stop + 1
+        else:
+            raise LmdError(f"Unknown field tag 0x{tag:02X} at offset {i - 1}")
+
+
+def _floats(buf, offs, n):
+    # n little endian float32 values at each offset -> (len(offs), n) float64
+    idx = offs[:, None] + np.arange(4 * n)
+    return buf[idx].view("<f4").astype(np.float64)
+
+
+def _to_units(values):
+    return np.rint(values * UNITS_PER_M).astype(np.int32)
+
+
+def _decode(phase, buf, ops, offs, tol):
+    # Tool of every record: value of the last preceding tool select
+    sel = np.flatnonzero(ops == OP_TOOL)
+    tools = np.zeros(len(ops), np.int32)
+    if len(sel):
+        values = buf[offs[sel][:, None] + np.arange(4)].view("<u4")[:, 0].astype(np.int32)
+        last = np.full(len(ops), -1)
+        last[sel] = np.arange(len(sel))
+        last = np.maximum.accumulate(last)
+        tools = np.where(last >= 0, values[last], 0).astype(np.int32)
+
+    for op, attr, n in ((OP_DRILL, "drills", 2), (OP_CIRCLE, "circles", 3)):
+        mask = ops == op
+        if mask.any():
+            values = _floats(buf, offs[mask], n)
+            values[:, 2:] = np.abs(values[:, 2:])
+            setattr(phase, attr, _to_units(values))
+            setattr(phase, attr[:-1] + "_tools", tools[mask])
+
+    geo = (ops == OP_MOVE) | (ops == OP_LINE) | (ops == OP_ARC)
+    if not geo.any():
+        return
+    g_ops = ops[geo]
+    g_offs = offs[geo]
+    g_tools = tools[geo]
+    ends = _floats(buf, g_offs, 2)
+    counts = np.ones(len(g_ops), np.int64)
+
+    arcs = np.flatnonzero(g_ops == OP_ARC)
+    if len(arcs):
+        ex, ey, cx, cy, r = _floats(buf, g_offs[arcs], 5).T
+        sx, sy = ends[np.maximum(arcs - 1, 0)].T
+        radius = np.abs(r)
+        a0 = np.arctan2(sy - cy, sx - cx)
+        sweep = np.arctan2(ey - cy, ex - cx) - a0
+        ccw = r > 0
+        sweep = np.where(ccw, np.mod(sweep, 2 * math.pi), -np.mod(-sweep, 2 * math.pi))
+        sweep = np.where(sweep == 0, np.where(ccw, 2 * math.pi, -2 * math.pi), sweep)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = 2 * np.arccos(np.clip(1 - tol / radius, -1, 1))
+            n = np.ceil(np.abs(sweep) / step)
+        n = np.where(np.isfinite(n), np.maximum(n, 1), 1).astype(np.int64)
+        counts[arcs] = n
+
+    last = np.cumsum(counts) - 1
+    points = np.empty((last[-1] + 1, 2))
+    points[last] = ends
+    if len(arcs) and (n > 1).any():
+        # Intermediate points k = 1..n-1 of every arc; the end point is already in place
+        inner = n - 1
+        rep = np.repeat(np.arange(len(arcs)), inner)
+        k = np.arange(len(rep)) - np.repeat(np.cumsum(inner) - inner, inner) + 1
+        angle = a0[rep] + sweep[rep] * k / n[rep]
+        slot = last[arcs][rep] - n[rep] + k
+        points[slot, 0] = cx[rep] + radius[rep] * np.cos(angle)
+        points[slot, 1] = cy[rep] + radius[rep] * np.sin(angle)
+
+    moves = np.flatnonzero(g_ops == OP_MOVE)
+    starts = last[moves]
+    path_tools = g_tools[moves]
+    if not len(moves) or moves[0] != 0:
+        starts = np.concatenate(([0], starts))
+        path_tools = np.concatenate((g_tools[:1], path_tools))
+    phase.points = _to_units(points)
+    phase.starts = np.append(starts, len(points)).astype(np.int64)
+    phase.path_tools = path_tools.astype(np.int32)
+
+
+def phase_commands(phase, start=(0, 0), offset=(0, 0)):
+    # HPGL command list drawing the phase with the pen: PU/PR travel, PD, PR
+    # per segment (CI for circles, a pen dip per drill hit), ending pen up.
+    # start: current head position, offset: machine position of the board origin.
+    out = ["PU;"]
+    pos = np.asarray(start[:2], np.int64)
+    shift = np.asarray(offset[:2], np.int64)
+
+    if len(phase.points):
+        pts = phase.points.astype(np.int64) + shift
+        deltas = np.diff(np.vstack((pos, pts)), axis=0).tolist()
+        starts = phase.starts.tolist()
+        for s, e in zip(starts[:-1], starts[1:]):
+            out.append("PR%d,%d;" % tuple(deltas[s]))
+            out.append("PD;")
+            out.extend("PR%d,%d;" % (dx, dy) for dx, dy in deltas[s + 1:e] if dx or dy)
+            out.append("PU;")
+        pos = pts[-1]
+
+    for centers in (phase.circles, phase.drills):
+        if not len(centers):
+            continue
+        pts = centers[:, :2].astype(np.int64) + shift
+        deltas = np.diff(np.vstack((pos, pts)), axis=0).tolist()
+        for (dx, dy), row in zip(deltas, centers.tolist()):
+            out.append("PR%d,%d;" % (dx, dy))
+            out.append("PD;")
+            if len(row) > 2:
+                out.append("CI%d;" % row[2])
+            out.append("PU;")
+        pos = pts[-1]
+    return out
@@ -0,0 +1,94 @@
+# Dead-reckoned head position.
+# Every command sent to the machine is integrated on the host (PR, PA, IN;
+# CI draws around the current position and leaves it unchanged), so moves
+# can be checked against the workspace without asking the machine first.
+# The prediction is reconciled with a "!ON0;" reply only at sync points:
+# every `sync_every` commands, when the link has been idle, or before an
+# absolute move. A query travels behind the commands sent before it, so its
+# reply is compared with the prediction at the time the query was sent;
+# commands sent while the reply was on its way stay applied on top, and so
+# do corrections from replies to earlier queries that were still pending.
+from hpgl import parse_command, split_commands
+
+
+class PositionModel:
+    def __init__(self, sync_every=50, idle_sync=1.0, sync_before_absolute=True):
+        self.sync_every = sync_every  # commands between syncs, 0 = never by count
+        self.idle_sync = idle_sync  # s without commands before a sync, 0 = never
+        self.sync_before_absolute = sync_before_absolute
+        self.position = [0, 0, 0]  # predicted [x, y, z] in 1/100 mm
+        self.known = False  # False until the first reply after connecting
+        self.since_sync = 0  # commands integrated since the last sync point
+        self.syncs = 0
+        self.drift = (0, 0, 0)  # last difference machine - prediction
+        self.max_drift = 0  # largest |dx| or |dy| seen
+        self.drifted = 0  # syncs with a nonzero difference
+        self.corrected = [0, 0, 0]  # sum of all shifts applied by reconcile
+
+    def _walk(self, cmd):
+        # (mnemonic, args, x, y, z) after each command in cmd, from the prediction
+        x, y, z = self.position
+        for part in split_commands(cmd):
+            try:
+                mnemonic, args = parse_command(part)
+            except ValueError:
+                continue
+            if mnemonic == "PR" and args:
+                x += args[0]
+                y += args[1] if len(args) > 1 else 0
+            elif mnemonic == "PA" and len(args) >= 2:
+                x, y = args[0], args[1]
+            elif mnemonic == "IN":
+                x = y = z = 0
+            yield mnemonic, args, x, y, z
+
+    def target(self, cmd):
+        # Position after cmd (one or more commands) without applying it
+        pos = list(self.position)
+        for _, _, x, y, z in self._walk(cmd):
+            pos = [x, y, z]
+        return pos
+
+    def extents(self, cmd):
+        # Points the head reaches during cmd: end points and circle bounds
+        points = []
+        for mnemonic, args, x, y, _ in self._walk(cmd):
+            if mnemonic == "CI" and args:
+                r = abs(args[0])
+                points += [(x - r, y - r), (x + r, y + r)]
+            else:
+                points.append((x, y))
+        return points
+
+    def apply(self, cmd):
+        self.position = self.target(cmd)
+        self.since_sync += 1
+
+    def due(self):
+        return bool(self.sync_every) and self.since_sync >= self.sync_every
+
+    def sync_point(self):
+        # Called when "!ON0;" is sent: restarts the command count and returns
+        # the prediction its reply will be compared with, less the corrections so far
+        self.since_sync = 0
+        return [p - c for p, c in zip(self.position, self.corrected)]
+
+    def reconcile(self, expected, actual):
+        # expected: sync_point() when the query was sent, actual: the machine's reply.
+        # Shifts the prediction by the difference and returns it.
+        drift = tuple(int(a) - int(e) - int(c) for a, e, c in zip(actual, expected, self.corrected))
+        self.position = [p + d for p, d in zip(self.position, drift)]
+        self.corrected = [c + d for c, d in zip(self.corrected, drift)]
+        if not self.known:
+            self.known = True  # first fix, not drift
+            return (0, 0, 0)
+        self.syncs += 1
+        self.drift = drift
+        if any(drift):
+            self.drifted += 1
+            self.max_drift = max(self.max_drift, abs(drift[0]), abs(drift[1]))
+        return drift
+
+    def summary(self):
+        return (f"{self.syncs} syncs, {self.drifted} with drift, max {self.max_drift / 100:.2f} mm, "
+                f"last {self.drift[0]},{self.drift[1]}")
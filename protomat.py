@@ -0,0 +1,683 @@
+# Headless machine session for the Protomat and a small command line.
+# ProtomatSession owns everything that talks to the machine: the serial
+# connection and its I/O thread, pen/motor/position tracking, workspace
+# checks, emulation and job streaming. controller.py wraps it in the Tk
+# window; scripts and the CLI use it directly:
+#
+#   python -m protomat [--port /dev/ttyUSB0] connect|query|home
+#   python -m protomat send job.hpgl [--compile] [--window 8]
+#   python -m protomat send board.LMD --phase 0 --optimize [--dry-run]
+#   python -m protomat send board.drl --optimize --origin 10 10 [--phase Drilling/T1]
+#   python -m protomat resume [--rehome] [--discard]
+#
+# Nothing here imports tkinter, and pyserial, numpy and the job modules are
+# only imported when a command needs them, so the CLI starts in a few ms.
+# The head position is dead-reckoned (position_model.py) and only
+# reconciled with "!ON0;" at sync points, never before every jog.
+# With journal_path set, jobs are journaled (journal.py) and an unfinished
+# one can be resumed after a crash or a lost connection.
+# Threads: I/O callbacks and job progress are handed to `dispatch`
+# (the Tk window passes call_in_gui, the CLI runs them in place), so all
+# state changes happen on one thread. `on_log` must be thread-safe.
+import argparse
+import os
+import sys
+import threading
+
+from hpgl import parse_command, split_commands
+from position_model import PositionModel
+
+VIRTUAL_PORT = "/tmp/ttyProtomat"  # symlink from virtual_protomat.py
+DEFAULT_JOURNAL = os.path.join(os.path.expanduser("~"), ".protomat", "job.journal")
+PARITIES = ("None", "Even", "Odd")
+HOME_TIMEOUT = 30.0  # s for the "!ON0;" reply after IN; (homing across the table takes about 10 s)
+DRILL_SUFFIXES = (".drl", ".drd", ".xln", ".exc")  # drill_import.EXCELLON_SUFFIXES, without loading numpy
+
+
+class SessionError(Exception):
+    pass
+
+
+class NotConnectedError(SessionError):
+    pass
+
+
+class JobRejected(SessionError):
+    pass
+
+
+def list_ports():
+    # Serial devices plus the virtual machine, if it is running
+    import serial.tools.list_ports
+    ports = [port.device for port in serial.tools.list_ports.comports()]
+    if os.path.exists(VIRTUAL_PORT):
+        ports.append(VIRTUAL_PORT)
+    return ports
+
+
+class ProtomatSession:
+    def __init__(self, on_log=None, on_change=None, dispatch=None, schedule=None):
+        self.on_log = on_log  # on_log(text), called from any thread
+        self.on_change = on_change  # on_change() after position, pen or motor changed
+        self.dispatch = dispatch or (lambda func, *args: func(*args))
+        self.schedule = schedule or _timer  # schedule(delay_s, func)
+        self.serial_port = None
+        self.serial_io = None  # I/O thread that owns the port
+        self.streamer = None  # active JobStreamer during a job
+        self.stats = None  # linkstats.LinkStats of the current or last recording
+        self.recording = False
+        self.emulation = False
+        self.log_traffic = True  # log every sent and received command
+        self.journal_path = None  # job journal for resuming, None = no journal
+        self.sent = 0  # job commands sent since the session was created
+        self.model = PositionModel()  # predicted position, sync points and drift
+        self._idle = 0  # generation of the pending idle sync
+        self.pen_down = False
+        self.motor_enabled = False
+        self.workspace_x = 45000  # 450 mm
+        self.workspace_y = 22000  # 220 mm
+
+    @property
+    def position(self):
+        # Predicted [x, y, z] in 1/100 mm
+        return self.model.position
+
+    @position.setter
+    def position(self, pos):
+        self.model.position = list(pos)
+
+    def log(self, text):
+        if self.on_log:
+            self.on_log(text)
+
+    def changed(self):
+        if self.on_change:
+            self.on_change()
+
+    # --- connection ------------------------------------------------------
+
+    @property
+    def connected(self):
+        return self.serial_io is not None
+
+    def connect(self, port, baudrate=9600, bytesize=8, parity="None", stopbits=1, rtscts=True):
+        import serial  # pyserial is only needed once a port is opened
+        from serial_io import SerialIO
+        if self.connected:
+            raise SessionError("Already connected")
+        if parity not in PARITIES:
+            raise SessionError(f"Unknown parity {parity!r}")
+        self.serial_port = serial.Serial(
+            port=port,
+            baudrate=int(baudrate),
+            bytesize=int(bytesize),
+            parity={"None": serial.PARITY_NONE, "Even": serial.PARITY_EVEN, "Odd": serial.PARITY_ODD}[parity],
+            stopbits=float(stopbits),
+            timeout=0.02,
+            rtscts=rtscts,
+            dsrdtr=False,
+            xonxoff=False
+        )
+        self.serial_io = SerialIO(self.serial_port, on_data=self.on_serial_data,
+                                  on_position=self.on_serial_position, on_ack=self.on_serial_ack,
+                                  on_event=self.on_serial_event, stats=self.stats if self.recording else None)
+        self.serial_io.start()
+        self.model.known = False
+        self.log(f"Connected to {port}\n")
+        self.sync_position()  # first fix; checked moves wait for it
+
+    def disconnect(self):
+        if self.streamer:
+            self.streamer.cancel()
+        if self.serial_io:
+            self.serial_io.stop()
+            self.serial_io = None
+        if self.serial_port:
+            self.serial_port.close()
+            self.serial_port = None
+        self.log("Disconnected\n")
+
+    def set_recording(self, on):
+        # Link instrumentation on/off; the last recording stays in self.stats for export
+        self.recording = on
+        if on:
+            self.new_recording()
+        elif self.serial_io:
+            self.serial_io.stats = None
+
+    def new_recording(self):
+        # Fresh LinkStats, swapped in whole so the I/O thread never sees a half reset
+        from linkstats import LinkStats
+        self.stats = LinkStats()
+        if self.serial_io:
+            self.serial_io.stats = self.stats
+
+    def _require_connection(self):
+        if not self.serial_io:
+            raise NotConnectedError("Please connect to a serial port first or enable Emulation Mode.")
+
+    def _require_no_job(self):
+        # Anything sent during a job would shift its moves and be counted as one of its acks
+        if self.streamer:
+            raise SessionError("A job is running. Stop it before sending commands.")
+
+    # Callbacks from the I/O thread
+    def on_serial_data(self, data):
+        if self.log_traffic:
+            self.log(f"Received: {data.decode(errors='replace')}")
+
+    def on_serial_position(self, pos):
+        # Reply to a "!ON0;" typed by the user: compare with the prediction
+        self.dispatch(self.on_sync, None, pos)
+
+    def on_serial_ack(self, count):
+        if self.streamer:
+            self.streamer.ack(count)
+
+    def on_serial_event(self, event):
+        from framer import ERROR
+        if event.kind == ERROR:
+            self.log(f"Machine error: E{event.value}\n")
+
+    # --- single commands -------------------------------------------------
+
+    def track_state(self, cmd):
+        # Pen and motor state from a command sent to the machine
+        key = cmd.strip().upper()
+        if key in ("PU;", "PD;"):
+            self.pen_down = key == "PD;"
+        elif key in ("!EM1;", "!EM0;"):
+            self.motor_enabled = key == "!EM1;"
+        else:
+            return
+        self.changed()
+
+    def send_command(self, cmd):
+        # Returns the write Future; None in emulation mode
+        if self.emulation:
+            self.emulate(cmd)
+            return None
+        self._require_connection()
+        self._require_no_job()
+        fut = self.serial_io.write(cmd.encode())
+        fut.add_done_callback(self.on_write_done)
+        if self.log_traffic:
+            self.log(f"Sent: {cmd}\n")
+        self.track_state(cmd)
+        self.model.apply(cmd)
+        self.changed()
+        self.after_send()
+        return fut
+
+    def emulate(self, cmd):
+        self.log(f"Sent: {cmd}\n")
+        self.track_state(cmd)
+        if not self.within_workspace(self.model.extents(cmd)):
+            self.log("Emulation: Movement would go outside workspace! Command not executed.\n")
+        else:
+            before = self.model.position
+            self.model.apply(cmd)
+            if self.model.position != before:
+                self.log(f"Emulation: New position X={self.position[0]} Y={self.position[1]}\n")
+                self.changed()
+        self.log("Received: Emulation, no communication\n")
+
+    def on_write_done(self, fut):
+        # Runs in the I/O thread
+        if fut.exception():
+            self.log(f"Send Error: {fut.exception()}\n")
+
+    # --- position sync ---------------------------------------------------
+
+    def after_send(self):
+        # Sync point after every sync_every commands, or once the link went idle
+        if self.model.due():
+            self.sync_position()
+        elif self.model.idle_sync:
+            self._idle += 1
+            idle = self._idle
+            self.schedule(self.model.idle_sync, lambda: self.dispatch(self.on_idle, idle))
+
+    def on_idle(self, idle):
+        if idle == self._idle and self.model.since_sync:
+            self.sync_position()
+
+    def sync_position(self, callback=None, timeout=None, on_error=None):
+        # Non-blocking "!ON0;": the reply arrives on the I/O thread, on_sync and
+        # callback (or on_error(exception)) run via dispatch. Not during a job,
+        # whose acks it would disturb. timeout as in wait_position.
+        if self.emulation or not self.serial_io or self.streamer:
+            if callback:
+                callback()
+            return
+        expected = self.model.sync_point()
+        fut = self.serial_io.query_position(timeout)
+
+        def done(f):
+            if f.exception():
+                self.log(f"Position query failed: {f.exception()}\n")
+                if on_error:
+                    self.dispatch(on_error, f.exception())
+                return
+            self.dispatch(self.on_sync, expected, f.result(), callback)
+        fut.add_done_callback(done)
+
+    def on_sync(self, expected, pos, callback=None):
+        drift = self.model.reconcile(self.model.sync_point() if expected is None else expected, pos)
+        if any(drift):
+            self.log(f"Position drift X={drift[0]} Y={drift[1]} Z={drift[2]} ({self.model.summary()})\n")
+        self.changed()
+        if callback:
+            callback()
+
+    def wait_position(self, timeout=None):
+        # Blocking "!ON0;" round trip for scripts; returns [x, y, z].
+        # timeout counts from the write (default SerialIO.query_timeout)
+        if self.emulation:
+            return list(self.position)
+        self._require_connection()
+        expected = self.model.sync_point()
+        pos = self.serial_io.query_position(timeout).result()
+        self.on_sync(expected, pos)
+        return pos
+
+    # --- checked moves ---------------------------------------------------
+
+    def within_workspace(self, points):
+        return all(0 <= x <= self.workspace_x and 0 <= y <= self.workspace_y for x, y in points)
+
+    def set_workspace(self, x, y):
+        self.workspace_x = x
+        self.workspace_y = y
+
+    def move_relative_checked(self, dx, dy):
+        # Checked against the predicted position; no round trip before the move
+        # once the position is known after connecting
+        if not self.emulation:
+            self._require_connection()
+            self._require_no_job()
+            if not self.model.known:
+                self.sync_position(lambda: self._move_relative_checked(dx, dy))
+                return
+        self._move_relative_checked(dx, dy)
+
+    def _move_relative_checked(self, dx, dy):
+        if not self.within_workspace([(self.position[0] + dx, self.position[1] + dy)]):
+            self.log("Movement would go outside workspace! Command not executed.\n")
+            return
+        self.send_command(f"PR{dx},{dy};")
+
+    def move_absolute_checked(self, x, y):
+        self._require_no_job()
+        if not self.within_workspace([(x, y)]):
+            self.log("Target position outside workspace! Command not executed.\n")
+            return
+        if self.emulation or (self.model.known and not self.model.sync_before_absolute):
+            self.move_absolute_from_position(x, y)
+            return
+        self._require_connection()
+        self.sync_position(lambda: self.move_absolute_from_position(x, y))
+
+    def move_absolute_from_position(self, x, y):
+        dx = x - self.position[0]
+        dy = y - self.position[1]
+        self.send_command(f"PR{dx},{dy};")
+
+    # --- jobs ------------------------------------------------------------
+
+    def compile_commands(self, commands, start=None, absolute=False):
+        # Merges PR moves and drops redundant commands; None on error
+        from compiler import CompileError, compile_flow
+        if start is None and absolute:
+            start = self.position[:2]
+        try:
+            result = compile_flow(commands, start=start, absolute=absolute)
+        except CompileError as e:
+            self.log(f"Compile error: {e}\n")
+            return None
+        if result.bytes_after < result.bytes_before:
+            self.log(f"Compiled: {result.summary()}\n")
+        return result.commands
+
+    def estimate(self, commands, baudrate=9600, start=None):
+        # Estimate from the current head position (or start), None when numpy is missing
+        try:
+            from estimator import estimate_commands
+            return estimate_commands(commands, baudrate=int(baudrate), start=start or self.position[:2])
+        except (ImportError, ValueError):
+            return None
+
+    def estimate_phase(self, phase, start=None, offset=(0, 0), baudrate=9600):
+        # Estimate of a phase in its current order, without building the commands
+        try:
+            from estimator import estimate_phase
+            return estimate_phase(phase, start or self.position[:2], offset, baudrate=int(baudrate))
+        except (ImportError, ValueError):
+            return None
+
+    def log_estimate(self, commands, baudrate=9600):
+        estimate = self.estimate(commands, baudrate)
+        if estimate:
+            self.log(f"Estimated: {estimate.summary()}\n")
+
+    def phase_commands(self, phase, start=None, optimize=True, compile_=False, absolute=False, offset=(0, 0)):
+        # Command list for an LMD or drill phase, starting at the current head
+        # position; offset: machine position of the board origin
+        from lmd import phase_commands
+        if start is None:
+            start = list(self.position)
+        if optimize:
+            from travel import optimize_phase
+            phase, report = optimize_phase(phase, start=start, offset=offset)
+            self.log(f"Pen-up {report.summary()}\n")
+        commands = phase_commands(phase, start=start, offset=offset)
+        if compile_:
+            commands = self.compile_commands(commands, start=start[:2], absolute=absolute)
+        return commands
+
+    def check_flow(self, commands, start=None):
+        # Pre-flight check of the whole job against the workspace, from the
+        # predicted position; raises JobRejected before anything is sent
+        if start is None and self.connected and not self.emulation and not self.model.known:
+            self.wait_position(timeout=2.0)
+        try:
+            from bounds import BoundsError, check_bounds
+        except ImportError:
+            self.log("Workspace check skipped (needs numpy)\n")
+            return
+        try:
+            check_bounds(commands, (self.workspace_x, self.workspace_y), start or self.position[:2])
+        except BoundsError as e:
+            self.log(f"Job rejected: {e}\n")
+            raise JobRejected(str(e)) from e
+
+    def start_job(self, commands, window=8, wait=False, resume=None):
+        # Streams commands on a job thread, or with wait=True in the calling
+        # thread and returns the StreamStats (None if the job failed).
+        # resume: (ResumePoint, preamble length) when continuing a journaled job
+        if not commands:
+            return None
+        self.check_flow(commands)
+        if self.emulation:
+            for cmd in commands:
+                self.send_command(cmd)
+            return None
+        self._require_connection()
+        if self.streamer:
+            self.log("A job is already running.\n")
+            return None
+        from streamer import JobStreamer
+        if self.recording:
+            self.new_recording()  # statistics cover this job
+        journal = self.open_journal(commands, resume)
+        self.streamer = JobStreamer(self.serial_io.write, window=window, on_progress=self.on_stream_progress,
+                                    on_ack=journal.ack if journal else None, query=self.serial_io.query_position)
+        if wait:
+            return self.run_job(self.streamer, commands, journal)
+        threading.Thread(target=self.run_job, args=(self.streamer, commands, journal), daemon=True).start()
+        return None
+
+    def run_job(self, streamer, commands, journal=None):
+        # Runs on the job thread; acks arrive via the I/O thread. Returns StreamStats or None
+        from streamer import StreamError
+        self.log(f"Streaming {len(commands)} commands (window {streamer.window})\n")
+        stats = None
+        try:
+            stats = streamer.run(commands, self.position[:2])
+            self.log(f"Job finished: {stats.summary()}\n")
+            if self.recording:
+                link = self.stats
+                self.log("".join(f"  {line}\n" for line in [f"Link: {link.summary()}"] + link.latency_lines()))
+            return stats
+        except StreamError as e:
+            self.log(f"Job aborted: {e}\n")
+        except Exception as e:
+            self.log(f"Job error: {e}\n")
+        finally:
+            if journal:
+                self.close_journal(journal, stats is not None)
+            self.streamer = None
+            self.dispatch(self.sync_position)
+        return None
+
+    # --- journal and resume ----------------------------------------------
+
+    def open_journal(self, commands, resume=None):
+        # JobJournal for a new or resumed job; None without journal_path or
+        # if the journal cannot be written (the job runs unjournaled)
+        if not self.journal_path:
+            return None
+        from journal import JobJournal
+        journal = JobJournal(self.journal_path)
+        try:
+            if resume:
+                point, skip = resume
+                journal.resume(point, skip)
+            else:
+                journal.begin(commands, self.position[:2])
+        except OSError as e:
+            self.log(f"Job journal disabled: {e}\n")
+            return None
+        return journal
+
+    def close_journal(self, journal, finished):
+        try:
+            journal.close(finished)
+        except OSError as e:
+            self.log(f"Job journal error: {e}\n")
+            return
+        if not finished:
+            self.log(f"Job journal: {journal.offset} commands confirmed, resume with the rest\n")
+
+    def pending_resume(self):
+        # ResumePoint of an unfinished journaled job, or None
+        if not self.journal_path:
+            return None
+        from journal import JournalError, read_journal
+        try:
+            return read_journal(self.journal_path)
+        except (JournalError, OSError) as e:
+            self.log(f"Cannot resume: {e}\n")
+            return None
+
+    def discard_journal(self):
+        if self.journal_path:
+            from journal import remove_journal
+            remove_journal(self.journal_path)
+
+    def resume_job(self, point, rehome=False, window=8, wait=False):
+        # Continues a journaled job at the last acknowledged command: homes
+        # the machine first (rehome) or takes its "!ON0;" position as the
+        # truth, then pen up, travel back and stream the rest
+        if self.emulation:
+            raise SessionError("Resuming needs a connected machine")
+        self._require_connection()
+        if self.streamer:
+            self.log("A job is already running.\n")
+            return None
+        self.log(f"Resuming job: {point.summary()}\n")
+        timeout = None
+        if rehome:
+            self.send_command("IN;")  # the position reply waits until homing has finished
+            timeout = HOME_TIMEOUT
+        if wait:
+            self.wait_position(timeout=timeout)
+            return self.continue_job(point, window, wait=True)
+        self.sync_position(lambda: self._continue_synced(point, window), timeout,
+                           lambda e: self.log("Resume cancelled: no position from the machine. "
+                                              "The job is kept and offered again on the next connect.\n"))
+        return None
+
+    def _continue_synced(self, point, window):
+        # sync_position callback: errors can only be logged here
+        try:
+            self.continue_job(point, window)
+        except SessionError as e:
+            self.log(f"Resume failed: {e}\n")
+
+    def continue_job(self, point, window=8, wait=False):
+        preamble, rest = point.flow(self.position[:2])
+        return self.start_job(preamble + rest, window=window, wait=wait, resume=(point, len(preamble)))
+
+    def stop_job(self):
+        if self.streamer:
+            self.streamer.cancel()
+
+    def on_stream_progress(self, index, cmd):
+        self.dispatch(self.on_command_sent, cmd)
+
+    def on_command_sent(self, cmd):
+        self.sent += 1
+        if self.log_traffic:
+            self.log(f"Sent: {cmd}\n")
+        try:
+            mnemonic, _ = parse_command(cmd)
+        except ValueError:
+            return
+        self.model.apply(cmd)
+        if mnemonic in ("PU", "PD"):
+            self.pen_down = mnemonic == "PD"
+        elif mnemonic not in ("PR", "PA", "IN"):
+            return
+        self.changed()
+
+
+def _timer(delay, func):
+    timer = threading.Timer(delay, func)
+    timer.daemon = True
+    timer.start()
+
+
+# --- command line -------------------------------------------------------
+
+def is_drill_file(path):
+    # Excellon by its suffix; HPGL files are flows unless imported as drill files explicitly
+    return os.path.splitext(path)[1].lower() in DRILL_SUFFIXES
+
+
+def _load_commands(session, args):
+    drills = args.drill or is_drill_file(args.file)
+    if args.file.lower().endswith(".lmd") or drills:
+        if drills:
+            from drill_import import DrillError, read_drills
+            try:
+                job = read_drills(args.file, tolerance=args.merge)
+            except DrillError as e:
+                raise SessionError(f"{args.file}: {e}") from e
+            session.log(f"{job.summary()}\n")
+        else:
+            from lmd import read_lmd
+            job = read_lmd(args.file)
+        try:
+            phase = job.phases[int(args.phase)] if args.phase.isdigit() else job.phase(args.phase)
+        except (IndexError, KeyError):
+            raise SessionError(f"No phase {args.phase!r}; phases: "
+                               + ", ".join(f"{k}={p.title}" for k, p in enumerate(job.phases)))
+        session.log(f"Phase {phase.title}\n")
+        offset = (round(args.origin[0] * 100), round(args.origin[1] * 100))
+        return session.phase_commands(phase, optimize=args.optimize, compile_=args.compile,
+                                      absolute=args.absolute, offset=offset)
+    with open(args.file) as f:
+        commands = split_commands(f.read())
+    if args.compile:
+        commands = session.compile_commands(commands, absolute=args.absolute)
+    return commands
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="protomat", description="Drive an LPKF Protomat without the GUI")
+    parser.add_argument("--port", default=os.environ.get("PROTOMAT_PORT", VIRTUAL_PORT),
+                        help="serial device (default $PROTOMAT_PORT or the virtual machine)")
+    parser.add_argument("--baud", type=int, default=9600)
+    parser.add_argument("--no-rtscts", action="store_true", help="disable RTS/CTS flow control")
+    parser.add_argument("--workspace", type=float, nargs=2, metavar=("X", "Y"), default=(450, 220),
+                        help="workspace limit in mm (default 450 220)")
+    parser.add_argument("--journal", default=DEFAULT_JOURNAL, help=f"job journal (default {DEFAULT_JOURNAL})")
+    parser.add_argument("--no-journal", action="store_true", help="do not journal jobs")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every command and reply")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("connect", help="open the port and check that the machine answers")
+    sub.add_parser("query", help="print the head position")
+    sub.add_parser("home", help="initialize (IN;) and wait until the machine is home")
+    send = sub.add_parser("send", help="stream a flow file (HPGL commands), an LMD phase or a drill file")
+    send.add_argument("file")
+    send.add_argument("--phase", default="0",
+                      help="LMD phase index or title (drill files: one tool per phase, 'Drilling/all tools' for all)")
+    send.add_argument("--optimize", action="store_true", help="reorder LMD paths and drill hits for shorter travel")
+    send.add_argument("--origin", type=float, nargs=2, metavar=("X", "Y"), default=(0, 0),
+                      help="machine position of the board origin in mm (LMD and drill files)")
+    send.add_argument("--drill", action="store_true", help="import the file as drill hits (Excellon or plotter HPGL)")
+    send.add_argument("--merge", type=float, default=2, help="drill hits closer than this (1/100 mm) are merged")
+    send.add_argument("--compile", action="store_true", help="compile the flow into fewer bytes")
+    send.add_argument("--absolute", action="store_true", help="let the compiler use PA moves")
+    send.add_argument("--window", type=int, default=8, help="unacknowledged commands in flight")
+    send.add_argument("--dry-run", action="store_true", help="only print the estimate")
+    send.add_argument("--stats", metavar="FILE", help="record link statistics and save them (.json or .csv)")
+    resume = sub.add_parser("resume", help="continue the journaled job after the last acknowledged command")
+    resume.add_argument("--rehome", action="store_true", help="home the machine (IN;) before travelling back")
+    resume.add_argument("--window", type=int, default=8, help="unacknowledged commands in flight")
+    resume.add_argument("--discard", action="store_true", help="delete the journal instead of resuming")
+    args = parser.parse_args(argv)
+
+    session = ProtomatSession(on_log=sys.stderr.write)  # stdout only carries results
+    session.log_traffic = args.verbose
+    session.journal_path = None if args.no_journal else args.journal
+    session.set_workspace(round(args.workspace[0] * 100), round(args.workspace[1] * 100))
+    try:
+        dry_run = args.command == "send" and args.dry_run
+        if args.command == "resume":
+            point = session.pending_resume()
+            if point is None:
+                print("Nothing to resume")
+                return 0
+            if args.discard:
+                session.discard_journal()
+                print("Journal discarded")
+                return 0
+        if not dry_run:
+            session.connect(args.port, args.baud, rtscts=not args.no_rtscts)
+            session.wait_position(timeout=2.0)
+        if args.command == "send":
+            commands = _load_commands(session, args)  # starts at the head position
+            if not commands:
+                return 1
+            session.log_estimate(commands, args.baud)
+            if dry_run:
+                session.check_flow(commands)  # from X=0 Y=0
+                return 0
+        if args.command in ("connect", "query"):
+            x, y, z = session.position
+            print(f"{x} {y} {z}" if args.command == "query" else f"Machine at X={x} Y={y} Z={z}")
+        elif args.command == "home":
+            session.send_command("IN;")
+            session.wait_position(timeout=HOME_TIMEOUT)  # answered once IN; has finished
+            print("Home")
+        elif args.command == "resume":
+            if not session.resume_job(point, rehome=args.rehome, window=args.window, wait=True):
+                return 1
+            x, y, _ = session.wait_position(timeout=2.0)
+            session.log(f"Machine at X={x} Y={y}\n")
+        else:
+            session.set_recording(bool(args.stats))
+            if not session.start_job(commands, window=args.window, wait=True):
+                return 1
+            if args.stats:
+                session.stats.export(args.stats)
+            x, y, _ = session.wait_position(timeout=2.0)  # also reports drift against the prediction
+            session.log(f"Machine at X={x} Y={y}\n")
+    except JobRejected:
+        return 1  # already logged
+    except (SessionError, OSError, TimeoutError) as e:
+        print(f"protomat: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        session.stop_job()
+        return 130
+    finally:
+        if session.connected:
+            session.disconnect()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
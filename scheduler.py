@@ -0,0 +1,419 @@
+# Job scheduler for several Protomats driven from one process.
+# Every machine is a ProtomatSession with its own serial I/O thread and
+# position model, plus a worker thread that takes jobs from one shared
+# queue. A job goes to an idle machine whose workspace holds it and which
+# has the tool kinds it needs. Among several idle candidates the smallest
+# workspace wins, which keeps the big machines free for big boards. Jobs
+# are drawn relative to the machine origin, so each machine is homed
+# (IN;) before a job.
+# A job whose machine fails (no acks, port lost) is put back at the head of
+# the queue and restarted from the beginning on the next free machine, up
+# to max_attempts times. The failed machine is disconnected and reconnected
+# after retry_delay; after max_attempts failed connects in a row it is
+# given up, together with the queued jobs no other machine can take.
+# A job the session rejects before sending (outside the workspace) fails at
+# once; its machine did nothing wrong and stays connected.
+# A monitor thread cancels jobs on machines whose I/O
+# thread died, instead of waiting for the ack timeout.
+# The GUI thread never receives per-command callbacks: sessions dispatch
+# in place on their own threads, and status() is a cheap snapshot to poll.
+#
+#   python -m scheduler machines.json board.LMD:0 board.LMD:DrillingPlated board.drl job.hpgl
+#
+# machines.json: [{"name": "A", "port": "/dev/ttyUSB0", "workspace": [450, 220],
+#                  "tools": ["mill", "drill"], "baudrate": 9600, "rtscts": true}, ...]
+# (workspace in mm; a machine without "tools" takes any job)
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from protomat import DRILL_SUFFIXES, HOME_TIMEOUT, JobRejected, ProtomatSession, SessionError
+
+OFFLINE, IDLE, BUSY, BROKEN = "offline", "idle", "busy", "broken"
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class SchedulerError(Exception):
+    pass
+
+
+def flow_extents(commands):
+    # (min x, min y, max x, max y) reached from the origin, CI circles included
+    from bounds import head_path
+    x, y, r = head_path(commands)
+    if not len(x):
+        return (0, 0, 0, 0)
+    return (min(0, int((x - r).min())), min(0, int((y - r).min())),
+            max(0, int((x + r).max())), max(0, int((y + r).max())))
+
+
+class Job:
+    def __init__(self, name, commands, tools=()):
+        self.name = name
+        self.commands = commands
+        self.tools = frozenset(tools)  # tool kinds the machine needs, e.g. {"mill"}
+        self.extents = flow_extents(commands)
+        self.state = QUEUED
+        self.attempts = 0
+        self.machine = None  # name of the machine running or last running it
+        self.stats = None  # StreamStats once done
+        self.error = None
+
+    def summary(self):
+        where = f" on {self.machine}" if self.machine else ""
+        return f"{self.name}: {self.state}{where}" + (f" ({self.error})" if self.error else "")
+
+
+class Machine:
+    def __init__(self, name, port, workspace=(45000, 22000), tools=None, baudrate=9600, rtscts=True, on_log=None):
+        self.name = name
+        self.port = port
+        self.tools = None if tools is None else frozenset(tools)  # None: any tool
+        self.baudrate = baudrate
+        self.rtscts = rtscts
+        self.session = ProtomatSession(on_log=(lambda text: on_log(f"[{name}] {text}")) if on_log else None)
+        self.session.log_traffic = False
+        self.session.model.idle_sync = 0  # no timer per command; jobs end with a sync anyway
+        self.session.set_workspace(*workspace)
+        self.state = OFFLINE
+        self.job = None
+        self.jobs_done = 0
+        self.failures = 0
+        self.connect_failures = 0  # failed connects in a row
+        self.busy_s = 0.0  # time spent on jobs
+        self.retry_at = 0.0  # monotonic time of the next connect attempt
+
+    @property
+    def area(self):
+        return self.session.workspace_x * self.session.workspace_y
+
+    def accepts(self, job):
+        x0, y0, x1, y1 = job.extents
+        fits = x0 >= 0 and y0 >= 0 and x1 <= self.session.workspace_x and y1 <= self.session.workspace_y
+        return fits and (self.tools is None or job.tools <= self.tools)
+
+    def connect(self):
+        self.session.connect(self.port, self.baudrate, rtscts=self.rtscts)
+        self.session.wait_position(timeout=2.0)
+
+    def disconnect(self):
+        if self.session.connected:
+            self.session.disconnect()
+
+
+class Scheduler:
+    def __init__(self, machines, window=8, home=True, max_attempts=3, retry_delay=5.0, on_log=None):
+        self.machines = list(machines)
+        self.window = window
+        self.home = home  # home before every job; jobs are drawn from the origin
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.on_log = on_log  # on_log(text), called from any thread
+        self.jobs = []  # every submitted job, in order
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._threads = []
+        self.start_time = None
+
+    def log(self, text):
+        if self.on_log:
+            self.on_log(text)
+
+    # --- jobs ------------------------------------------------------------
+
+    def submit(self, job):
+        # Queues the job; fails it at once if no machine of the pool could take it
+        with self._cond:
+            self.jobs.append(job)
+            if not any(m.state != BROKEN and m.accepts(job) for m in self.machines):
+                self._fail(job, "no machine has the workspace and tools for it")
+                return False
+            self._queue.append(job)
+            self._cond.notify_all()
+        return True
+
+    def _take(self, machine):
+        # Next queued job for machine, unless an idle machine with a smaller
+        # workspace can take it; called with the lock held
+        for job in self._queue:
+            if not machine.accepts(job):
+                continue
+            if any(m is not machine and m.state == IDLE and m.area < machine.area and m.accepts(job)
+                   for m in self.machines):
+                continue
+            self._queue.remove(job)
+            return job
+        return None
+
+    def _fail(self, job, error):
+        job.state = FAILED
+        job.error = error
+        self.log(f"Job {job.summary()}\n")
+
+    def _requeue(self, job, error):
+        with self._cond:
+            job.error = error
+            if job.attempts >= self.max_attempts:
+                job.state = FAILED
+                self.log(f"Job {job.summary()}, giving up after {job.attempts} attempts\n")
+            else:
+                job.state = QUEUED
+                self._queue.appendleft(job)
+                self.log(f"Job {job.name} requeued ({error})\n")
+            self._cond.notify_all()
+
+    # --- threads ---------------------------------------------------------
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        for machine in self.machines:
+            self._threads.append(threading.Thread(target=self._worker, args=(machine,), daemon=True))
+        self._threads.append(threading.Thread(target=self._monitor, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        for machine in self.machines:
+            machine.session.stop_job()
+        for thread in self._threads:
+            thread.join(timeout=15.0)
+        for machine in self.machines:
+            machine.disconnect()
+
+    def wait(self, timeout=None):
+        # True once no job is queued or running
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and not any(m.job for m in self.machines), timeout)
+
+    def _worker(self, machine):
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+                if machine.state == BROKEN:
+                    return
+                if machine.state == OFFLINE:
+                    delay = machine.retry_at - time.monotonic()
+                    if delay > 0:
+                        self._cond.wait(delay)
+                        continue
+                    job = None
+                else:
+                    job = self._take(machine)
+                    if job is None:
+                        self._cond.wait()
+                        continue
+                    job.state = RUNNING
+                    job.machine = machine.name
+                    job.attempts += 1
+                    machine.job = job
+                    machine.state = BUSY
+            if machine.state == OFFLINE:
+                self._connect(machine)
+            else:
+                self._run(machine, job)
+
+    def _connect(self, machine):
+        try:
+            machine.connect()
+        except (SessionError, OSError, TimeoutError, ConnectionError) as e:
+            error = str(e) or type(e).__name__
+            machine.disconnect()
+            machine.retry_at = time.monotonic() + self.retry_delay
+            machine.connect_failures += 1
+            if machine.connect_failures == 1:
+                self.log(f"[{machine.name}] Connect failed: {error}, retrying every {self.retry_delay:g} s\n")
+            if machine.connect_failures >= self.max_attempts:
+                self._give_up(machine)
+            return
+        machine.connect_failures = 0
+        with self._cond:
+            machine.state = IDLE
+            self._cond.notify_all()
+
+    def _give_up(self, machine):
+        with self._cond:
+            machine.state = BROKEN
+            self.log(f"[{machine.name}] Giving up after {machine.connect_failures} failed connects\n")
+            for job in list(self._queue):
+                if not any(m.state != BROKEN and m.accepts(job) for m in self.machines):
+                    self._queue.remove(job)
+                    self._fail(job, "no working machine can take it")
+            self._cond.notify_all()
+
+    def _run(self, machine, job):
+        session = machine.session
+        start = time.perf_counter()
+        error = None
+        rejected = False
+        try:
+            if self.home:
+                session.send_command("IN;")
+                session.wait_position(timeout=HOME_TIMEOUT)  # answered once homing has finished
+            job.stats = session.start_job(job.commands, window=self.window, wait=True)
+            if job.stats is None:
+                error = "job aborted"
+        except JobRejected as e:
+            error, rejected = str(e), True
+        except (SessionError, OSError, TimeoutError, ConnectionError) as e:
+            error = str(e) or type(e).__name__
+        if not error:
+            machine.busy_s += time.perf_counter() - start  # failed attempts are not busy time
+        if rejected:
+            with self._cond:
+                self._fail(job, error)  # the same on every machine that accepts it
+        elif error:
+            machine.failures += 1
+            machine.disconnect()
+            machine.retry_at = time.monotonic() + self.retry_delay
+            self._requeue(job, error)
+        else:
+            job.state = DONE
+            job.error = None
+            machine.jobs_done += 1
+            self.log(f"Job {job.name} done on {machine.name}: {job.stats.summary()}\n")
+        with self._cond:
+            machine.job = None
+            machine.state = OFFLINE if error and not rejected else IDLE
+            self._cond.notify_all()
+
+    def _monitor(self):
+        # A job on a machine whose I/O thread died would wait for the ack timeout
+        while True:
+            with self._cond:
+                if self._cond.wait_for(lambda: self._stop, 0.5):
+                    return
+            for machine in self.machines:
+                io, job = machine.session.serial_io, machine.job
+                if job and machine.session.streamer and io is not None and not io.running:
+                    self.log(f"[{machine.name}] Serial I/O stopped, cancelling {job.name}\n")
+                    machine.session.stop_job()
+
+    # --- status ----------------------------------------------------------
+
+    def status(self):
+        # Snapshot for display; safe to call from any thread
+        elapsed = time.perf_counter() - self.start_time if self.start_time else 0.0
+        sent = sum(m.session.sent for m in self.machines)
+        counts = {state: 0 for state in (QUEUED, RUNNING, DONE, FAILED)}
+        for job in list(self.jobs):
+            counts[job.state] += 1
+        return {
+            "elapsed_s": elapsed,
+            "commands": sent,
+            "commands_per_s": sent / elapsed if elapsed else 0.0,
+            "jobs": counts,
+            "machines": [{"name": m.name, "state": m.state, "job": m.job.name if m.job else None,
+                          "commands": m.session.sent, "jobs_done": m.jobs_done, "failures": m.failures,
+                          "busy": m.busy_s / elapsed if elapsed else 0.0} for m in self.machines],
+        }
+
+    def summary(self):
+        s = self.status()
+        jobs = s["jobs"]
+        machines = ", ".join(f"{m['name']} {m['state']} {m['busy']:.0%}" for m in s["machines"])
+        return (f"{jobs[DONE]} done, {jobs[RUNNING]} running, {jobs[QUEUED]} queued, {jobs[FAILED]} failed; "
+                f"{s['commands']} commands in {s['elapsed_s']:.1f} s ({s['commands_per_s']:.0f} cmd/s); {machines}")
+
+
+# --- command line -------------------------------------------------------
+
+def load_machines(path, on_log=None):
+    with open(path) as f:
+        config = json.load(f)
+    machines = []
+    for k, entry in enumerate(config):
+        try:
+            x, y = entry.get("workspace", (450, 220))
+            machines.append(Machine(entry.get("name", f"M{k + 1}"), entry["port"],
+                                    workspace=(round(x * 100), round(y * 100)), tools=entry.get("tools"),
+                                    baudrate=int(entry.get("baudrate", 9600)), rtscts=entry.get("rtscts", True),
+                                    on_log=on_log))
+        except (KeyError, TypeError, ValueError) as e:
+            raise SchedulerError(f"{path}: machine {k + 1}: {e!r}") from e
+    return machines
+
+
+def load_jobs(spec, optimize=False, tools=()):
+    # "file.hpgl", "board.LMD" (every phase) or "board.LMD:<phase index or title>";
+    # Excellon files ("board.drl", one job per tool) take a phase the same way
+    path, _, phase_key = spec.rpartition(":")
+    if os.path.splitext(path)[1].lower() not in (".lmd",) + DRILL_SUFFIXES:
+        path, phase_key = spec, ""
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix != ".lmd" and suffix not in DRILL_SUFFIXES:
+        from hpgl import split_commands
+        with open(path) as f:
+            return [Job(path, split_commands(f.read()), tools)]
+    from lmd import phase_commands, read_lmd
+    if suffix == ".lmd":
+        job = read_lmd(path)
+    else:
+        from drill_import import DrillError, read_drills
+        try:
+            job = read_drills(path)
+        except DrillError as e:
+            raise SchedulerError(f"{path}: {e}") from e
+    if phase_key:
+        try:
+            phases = [job.phases[int(phase_key)] if phase_key.isdigit() else job.phase(phase_key)]
+        except (IndexError, KeyError):
+            raise SchedulerError(f"{path}: no phase {phase_key!r}")
+    else:
+        phases = job.phases if suffix == ".lmd" else job.phases[:-1]  # drills: not "all tools"
+    jobs = []
+    for phase in phases:
+        if optimize:
+            from travel import optimize_phase
+            phase, _ = optimize_phase(phase)
+        jobs.append(Job(f"{path}:{phase.title}", phase_commands(phase), {tool.kind for tool in phase.tools}))
+    return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="scheduler", description="Run a queue of jobs on several Protomats")
+    parser.add_argument("machines", help="JSON list of machines")
+    parser.add_argument("jobs", nargs="+", help="flow, LMD and Excellon files (FILE.LMD, FILE.LMD:PHASE, FILE.drl[:PHASE])")
+    parser.add_argument("--tool", action="append", default=[], help="tool kind needed by flow files")
+    parser.add_argument("--optimize", action="store_true", help="reorder LMD paths for shorter travel")
+    parser.add_argument("--window", type=int, default=8, help="unacknowledged commands in flight per machine")
+    parser.add_argument("--attempts", type=int, default=3, help="runs of a job before it fails")
+    parser.add_argument("--retry", type=float, default=5.0, help="s before reconnecting a failed machine")
+    parser.add_argument("--no-home", action="store_true", help="do not home the machines before each job")
+    parser.add_argument("--status", type=float, default=5.0, help="s between status lines")
+    args = parser.parse_args(argv)
+
+    try:
+        machines = load_machines(args.machines, on_log=sys.stderr.write)
+        jobs = [job for spec in args.jobs for job in load_jobs(spec, args.optimize, args.tool)]
+    except (SchedulerError, OSError) as e:
+        print(f"scheduler: {e}", file=sys.stderr)
+        return 1
+    scheduler = Scheduler(machines, window=args.window, home=not args.no_home, max_attempts=args.attempts,
+                          retry_delay=args.retry, on_log=sys.stderr.write)
+    for job in jobs:
+        scheduler.submit(job)
+    scheduler.start()
+    try:
+        while not scheduler.wait(args.status):
+            print(scheduler.summary(), file=sys.stderr)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        scheduler.stop()
+    print(scheduler.summary())
+    for job in jobs:
+        print(job.summary())
+    return 0 if all(job.state == DONE for job in jobs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# Serial I/O thread for the Protomat.
+# One thread owns the port: it writes queued commands, reads whatever the
+# machine sends and matches "P<x>,<y>,<z>C" replies to pending position
+# queries. Callers get concurrent.futures.Future objects and never block on
+# the port themselves.
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from framer import ACK, POSITION, Framer
+
+POSITION_QUERY = "!ON0;"
+
+
+class SerialIO:
+    def __init__(self, port, on_data=None, on_position=None, on_ack=None, on_event=None, query_timeout=2.0,
+                 stats=None):
+        self.port = port
+        self.on_data = on_data  # on_data(bytes) for every chunk received
+        self.on_position = on_position  # on_position([x, y, z]) for replies nobody asked for
+        self.on_ack = on_ack  # on_ack(count) for echo mode "C\r" acknowledges
+        self.on_event = on_event  # on_event(Event) for error and echo frames
+        self.query_timeout = query_timeout
+        self.stats = stats  # linkstats.LinkStats or None; may be swapped at any time
+        self._tx = queue.Queue()
+        self._pending = deque()  # (deadline, Future) of outstanding position queries
+        self.framer = Framer()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self._fail_pending(ConnectionError("Serial port closed"))
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def write(self, data):
+        # Queue raw bytes; the Future resolves with the byte count once written
+        if isinstance(data, str):
+            data = data.encode("ascii")
+        fut = Future()
+        self._tx.put((data, fut, False, time.perf_counter() if self.stats is not None else 0.0))
+        return fut
+
+    def query_position(self, timeout=None):
+        # Future resolving to [x, y, z] from the matching !ON0; reply;
+        # timeout (default query_timeout) counts from the write
+        fut = Future()
+        fut.timeout = self.query_timeout if timeout is None else timeout
+        self._tx.put((POSITION_QUERY.encode("ascii"), fut, True,
+                      time.perf_counter() if self.stats is not None else 0.0))
+        return fut
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._flush_tx()
+                # Read straight into the framer buffer; waits up to port.timeout when idle
+                view = self.framer.writable(self.port.in_waiting or 1)
+                n = self.port.readinto(view) or 0
+                stats = self.stats
+                if stats is not None:
+                    stats.poll_cts(self.port)
+                    stats.on_read(n)
+                if n:
+                    if self.on_data:
+                        self.on_data(bytes(view[:n]))
+                    self._dispatch(self.framer.commit(n))
+                self._expire_queries()
+            except Exception as e:
+                self._fail_pending(e)
+                break
+        self._fail_pending(ConnectionError("Serial I/O stopped"))
+
+    def _flush_tx(self):
+        while True:
+            try:
+                data, fut, is_query, queued = self._tx.get_nowait()
+            except queue.Empty:
+                return
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                self.port.write(data)
+            except Exception as e:
+                fut.set_exception(e)
+                raise
+            stats = self.stats
+            if stats is not None:
+                stats.on_write(data, queued, time.perf_counter(), self._tx.qsize(), is_query)
+            if is_query:
+                self._pending.append((time.monotonic() + fut.timeout, fut))
+            else:
+                fut.set_result(len(data))
+
+    def _dispatch(self, events):
+        acks = 0
+        for event in events:
+            if event.kind == ACK:
+                acks += 1
+            elif event.kind == POSITION:
+                # Acks received before a reply are delivered before it, so a
+                # position query works as a barrier (see JobStreamer.enable_echo)
+                self._deliver_acks(acks)
+                acks = 0
+                self._deliver_position(list(event.value))
+            elif self.on_event:
+                self.on_event(event)
+        self._deliver_acks(acks)
+
+    def _deliver_acks(self, acks):
+        if acks:
+            stats = self.stats
+            if stats is not None:
+                stats.on_ack(acks)
+            if self.on_ack:
+                self.on_ack(acks)
+
+    def _deliver_position(self, pos):
+        if self._pending:
+            _, fut = self._pending.popleft()
+            stats = self.stats
+            if stats is not None:
+                stats.on_reply()
+            fut.set_result(pos)
+        elif self.on_position:
+            self.on_position(pos)
+
+    def _expire_queries(self):
+        now = time.monotonic()
+        while self._pending and self._pending[0][0] < now:
+            _, fut = self._pending.popleft()
+            fut.set_exception(TimeoutError("No reply to position query"))
+
+    def _fail_pending(self, exc):
+        while self._pending:
+            _, fut = self._pending.popleft()
+            if not fut.done():
+                fut.set_exception(exc)
+        while True:
+            try:
+                _, fut, _, _ = self._tx.get_nowait()
+            except queue.Empty:
+                return
+            if not fut.done():
+                fut.set_exception(exc)
@@ -0,0 +1,139 @@
+# Windowed job streaming for the Protomat.
+# Echo mode (!CT1;) makes the machine answer every command with "C\r". The
+# streamer keeps up to `window` unacknowledged commands in flight and sends
+# the next one as soon as an ack arrives, so the 9600 baud link stays busy
+# without overrunning the controller's input buffer.
+# Before the first command a position query is sent as a barrier: its
+# "P...C" reply follows the acks still owed for commands sent before the
+# job (e.g. a long jog that is still moving), so counting starts after it.
+# The machine acknowledges a command when it has finished it, so the ack
+# timeout runs from the last ack and is extended by the estimated motion
+# time (kinematics.py) of the oldest unacknowledged command.
+import threading
+import time
+
+import kinematics
+from hpgl import split_commands
+
+ECHO_ON = "!CT1;"
+QUERY_ACKS = 1  # in echo mode the barrier query is acknowledged with "C\r" after its reply
+
+
+class StreamError(Exception):
+    pass
+
+
+class StreamStats:
+    def __init__(self):
+        self.commands = 0
+        self.bytes = 0
+        self.start = None
+        self.end = None
+
+    @property
+    def elapsed(self):
+        if self.start is None:
+            return 0.0
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    @property
+    def commands_per_s(self):
+        return self.commands / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def bytes_per_s(self):
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self):
+        return (f"{self.commands} commands, {self.bytes} bytes in {self.elapsed:.2f} s "
+                f"({self.commands_per_s:.1f} cmd/s, {self.bytes_per_s:.0f} B/s)")
+
+
+class JobStreamer:
+    def __init__(self, write, window=8, ack_timeout=10.0, on_progress=None, on_ack=None, query=None):
+        self.write = write  # callable taking bytes, e.g. serial_port.write
+        self.query = query  # query(timeout) -> Future of the !ON0; reply, e.g. SerialIO.query_position
+        self.window = max(1, int(window))
+        self.ack_timeout = ack_timeout
+        self.on_progress = on_progress  # called as on_progress(index, cmd) after each write
+        self.on_ack = on_ack  # called as on_ack(acked) on the reader thread, acked = job commands confirmed
+        self._cond = threading.Condition()
+        self._acked = 0
+        self._counting = False  # acks count as job commands once echo mode is on
+        self._barrier_error = None
+        self._cancelled = False
+        self._times = []  # estimated motion time per job command
+
+    def ack(self, count=1):
+        # Called by the reader thread for every "C\r" received
+        with self._cond:
+            self._acked += count
+            acked = self._acked if self._counting else 0
+            self._cond.notify_all()
+        if acked and self.on_ack:
+            self.on_ack(acked)
+
+    def cancel(self):
+        with self._cond:
+            self._cancelled = True
+            self._cond.notify_all()
+
+    def _wait_for(self, predicate):
+        # Every ack restarts the timeout
+        with self._cond:
+            while not (self._cancelled or predicate()):
+                acked = self._acked
+                busy = self._times[acked] if self._counting and 0 <= acked < len(self._times) else 0.0
+                limit = self.ack_timeout + busy
+                if not self._cond.wait_for(lambda: self._cancelled or predicate() or self._acked != acked, limit):
+                    raise StreamError(f"No acknowledge within {limit:.1f} s ({self._acked} acked)")
+            if self._cancelled:
+                raise StreamError("Job cancelled")
+
+    def enable_echo(self):
+        # Whether !CT1; acknowledges itself depends on the previous echo state,
+        # and acks of earlier commands may still be on their way. The reply to
+        # a position query comes after all of them; counting starts there, on
+        # the I/O thread, before any ack that follows the reply is delivered.
+        self.write(ECHO_ON.encode("ascii"))
+        if self.query is None:
+            # No way to query: give !CT1; a short chance to answer
+            with self._cond:
+                self._cond.wait_for(lambda: self._acked > 0 or self._cancelled, 0.5)
+                self._acked = 0
+                self._counting = True
+            return
+        self.query(self.ack_timeout).add_done_callback(self._start_counting)
+        self._wait_for(lambda: self._counting or self._barrier_error is not None)
+        if self._barrier_error is not None:
+            raise StreamError(f"No reply to the position query before the job: {self._barrier_error}")
+
+    def _start_counting(self, fut):
+        with self._cond:
+            if fut.exception() is None:
+                self._acked = -QUERY_ACKS
+                self._counting = True
+            else:
+                self._barrier_error = fut.exception()
+            self._cond.notify_all()
+
+    def run(self, commands, start=(0, 0)):
+        # start: head position before the job, for PA and IN times
+        if isinstance(commands, str):
+            commands = split_commands(commands)
+        self._times = kinematics.command_times(commands, start)
+        stats = StreamStats()
+        self.enable_echo()
+        stats.start = time.perf_counter()
+        for i, cmd in enumerate(commands):
+            self._wait_for(lambda: i - self._acked < self.window)
+            data = cmd.encode("ascii")
+            self.write(data)
+            stats.commands += 1
+            stats.bytes += len(data)
+            if self.on_progress:
+                self.on_progress(i, cmd)
+        self._wait_for(lambda: self._acked >= len(commands))
+        stats.end = time.perf_counter()
+        return stats
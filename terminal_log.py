@@ -0,0 +1,94 @@
+# Batched, bounded output for the terminal Text widget.
+# write() may be called from any thread; lines are queued and inserted in
+# one batch per tick from the Tk thread. The widget keeps at most max_lines;
+# older lines are dropped or, if a spill file is set, written to a rotating
+# log file on disk.
+import logging
+import logging.handlers
+from collections import deque
+
+
+class TerminalLog:
+    def __init__(self, widget, max_lines=5000, interval=50):
+        self.widget = widget
+        self.max_lines = max_lines
+        self.interval = interval  # ms between drains
+        self.autoscroll = True
+        self._pending = deque()  # deque.append/popleft are thread-safe
+        self._lines = 0  # lines currently in the widget
+        self._spill = None
+        self._handler = None
+
+    def write(self, text):
+        if not text.endswith("\n"):
+            text += "\n"
+        self._pending.append(text)
+
+    def start(self):
+        self.widget.after(self.interval, self._tick)
+
+    def set_spill_file(self, path, max_bytes=1000000, backups=3):
+        # path=None turns spilling off
+        if self._handler:
+            self._spill.removeHandler(self._handler)
+            self._handler.close()
+            self._handler = None
+        if path:
+            self._spill = logging.getLogger("lpkf.terminal")
+            self._spill.propagate = False
+            self._spill.setLevel(logging.INFO)
+            self._handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                                 encoding="utf-8")
+            self._handler.setFormatter(logging.Formatter("%(message)s"))
+            self._spill.addHandler(self._handler)
+
+    def clear(self):
+        self._pending.clear()
+        self.widget.config(state="normal")
+        self.widget.delete("1.0", "end")
+        self.widget.config(state="disabled")
+        self._lines = 0
+
+    def _tick(self):
+        try:
+            self.flush()
+        finally:
+            self.widget.after(self.interval, self._tick)
+
+    def flush(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._pending.popleft())
+            except IndexError:
+                break
+        if not batch:
+            return
+        text = "".join(batch)
+        lines = text.splitlines(keepends=True)
+        if len(lines) > self.max_lines:
+            # More than fits in the scrollback: only the newest reach the widget;
+            # the widget's lines are older than the batch and are spilled first
+            self._spill_text(self.widget.get("1.0", "end-1c"))
+            self._spill_text("".join(lines[:-self.max_lines]))
+            lines = lines[-self.max_lines:]
+            text = "".join(lines)
+            self.widget.config(state="normal")
+            self.widget.delete("1.0", "end")
+            self._lines = 0
+        else:
+            self.widget.config(state="normal")
+        self.widget.insert("end", text)
+        self._lines += len(lines)
+        excess = self._lines - self.max_lines
+        if excess > 0:
+            self._spill_text(self.widget.get("1.0", f"{excess + 1}.0"))
+            self.widget.delete("1.0", f"{excess + 1}.0")
+            self._lines -= excess
+        self.widget.config(state="disabled")
+        if self.autoscroll:
+            self.widget.see("end")
+
+    def _spill_text(self, text):
+        if self._handler and text:
+            self._spill.info(text.rstrip("\n"))
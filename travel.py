@@ -0,0 +1,282 @@
+# Pen-up travel optimizer for loaded jobs.
+# Reorders the polylines of a phase (and reverses them where allowed) so the
+# air moves between them get short: a grid-indexed nearest-neighbour tour
+# followed by windowed 2-opt (reverse a run of polylines) and Or-opt (move
+# one polyline elsewhere) passes. The improvement passes look at all
+# positions at once with NumPy and apply the best non-overlapping moves.
+# Tool groups are kept: only polylines with the same tool are reordered.
+# Air times use the same trapezoidal model as estimator.py (kinematics.py).
+import math
+import time
+
+import numpy as np
+
+import kinematics
+from estimator import axis_times
+from lmd import Phase
+
+
+class TravelReport:
+    def __init__(self, before, after, before_time=0.0, after_time=0.0):
+        self.before = before  # pen-up travel in machine units
+        self.after = after
+        self.before_time = before_time  # air time in s
+        self.after_time = after_time
+        self.elapsed = 0.0  # optimizer run time in s
+
+    @property
+    def saved(self):
+        return self.before - self.after
+
+    def summary(self):
+        pct = 100 * self.saved / self.before if self.before else 0.0
+        return (f"travel {self.before / 100:.0f} mm -> {self.after / 100:.0f} mm (-{pct:.0f}%), "
+                f"est. {self.before_time:.0f} s -> {self.after_time:.0f} s "
+                f"(optimized in {self.elapsed:.2f} s)")
+
+
+def _air_moves(entries, exits, origin):
+    prev = np.vstack((np.asarray(origin, np.float64)[None, :2], np.asarray(exits[:-1], np.float64)))
+    return (np.asarray(entries, np.float64) - prev).T
+
+
+def travel_distance(entries, exits, origin=(0, 0)):
+    # Length of the air moves origin -> entries[0], exits[0] -> entries[1], ...
+    if not len(entries):
+        return 0.0
+    return float(np.hypot(*_air_moves(entries, exits, origin)).sum())
+
+
+def travel_time(entries, exits, origin=(0, 0), speed=kinematics.RAPID_SPEED):
+    # Seconds for the same air moves as PR moves at axis speed `speed`
+    if not len(entries):
+        return 0.0
+    dx, dy = _air_moves(entries, exits, origin)
+    return float(np.maximum(axis_times(dx, speed), axis_times(dy, speed)).sum())
+
+
+def plan_travel(entries, exits, origin=(0, 0), reversible=True, window=32, time_limit=2.0):
+    # Visiting order and per-item reverse flags for items entered at entries[k]
+    # and left at exits[k]. A reversed item is entered at its exit.
+    entries = np.asarray(entries, np.float64).reshape(-1, 2)
+    exits = np.asarray(exits, np.float64).reshape(-1, 2)
+    n = len(entries)
+    if n == 0:
+        return np.empty(0, np.int64), np.empty(0, bool)
+    deadline = time.perf_counter() + time_limit
+    order, flipped = _nearest_neighbour(entries, exits, origin, reversible)
+    order, flipped = _improve(entries, exits, origin, order, flipped, reversible, window, deadline)
+    return order, flipped
+
+
+def _nearest_neighbour(entries, exits, origin, reversible):
+    n = len(entries)
+    cand = np.vstack((entries, exits)) if reversible else entries  # id k: item k % n, k >= n reversed
+    lo = cand.min(axis=0)
+    span = np.maximum(cand.max(axis=0) - lo, 1.0)
+    cell = max(math.sqrt(span[0] * span[1] / len(cand)) * 2, 1.0)
+    gx = int(span[0] // cell) + 1
+    gy = int(span[1] // cell) + 1
+    ix = ((cand[:, 0] - lo[0]) // cell).astype(np.int64)
+    iy = ((cand[:, 1] - lo[1]) // cell).astype(np.int64)
+    key = ix * gy + iy
+    grid = [[] for _ in range(gx * gy)]
+    for k, c in enumerate(key.tolist()):
+        grid[c].append(k)
+    cx = cand[:, 0].tolist()
+    cy = cand[:, 1].tolist()
+    keys = key.tolist()
+    ex = exits[:, 0].tolist() + entries[:, 0].tolist()  # where we leave after entering at id k
+    ey = exits[:, 1].tolist() + entries[:, 1].tolist()
+
+    order = []
+    flipped = []
+    x, y = float(origin[0]), float(origin[1])
+    for _ in range(n):
+        ox = min(max(int((x - lo[0]) // cell), 0), gx - 1)
+        oy = min(max(int((y - lo[1]) // cell), 0), gy - 1)
+        best, best_d = -1, math.inf
+        r = 0
+        while True:
+            for px in range(ox - r, ox + r + 1):
+                if px < 0 or px >= gx:
+                    continue
+                edge = px == ox - r or px == ox + r
+                for py in (range(oy - r, oy + r + 1) if edge else (oy - r, oy + r)):
+                    if py < 0 or py >= gy:
+                        continue
+                    for k in grid[px * gy + py]:
+                        d = (cx[k] - x) ** 2 + (cy[k] - y) ** 2
+                        if d < best_d:
+                            best, best_d = k, d
+            # Anything in ring r + 1 is at least r * cell away (distance to the cell grid)
+            if best >= 0 and math.sqrt(best_d) <= r * cell:
+                break
+            r += 1
+            if r > gx + gy:
+                break
+        item = best % n
+        order.append(item)
+        flipped.append(best >= n)
+        for k in ((item, item + n) if reversible else (item,)):
+            grid[keys[k]].remove(k)
+        x, y = ex[best], ey[best]
+    return np.array(order, np.int64), np.array(flipped, bool)
+
+
+def _improve(entries, exits, origin, order, flipped, reversible, window, deadline):
+    origin = np.asarray(origin, np.float64)[:2]
+    while time.perf_counter() < deadline:
+        # Position 0 is the fixed start point, position p is tour index p - 1
+        S = np.vstack((origin, np.where(flipped[:, None], exits[order], entries[order])))
+        E = np.vstack((origin, np.where(flipped[:, None], entries[order], exits[order])))
+        moves = _moves(S, E, reversible, window)
+        if not moves or not _apply(moves, order, flipped, deadline):
+            break
+    return order, flipped
+
+
+def _moves(S, E, reversible, window):
+    # Improving moves as (delta, kind, i, j), best first. Uses slices only:
+    # for a window w, position i runs over 1..m-1-w and j = i + w.
+    m = len(S)
+    Sx, Sy = np.append(S[:, 0], 0.0), np.append(S[:, 1], 0.0)  # S[m] is a dummy for "no successor"
+    Ex, Ey = E[:, 0].copy(), E[:, 1].copy()
+    link = np.append(np.hypot(Sx[1:m] - Ex[:-1], Sy[1:m] - Ey[:-1]), 0.0)  # link[p - 1]: E[p - 1] -> S[p]
+    moves = []
+    for w in range(0, min(window, m - 1)):
+        n = m - 1 - w
+        i = np.arange(1, n + 1)
+        pi, pj = slice(1, n + 1), slice(1 + w, n + 1 + w)
+        prev, nxt = slice(0, n), slice(2 + w, n + 2 + w)
+        # Links before i and after j (0 behind the last position)
+        before = link[0:n]
+        after = link[1 + w:n + 1 + w]
+        # 2-opt: reverse positions i..j (w = 0 only flips one polyline)
+        if reversible:
+            d_after = np.hypot(Sx[pi] - Sx[nxt], Sy[pi] - Sy[nxt])
+            d_after[-1] = 0.0
+            delta = np.hypot(Ex[prev] - Ex[pj], Ey[prev] - Ey[pj]) + d_after - before - after
+            _collect(moves, delta, 0, i, i + w)
+        if w == 0:
+            continue
+        # Or-opt: move the polyline at i to just after j, or the one at j to just before i
+        inner_i = link[1:n + 1]  # i -> i + 1
+        inner_j = link[w:n + w]  # j - 1 -> j
+        d_after = np.hypot(Ex[pi] - Sx[nxt], Ey[pi] - Sy[nxt])
+        d_after[-1] = 0.0
+        delta = (np.hypot(Ex[prev] - Sx[2:n + 2], Ey[prev] - Sy[2:n + 2]) - before - inner_i
+                 + np.hypot(Ex[pj] - Sx[pi], Ey[pj] - Sy[pi]) + d_after - after)
+        _collect(moves, delta, 1, i, i + w)
+        bridge = np.hypot(Ex[w:n + w] - Sx[nxt], Ey[w:n + w] - Sy[nxt])
+        bridge[-1] = 0.0
+        delta = (bridge - inner_j - after
+                 + np.hypot(Ex[prev] - Sx[pj], Ey[prev] - Sy[pj]) + np.hypot(Ex[pj] - Sx[pi], Ey[pj] - Sy[pi]) - before)
+        _collect(moves, delta, 2, i, i + w)
+    moves.sort()
+    return moves
+
+
+def _apply(moves, order, flipped, deadline):
+    # Moves touching disjoint position ranges can be applied together; a
+    # move at i..j reads positions i - 1 and j + 1 and changes i..j.
+    m = len(order) + 1
+    changed = np.zeros(m + 1, bool)
+    read = np.zeros(m + 1, bool)
+    applied = 0
+    for delta, kind, i, j in moves:
+        if changed[i - 1:j + 2].any() or read[i:j + 1].any():
+            continue
+        changed[i:j + 1] = True
+        read[i - 1] = read[j + 1] = True
+        a, b = i - 1, j
+        if kind == 0:
+            order[a:b] = order[a:b][::-1].copy()
+            flipped[a:b] = ~flipped[a:b][::-1]
+        else:
+            shift = -1 if kind == 1 else 1
+            order[a:b] = np.roll(order[a:b], shift)
+            flipped[a:b] = np.roll(flipped[a:b], shift)
+        applied += 1
+        if time.perf_counter() >= deadline:
+            break
+    return applied
+
+
+def _collect(moves, delta, kind, i, j, eps=1e-6):
+    better = np.flatnonzero(delta < -eps)
+    moves.extend(zip(delta[better].tolist(), [kind] * len(better), i[better].tolist(), j[better].tolist()))
+
+
+def optimize_phase(phase, start=(0, 0), offset=(0, 0), reversible=True, window=32, time_limit=2.0,
+                   speed=kinematics.RAPID_SPEED):
+    # New Phase with the same geometry in a shorter pen-up order, and a TravelReport.
+    # Order of phase_commands is kept: paths, circles, drills, each grouped by tool.
+    t0 = time.perf_counter()
+    origin = np.asarray(start[:2], np.float64) - np.asarray(offset[:2], np.float64)
+    result = Phase(phase.name, phase.layer, phase.tools)
+    budget = time_limit / 3
+
+    first = phase.starts[:-1]
+    last = phase.starts[1:] - 1
+    groups = [
+        (phase.points[first], phase.points[last], phase.path_tools, reversible),
+        (phase.circles[:, :2], phase.circles[:, :2], phase.circle_tools, True),
+        (phase.drills, phase.drills, phase.drill_tools, True),
+    ]
+    before_entries, before_exits, after_entries, after_exits = [], [], [], []
+    orders = []
+    pos = origin
+    for entries, exits, tools, rev in groups:
+        before_entries.append(entries)
+        before_exits.append(exits)
+        kind_order, kind_flipped = [], []
+        for tool in _tools_in_order(tools):
+            idx = np.flatnonzero(tools == tool)
+            o, f = plan_travel(entries[idx], exits[idx], pos, rev, window, budget / max(len(set(tools.tolist())), 1))
+            kind_order.append(idx[o])
+            kind_flipped.append(f)
+            ent = np.where(f[:, None], exits[idx[o]], entries[idx[o]])
+            ext = np.where(f[:, None], entries[idx[o]], exits[idx[o]])
+            after_entries.append(ent)
+            after_exits.append(ext)
+            if len(ext):
+                pos = ext[-1]
+        orders.append((np.concatenate(kind_order) if kind_order else np.empty(0, np.int64),
+                       np.concatenate(kind_flipped) if kind_flipped else np.empty(0, bool)))
+
+    order, flipped = orders[0]
+    if len(order):
+        lengths = np.diff(phase.starts)[order]
+        first = phase.starts[:-1][order]
+        block = np.repeat(np.arange(len(order)), lengths)
+        p = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        idx = np.where(flipped[block], first[block] + lengths[block] - 1 - p, first[block] + p)
+        result.points = phase.points[idx]
+        result.starts = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        result.path_tools = phase.path_tools[order]
+    order, _ = orders[1]
+    result.circles = phase.circles[order]
+    result.circle_tools = phase.circle_tools[order]
+    order, _ = orders[2]
+    result.drills = phase.drills[order]
+    result.drill_tools = phase.drill_tools[order]
+
+    before_entries, before_exits = np.vstack(before_entries), np.vstack(before_exits)
+    after_entries = np.vstack(after_entries) if after_entries else np.empty((0, 2))
+    after_exits = np.vstack(after_exits) if after_exits else np.empty((0, 2))
+    before = travel_distance(before_entries, before_exits, origin)
+    after = travel_distance(after_entries, after_exits, origin)
+    if after >= before:
+        result, after_entries, after_exits = phase, before_entries, before_exits  # already in a good order
+        after = before
+    report = TravelReport(before, after, travel_time(before_entries, before_exits, origin, speed),
+                          travel_time(after_entries, after_exits, origin, speed))
+    report.elapsed = time.perf_counter() - t0
+    return result, report
+
+
+def _tools_in_order(tools):
+    # Tool numbers in order of first use
+    values, first = np.unique(tools, return_index=True)
+    return values[np.argsort(first)].tolist()
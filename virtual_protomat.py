@@ -0,0 +1,257 @@
+# Headless virtual Protomat on a Linux pseudo-terminal.
+# Opens a pty and behaves like the machine behind a 9600 baud link: bytes
+# reach the machine at line rate, land in a finite input buffer and are
+# executed one command at a time with the timing from kinematics.py.
+# Replies ("C\r" in echo mode, "P<x>,<y>,<z>C" for !ON0, "E<n>\r") go back
+# at line rate as well.
+#
+# RTS/CTS: a pty has no modem lines, so "CTS deasserted" means the machine
+# stops taking bytes off the pty; the host's writes then back up in the
+# kernel buffer exactly like a UART that waits for CTS. Without --no-rtscts
+# the input buffer never overflows; with it, excess bytes are dropped and
+# reported as E2.
+#
+#   python virtual_protomat.py [--link /tmp/ttyProtomat] [--baud 9600] [--buffer 256]
+#
+# then connect the controller to the printed device or the link, which
+# "Refresh" lists next to the real ports.
+import argparse
+import os
+import select
+import sys
+import time
+import tty
+
+import kinematics
+from hpgl import parse_command
+
+DEFAULT_LINK = "/tmp/ttyProtomat"
+FIFO_SIZE = 16  # host UART FIFO: bytes already committed to the wire
+ERR_UNKNOWN = 1
+ERR_OVERRUN = 2
+
+
+class VirtualProtomat:
+    def __init__(self, baudrate=9600, buffer_size=256, rtscts=True, speedup=1.0, verbose=False):
+        self.baudrate = baudrate
+        self.buffer_size = buffer_size
+        self.rtscts = rtscts
+        self.speedup = speedup  # >1 runs motion and line timing faster than real time
+        self.verbose = verbose
+        self.byte_time = kinematics.byte_time(baudrate) / speedup
+        self.high_water = max(1, buffer_size - FIFO_SIZE)
+        self.master = None
+        self.slave = None
+        self.link = None
+        self._running = False
+        self.reset()
+
+    def reset(self):
+        self.position = [0, 0, 0]
+        self.pen_down = False
+        self.echo = False
+        self.motor = False
+        self.speed = 0  # last !TS value
+        self.input = bytearray()  # machine input buffer
+        self.fifo = bytearray()  # bytes on their way over the wire
+        self.tx = bytearray()
+        self.rx_next = 0.0  # time the next fifo byte reaches the buffer
+        self.tx_next = 0.0
+        self.busy_until = 0.0
+        self.pending_reply = b""  # sent when the running command finishes
+        self.cts = True
+        self.stats = {"bytes_in": 0, "bytes_out": 0, "commands": 0, "overruns": 0, "cts_stall_s": 0.0}
+        self._stall_start = None
+        self._overrun = False
+
+    def open(self, link=None):
+        # Create the pty; returns the device path the host should open
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)  # no echo or line editing between host and machine
+        os.set_blocking(self.master, False)
+        path = os.ttyname(self.slave)
+        if link:
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(path, link)
+            self.link = link
+        return path
+
+    def close(self):
+        self._running = False
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                os.close(fd)
+        self.master = self.slave = None
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+        self.link = None
+
+    def stop(self):
+        self._running = False
+
+    def run(self):
+        self._running = True
+        while self._running:
+            now = time.monotonic()
+            self.step(now)
+            wait = 0.001 if self.fifo or self.tx or now < self.busy_until else 0.01
+            select.select([self.master], [], [], wait)
+
+    # --- one scheduling step -------------------------------------------
+
+    def step(self, now):
+        self._receive(now)
+        self._execute(now)
+        self._transmit(now)
+
+    def _receive(self, now):
+        self._update_cts(now)
+        if self.cts and len(self.fifo) < FIFO_SIZE:
+            try:
+                data = os.read(self.master, FIFO_SIZE - len(self.fifo))
+            except (BlockingIOError, OSError):
+                data = b""
+            if data:
+                if not self.fifo:
+                    self.rx_next = now + self.byte_time
+                self.fifo += data
+        # Bytes already on the wire arrive even after CTS drops
+        while self.fifo and now >= self.rx_next:
+            byte = self.fifo[0]
+            del self.fifo[0]
+            self.rx_next += self.byte_time
+            self.stats["bytes_in"] += 1
+            if len(self.input) >= self.buffer_size:
+                self.stats["overruns"] += 1
+                if not self._overrun:
+                    self._overrun = True
+                    self._reply(b"E%d\r" % ERR_OVERRUN)
+                continue
+            self._overrun = False
+            self.input.append(byte)
+        if not self.fifo:
+            self.rx_next = max(self.rx_next, now)
+
+    def _update_cts(self, now):
+        cts = not self.rtscts or len(self.input) < self.high_water
+        if cts != self.cts:
+            if not cts:
+                self._stall_start = now
+            elif self._stall_start is not None:
+                self.stats["cts_stall_s"] += now - self._stall_start
+                self._stall_start = None
+            self.cts = cts
+
+    def _execute(self, now):
+        if now < self.busy_until:
+            return
+        if self.pending_reply:
+            self._reply(self.pending_reply)
+            self.pending_reply = b""
+        end = self.input.find(b";")
+        if end < 0:
+            return
+        cmd = self.input[:end + 1].decode("ascii", errors="replace").strip()
+        del self.input[:end + 1]
+        self.stats["commands"] += 1
+        duration, reply = self.execute(cmd)
+        if self.verbose:
+            print(f"{cmd:<20} {duration * 1000:8.1f} ms  pos {self.position[0]},{self.position[1]}", file=sys.stderr)
+        if self.echo and not cmd.upper().startswith("!CT"):
+            reply += b"C\r"
+        self.busy_until = now + duration / self.speedup
+        self.pending_reply = reply
+        if not duration:
+            self._execute(now)
+
+    def execute(self, cmd):
+        # Apply one command; returns (duration in s, reply bytes)
+        try:
+            mnemonic, args = parse_command(cmd)
+        except ValueError:
+            return 0.0, b"E%d\r" % ERR_UNKNOWN
+        speed = kinematics.speed_for(self.speed)
+        if mnemonic == "IN":
+            x, y = self.position[:2]
+            t = kinematics.move_time(x, y, kinematics.RAPID_SPEED) + kinematics.HOME_TIME
+            self.position = [0, 0, 0]
+            self.pen_down = False
+            self.speed = 0
+            return t, b""
+        if mnemonic == "PR" and args:
+            dx, dy = args[0], args[1] if len(args) > 1 else 0
+            self.position[0] += dx
+            self.position[1] += dy
+            return kinematics.move_time(dx, dy, speed), b""
+        if mnemonic == "PA" and len(args) >= 2:
+            dx, dy = args[0] - self.position[0], args[1] - self.position[1]
+            self.position[0], self.position[1] = args[0], args[1]
+            return kinematics.move_time(dx, dy, speed), b""
+        if mnemonic == "CI" and args:
+            return kinematics.circle_time(args[0], speed), b""
+        if mnemonic in ("PU", "PD"):
+            down = mnemonic == "PD"
+            changed = down != self.pen_down
+            self.pen_down = down
+            return (kinematics.PEN_TIME if changed else 0.0), b""
+        if mnemonic == "!TS" and args:
+            self.speed = args[0]
+            return 0.0, b""
+        if mnemonic == "!CT" and args:
+            self.echo = args[0] == 1
+            return 0.0, b"C\r" if self.echo else b""
+        if mnemonic == "!EM" and args:
+            self.motor = args[0] == 1
+            return 0.0, b""
+        if mnemonic == "!ON":
+            axis = args[0] if args else 0
+            if axis == 0:
+                return 0.0, b"P%d,%d,%dC" % tuple(self.position)
+            if 1 <= axis <= 3:
+                return 0.0, b"P%dC" % self.position[axis - 1]
+        return 0.0, b"E%d\r" % ERR_UNKNOWN
+
+    def _reply(self, data):
+        self.tx += data
+
+    def _transmit(self, now):
+        if not self.tx:
+            self.tx_next = max(self.tx_next, now)
+            return
+        n = 0
+        while n < len(self.tx) and self.tx_next <= now:
+            self.tx_next += self.byte_time
+            n += 1
+        if n:
+            try:
+                written = os.write(self.master, bytes(self.tx[:n]))
+            except (BlockingIOError, OSError):
+                written = 0
+            del self.tx[:written]
+            self.stats["bytes_out"] += written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Virtual LPKF Protomat on a pseudo-terminal")
+    parser.add_argument("--baud", type=int, default=9600)
+    parser.add_argument("--buffer", type=int, default=256, help="machine input buffer in bytes")
+    parser.add_argument("--no-rtscts", action="store_true", help="ignore flow control; overflowing bytes are lost")
+    parser.add_argument("--speedup", type=float, default=1.0, help="run line and motion timing this much faster")
+    parser.add_argument("--link", default=DEFAULT_LINK, help="symlink to the pty ('' for none)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every command")
+    args = parser.parse_args()
+    machine = VirtualProtomat(args.baud, args.buffer, not args.no_rtscts, args.speedup, args.verbose)
+    path = machine.open(args.link)
+    print(f"Virtual Protomat on {path}" + (f" ({args.link})" if args.link else ""), flush=True)
+    try:
+        machine.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"\n{machine.stats}", file=sys.stderr)
+        machine.close()
+
+
+if __name__ == "__main__":
+    main()
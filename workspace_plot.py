@@ -0,0 +1,160 @@
+# Incremental workspace visualization.
+# The workspace rectangle and the marker are created once and only moved or
+# recoloured afterwards. update() just records state; drawing happens at
+# most once per frame. Pen-down moves leave a trail that is decimated to
+# canvas resolution so it stays cheap after 100k+ moves.
+
+MARGIN = 10
+FRAME_MS = 16  # ~60 fps
+
+COLOR_PEN_UP = "#44ff44"
+COLOR_PEN_DOWN = "#ffaa00"
+COLOR_MOTOR = "#ff4444"
+COLOR_TRAIL = "#aa7700"
+
+
+class WorkspacePlot:
+    def __init__(self, canvas, workspace_x, workspace_y, max_trail_items=500, max_trail_points=20000):
+        self.canvas = canvas
+        self.workspace_x = workspace_x
+        self.workspace_y = workspace_y
+        self.max_trail_items = max_trail_items
+        self.max_trail_points = max_trail_points
+        self.position = (0, 0)
+        self.color = COLOR_PEN_UP
+        self.strokes = []  # pen-down polylines in µm, already decimated
+        self._stroke_open = False
+        self._drawn = []  # per stroke: number of points already on the canvas
+        self._trail_items = 0
+        self._compact_at = max_trail_items
+        self._render_from = 0  # earlier strokes are complete and fully drawn
+        self._tolerance = 1  # µm between kept trail points
+        self._scheduled = False
+        w = int(canvas["width"])
+        h = int(canvas["height"])
+        self._w, self._h = w, h
+        canvas.create_rectangle(MARGIN, MARGIN, w - MARGIN, h - MARGIN, outline="#e0e0e0", tags="frame")
+        self._marker = canvas.create_oval(0, 0, 0, 0, fill=self.color, outline=self.color, tags="marker")
+        self._update_tolerance()
+
+    def set_workspace(self, workspace_x, workspace_y):
+        self.workspace_x = workspace_x
+        self.workspace_y = workspace_y
+        self._update_tolerance()
+        self._redraw_trail()
+        self._schedule()
+
+    def update(self, position, pen_down, motor_enabled):
+        x, y = position[0], position[1]
+        self.position = (x, y)
+        if motor_enabled:
+            self.color = COLOR_MOTOR
+        elif pen_down:
+            self.color = COLOR_PEN_DOWN
+        else:
+            self.color = COLOR_PEN_UP
+        if pen_down:
+            self._add_trail_point(x, y)
+        else:
+            self._stroke_open = False
+        self._schedule()
+
+    def clear_trail(self):
+        self.canvas.delete("trail")
+        self.strokes = []
+        self._drawn = []
+        self._trail_items = 0
+        self._compact_at = self.max_trail_items
+        self._render_from = 0
+        self._stroke_open = False
+
+    def _add_trail_point(self, x, y):
+        if not self._stroke_open:
+            self.strokes.append([(x, y)])
+            self._drawn.append(0)
+            self._stroke_open = True
+            return
+        stroke = self.strokes[-1]
+        lx, ly = stroke[-1]
+        if abs(x - lx) < self._tolerance and abs(y - ly) < self._tolerance:
+            return
+        stroke.append((x, y))
+
+    def _update_tolerance(self):
+        # One canvas pixel in µm
+        if self.workspace_x > 0 and self.workspace_y > 0:
+            self._tolerance = max(1, min(self.workspace_x / (self._w - 2 * MARGIN),
+                                         self.workspace_y / (self._h - 2 * MARGIN)))
+
+    def _to_canvas(self, x, y):
+        px = MARGIN + (self._w - 2 * MARGIN) * x / self.workspace_x
+        py = MARGIN + (self._h - 2 * MARGIN) * (1 - y / self.workspace_y)
+        return px, py
+
+    def _schedule(self):
+        if not self._scheduled:
+            self._scheduled = True
+            self.canvas.after(FRAME_MS, self._render)
+
+    def _render(self):
+        self._scheduled = False
+        if self.workspace_x <= 0 or self.workspace_y <= 0:
+            return
+        self._draw_new_trail()
+        px, py = self._to_canvas(*self.position)
+        self.canvas.coords(self._marker, px - 5, py - 5, px + 5, py + 5)
+        self.canvas.itemconfig(self._marker, fill=self.color, outline=self.color)
+        self.canvas.tag_raise(self._marker)
+
+    def _draw_new_trail(self):
+        for i in range(self._render_from, len(self.strokes)):
+            stroke = self.strokes[i]
+            start = self._drawn[i]
+            if len(stroke) == start:
+                continue
+            # Connect to the last point already drawn
+            pts = stroke[max(start - 1, 0):]
+            if len(pts) >= 2:
+                self._create_line(pts)
+            self._drawn[i] = len(stroke)
+        self._render_from = max(len(self.strokes) - 1, 0)
+        if self._trail_items > self._compact_at:
+            self._compact()
+
+    def _create_line(self, pts):
+        flat = []
+        for x, y in pts:
+            flat.extend(self._to_canvas(x, y))
+        self.canvas.create_line(*flat, fill=COLOR_TRAIL, tags="trail")
+        self._trail_items += 1
+
+    def _compact(self):
+        # Too many canvas items: merge each stroke into one line and coarsen
+        # the decimation until the point budget fits again.
+        limit = max(self.workspace_x, self.workspace_y)
+        while sum(len(s) for s in self.strokes) > self.max_trail_points and self._tolerance < limit:
+            self._tolerance *= 2
+            self.strokes = [self._decimate(s, self._tolerance) for s in self.strokes]
+        self._redraw_trail()
+
+    def _redraw_trail(self):
+        self.canvas.delete("trail")
+        self._trail_items = 0
+        for i, stroke in enumerate(self.strokes):
+            if len(stroke) >= 2:
+                self._create_line(stroke)
+            self._drawn[i] = len(stroke)
+        # Many separate strokes cannot be merged; grow the limit to avoid redrawing every frame
+        self._compact_at = max(self.max_trail_items, 2 * self._trail_items)
+        self.canvas.tag_raise(self._marker)
+
+    @staticmethod
+    def _decimate(stroke, tol):
+        kept = [stroke[0]]
+        for x, y in stroke[1:-1]:
+            lx, ly = kept[-1]
+            if abs(x - lx) >= tol or abs(y - ly) >= tol:
+                kept.append((x, y))
+        if len(stroke) > 1:
+            kept.append(stroke[-1])
+        return kept